@@ -0,0 +1,89 @@
+"""
+Import-time benchmark for the backend's cold start.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, reports
+the total import time and the slowest modules, and fails when the total
+exceeds a budget or when a heavy dependency is imported at startup.
+
+Usage (from backend/):
+    python -m benchmarks.bench_import_time --budget-ms 1500
+"""
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse
+import subprocess
+import sys
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Dependencies that must only be imported on first use
+LAZY_MODULES = ("chromadb", "openai", "git", "numpy")
+
+
+def measure(module: str = "main") -> Tuple[int, List[Tuple[str, int, int]]]:
+    """
+    Import `module` in a fresh interpreter under -X importtime.
+
+    Returns:
+        (total microseconds, [(module, self_us, cumulative_us), ...])
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total = next((cum for name, _, cum in rows if name == module), 0)
+    return total, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    totals, rows = [], []
+    for _ in range(args.runs):
+        total, rows = measure(args.module)
+        totals.append(total)
+    best_ms = min(totals) / 1000
+
+    print(f"import {args.module}: best {best_ms:.0f}ms over {args.runs} runs")
+    print("\nSlowest modules by cumulative time (last run):")
+    by_top_level: Dict[str, int] = {}
+    for name, _, cumulative in rows:
+        top_level = name.split(".")[0]
+        by_top_level[top_level] = max(by_top_level.get(top_level, 0), cumulative)
+    for name, cumulative in sorted(by_top_level.items(), key=lambda x: -x[1])[
+        : args.top
+    ]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+    eager = sorted({name.split(".")[0] for name, _, _ in rows} & set(LAZY_MODULES))
+    failures = []
+    if eager:
+        failures.append(f"imported at startup but should be lazy: {', '.join(eager)}")
+    if best_ms > args.budget_ms:
+        failures.append(f"{best_ms:.0f}ms exceeds budget of {args.budget_ms:.0f}ms")
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Recall-vs-size benchmark for embedding dimensions and quantization.
+
+Chunks a source tree, embeds it at each requested dimensionality and
+measures file-level recall@k of a labeled query set for exact float32
+search and for int8/binary quantized search with full-precision rescoring.
+Use it to pick the cheapest EMBEDDING_DIMENSIONS / EMBEDDING_QUANTIZATION /
+EMBEDDING_RESCORE_FACTOR that keeps retrieval quality.
+
+The labeled set is JSONL with {"query": ..., "relevant": [paths relative to
+the source tree]}. The defaults (this backend and its own query set) run
+offline with the hashing provider; pass `--provider openai` to measure the
+production model.
+
+Usage (from backend/):
+    python -m benchmarks.bench_quantization --dimensions 128 256 512
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import argparse
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from services.chunking import chunk_files
+from services.embedding_providers import get_embedding_provider
+from services.preprocessing import load_files
+from services.quantized_index import QuantizedIndex
+from services.repo_handler import scan_repo_files
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_LABELS = Path(__file__).resolve().parent / "data" / "backend_queries.jsonl"
+
+
+def _load_labels(path: Path) -> List[Dict]:
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _recall(
+    ranked_files: List[List[str]], labels: List[Dict], k: int
+) -> Optional[float]:
+    hits = 0
+    for files, label in zip(ranked_files, labels):
+        relevant: Set[str] = set(label["relevant"])
+        top = list(dict.fromkeys(files))[:k]
+        hits += len(relevant.intersection(top)) / len(relevant)
+    return hits / len(labels) if labels else None
+
+
+def _bytes_per_vector(dimensions: int, mode: str) -> float:
+    if mode == "float32":
+        return dimensions * 4
+    if mode == "int8":
+        return dimensions + 4  # codes + per-vector scale
+    return dimensions / 8
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--source", type=Path, default=BACKEND_DIR)
+    parser.add_argument("--labels", type=Path, default=DEFAULT_LABELS)
+    parser.add_argument("--provider", default="hashing")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    source = args.source.resolve()
+    labels = _load_labels(args.labels)
+    chunks = chunk_files(load_files(scan_repo_files(str(source))), "bench")
+    ids = [chunk["id"] for chunk in chunks]
+    file_of = {
+        chunk["id"]: str(Path(chunk["metadata"]["file_path"]).relative_to(source))
+        for chunk in chunks
+    }
+    # Candidate pool per query: enough chunks to cover k distinct files
+    n_search = args.k * 10
+    print(f"{len(chunks)} chunks, {len(labels)} labeled queries, recall@{args.k}")
+
+    for dimensions in args.dimensions:
+        provider = get_embedding_provider(args.provider, args.model, dimensions)
+        vectors = np.asarray(
+            provider.embed([chunk["document"] for chunk in chunks]), dtype=np.float32
+        )
+        queries = provider.embed([label["query"] for label in labels])
+
+        exact = QuantizedIndex(ids, vectors, "int8")
+        rows = [
+            (
+                "float32",
+                "-",
+                [
+                    exact.search(query, n_search, rescore_factor=len(ids))
+                    for query in queries
+                ],
+            )
+        ]
+        for mode in ("int8", "binary"):
+            index = QuantizedIndex(ids, vectors, mode)
+            for factor in args.rescore_factors:
+                rows.append(
+                    (
+                        mode,
+                        str(factor),
+                        [index.search(query, n_search, factor) for query in queries],
+                    )
+                )
+
+        for mode, factor, results in rows:
+            ranked_files = [
+                [file_of[chunk_id] for chunk_id, _ in hits] for hits in results
+            ]
+            recall = _recall(ranked_files, labels, args.k)
+            size = _bytes_per_vector(vectors.shape[1], mode)
+            print(
+                f"dims {vectors.shape[1]:>5}  {mode:<7} rescore x{factor:<3} "
+                f"recall {recall:.3f}  {size:8.1f} B/vector  "
+                f"{size * len(ids) / 1024:9.1f} KiB total"
+            )
+
+
+if __name__ == "__main__":
+    main()
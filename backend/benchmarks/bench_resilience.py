@@ -0,0 +1,117 @@
+"""
+Tail-latency benchmark for deadlines, hedged requests and circuit breakers.
+
+Drives services.resilience against a simulated dependency whose latency is
+mostly fast with a slow tail (`--tail-fraction` of calls take
+`--tail-seconds`), then against an outage where every call hangs until its
+timeout. Prints, per scenario, what callers saw next to what the first
+attempt alone took, so the p99 effect of each mechanism is visible without
+OpenAI or Chroma:
+
+- hedging: p99 with hedged duplicates vs. the first attempts alone
+- deadline: the same calls under a per-call deadline (tail becomes 504s)
+- breaker: an outage, where the open breaker turns waits into fast failures
+
+Usage (from backend/):
+    python -m benchmarks.bench_resilience --calls 500
+"""
+
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import json
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.resilience import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    deadline,
+    get_resilience_metrics,
+    guarded_call,
+    time_remaining,
+)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def at(p: float) -> float:
+        return round(ordered[max(0, int(p / 100 * len(ordered)) - 1)] * 1000, 1)
+
+    return {"p50_ms": at(50), "p95_ms": at(95), "p99_ms": at(99)}
+
+
+def _run(
+    name: str,
+    calls: int,
+    call,
+    hedge: bool,
+    deadline_seconds=None,
+) -> Dict:
+    latencies = []
+    outcomes = {"ok": 0, "deadline_exceeded": 0, "rejected": 0, "error": 0}
+    for _ in range(calls):
+        started = time.monotonic()
+        try:
+            with deadline(deadline_seconds):
+                guarded_call(name, "call", call, hedge=hedge)
+            outcomes["ok"] += 1
+        except DeadlineExceeded:
+            outcomes["deadline_exceeded"] += 1
+        except CircuitOpenError:
+            outcomes["rejected"] += 1
+        except Exception:
+            outcomes["error"] += 1
+        latencies.append(time.monotonic() - started)
+    return {"scenario": name, **_percentiles(latencies), **outcomes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--fast-seconds", type=float, default=0.005)
+    parser.add_argument("--tail-seconds", type=float, default=0.25)
+    parser.add_argument("--tail-fraction", type=float, default=0.03)
+    parser.add_argument("--deadline-seconds", type=float, default=0.05)
+    parser.add_argument("--outage-seconds", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    def slow_tail():
+        slow = rng.random() < args.tail_fraction
+        duration = args.tail_seconds if slow else args.fast_seconds
+        # Like the OpenAI client, give up once the remaining time is spent
+        timeout = time_remaining()
+        if timeout is not None and timeout < duration:
+            time.sleep(timeout)
+            raise TimeoutError("Request timed out")
+        time.sleep(duration)
+
+    def outage():
+        time.sleep(args.outage_seconds)
+        raise ConnectionError("dependency unavailable")
+
+    rows = [
+        _run("baseline", args.calls, slow_tail, hedge=False),
+        _run("hedging", args.calls, slow_tail, hedge=True),
+        _run(
+            "deadline",
+            args.calls,
+            slow_tail,
+            hedge=False,
+            deadline_seconds=args.deadline_seconds,
+        ),
+        _run("breaker", args.calls, outage, hedge=False),
+    ]
+    for row in rows:
+        print(json.dumps(row))
+    print(json.dumps(get_resilience_metrics(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
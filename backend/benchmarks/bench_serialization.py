@@ -0,0 +1,117 @@
+"""
+Serialization and wire-size benchmark for the large JSON responses.
+
+Compares FastAPI's default JSONResponse with ORJSONResponse, and raw vs
+gzip/brotli bytes, for a DocsData payload with a large file tree and for
+query results with full documents vs snippets.
+
+Usage (from backend/):
+    python -m benchmarks.bench_serialization --files 50000 --results 50
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import argparse
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from models.documentation import DocsData, DocumentationMetadata, Section
+from services.file_tree import PathIndex
+from services.retrieval import to_snippet_results
+from utils.compression import brotli, compress
+
+
+def _synthetic_files(n_files: int) -> List[Dict]:
+    rng = random.Random(0)
+    dirs = [f"packages/pkg{i}/src/module{j}" for i in range(50) for j in range(20)]
+    return [
+        {"file_path": f"{rng.choice(dirs)}/file_{i}.ts", "file_name": f"file_{i}.ts"}
+        for i in range(n_files)
+    ]
+
+
+def _docs_payload(n_files: int) -> DocsData:
+    index = PathIndex(_synthetic_files(n_files))
+    return DocsData(
+        sections=[
+            Section(id=i, title=f"Section {i}", content="# Heading\n\n" + "text " * 200)
+            for i in range(1, 11)
+        ],
+        file_tree=index.to_file_nodes(),
+        metadata=DocumentationMetadata(
+            repo_name="bench",
+            language="typescript",
+            file_count=n_files,
+            line_count=n_files * 50,
+            indexed_at="2025-01-01T00:00:00Z",
+        ),
+    )
+
+
+def _query_results(n_results: int) -> List[Dict]:
+    return [
+        {
+            "id": f"bench::src/file_{i}.py::chunk_0",
+            "document": "def function():\n    return 42\n" * 35,
+            "metadata": {"file_path": f"src/file_{i}.py", "language": "python"},
+            "distance": 0.2,
+            "similarity": 0.8,
+        }
+        for i in range(n_results)
+    ]
+
+
+def _time(fn: Callable[[], bytes], repeat: int) -> Tuple[float, bytes]:
+    best, body = float("inf"), b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, body
+
+
+def _report(name: str, content, repeat: int) -> None:
+    encoded = jsonable_encoder(content)
+    default_ms, body = _time(lambda: JSONResponse(encoded).body, repeat)
+    orjson_ms, _ = _time(lambda: ORJSONResponse(encoded).body, repeat)
+    gzip_ms, gzipped = _time(lambda: compress(body, "gzip"), repeat)
+    row = (
+        f"{name:<28} json {default_ms:8.2f}ms  orjson {orjson_ms:8.2f}ms  "
+        f"raw {len(body) / 1024:9.1f}KiB  gzip {len(gzipped) / 1024:8.1f}KiB ({gzip_ms:.1f}ms)"
+    )
+    if brotli is not None:
+        br_ms, brotlied = _time(lambda: compress(body, "br"), repeat)
+        row += f"  br {len(brotlied) / 1024:8.1f}KiB ({br_ms:.1f}ms)"
+    print(row)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--results", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    docs = _docs_payload(args.files)
+    results = _query_results(args.results)
+
+    _report(f"docs ({args.files} files)", docs, args.repeat)
+    _report("docs (no tree)", docs.model_copy(update={"file_tree": []}), args.repeat)
+    _report(f"query ({args.results} full)", {"results": results}, args.repeat)
+    _report(
+        f"query ({args.results} snippets)",
+        {"results": to_snippet_results(results)},
+        args.repeat,
+    )
+    if brotli is None:
+        print("(install `brotli` to include brotli sizes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Offline retrieval-quality evaluation over a grid of indexing parameters.
+
+Indexes a source tree once per combination of chunk size, overlap,
+embedding dimensions and retrieval mode (flat, or hierarchical two-stage),
+through the same pipeline steps as /api/ingest, into an in-process Chroma
+(CHROMA_LOCAL_PATH=:memory:) with a deterministic embedding provider. Each
+labeled query is then run through query_repository at every n_results in
+`--n-results` (the values doc generation uses: 5 for file docs, 8 for ask,
+15 for overview), and per configuration it reports:
+
+- recall@k: share of a query's relevant files among the files of the top-k
+  chunks, averaged over queries (line recall@k likewise for labeled line
+  ranges: a range counts once a returned chunk overlaps it)
+- MRR: mean reciprocal rank of the first chunk from a relevant file
+- context tokens@k: estimated prompt tokens of the top-k chunks
+- tokens embedded and index size (vectors plus stored documents, including
+  the file/directory summary index in hierarchical mode)
+
+The labeled set is JSONL with {"query": ..., "relevant": [paths relative to
+the source tree]} and optionally "lines": {path: [first, last]} for line
+ranges, or "symbols": {path: "Class.method"} naming a Python definition
+whose lines form the range (so labels survive edits elsewhere in the file).
+The defaults (this backend and its own query set) run offline with
+the hashing provider; pass `--provider openai` to measure the production
+model.
+
+Usage (from backend/):
+    python -m benchmarks.eval_retrieval --chunk-sizes 500 1000 2000 \
+        --overlaps 0 200 --output eval.jsonl
+"""
+
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import argparse
+import ast
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("CHROMA_LOCAL_PATH", ":memory:")
+
+from services.chromadb_service import get_repo_registry, index_repository
+from services.chunking import chunk_files
+from services.content_policy import CHARS_PER_TOKEN, apply_content_policy
+from services.embedding_providers import EmbeddingProvider, get_embedding_provider
+from services.hierarchy import build_summary_index
+from services.preprocessing import load_files
+from services.repo_handler import scan_repo_files
+from services.retrieval import query_repository
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_LABELS = Path(__file__).resolve().parent / "data" / "backend_queries.jsonl"
+MODES = ("flat", "hierarchical")
+
+
+class _CountingProvider:
+    """Wraps a provider to count the characters it embeds."""
+
+    def __init__(self, provider: EmbeddingProvider):
+        self.provider = provider
+        self.characters = 0
+        self.vector_size = 0
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.characters += sum(len(text) for text in texts)
+        vectors = self.provider.embed(texts)
+        if vectors:
+            self.vector_size = len(vectors[0])
+        return vectors
+
+
+def _load_labels(path: Path) -> List[Dict]:
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _symbol_lines(source: Path, path: str, symbol: str) -> Tuple[int, int]:
+    """First and last line of a (dotted) function or class definition."""
+    nodes = ast.parse((source / path).read_text()).body
+    node = None
+    for name in symbol.split("."):
+        node = next(
+            (
+                candidate
+                for candidate in nodes
+                if isinstance(
+                    candidate, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+                )
+                and candidate.name == name
+            ),
+            None,
+        )
+        if node is None:
+            raise ValueError(f"No definition {symbol!r} in {path}")
+        nodes = node.body
+    return node.lineno, node.end_lineno
+
+
+def _resolve_symbols(source: Path, labels: List[Dict]) -> List[Dict]:
+    """Turn "symbols" labels into "lines" ranges."""
+    for label in labels:
+        for path, symbol in (label.pop("symbols", None) or {}).items():
+            label.setdefault("lines", {})[path] = _symbol_lines(source, path, symbol)
+    return labels
+
+
+def _summary_index_bytes(repo_name: str, vector_size: int) -> int:
+    """Vectors plus stored documents of the repo's summary index, if built."""
+    summaries = get_repo_registry().get_summary_collection(repo_name)
+    if summaries is None:
+        return 0
+    documents = summaries.get(include=["documents"])["documents"]
+    return len(documents) * vector_size * 4 + sum(
+        len(document.encode()) for document in documents
+    )
+
+
+def _line_spans(docs: List[Dict], chunks: List[Dict]) -> Dict[str, Tuple[int, int]]:
+    """First and last line (1-based) of every chunk in its file."""
+    content = {doc["source"]: doc["content"] for doc in docs}
+    position: Dict[str, int] = {}
+    spans = {}
+    for chunk in chunks:
+        path = chunk["metadata"]["file_path"]
+        text = content[path]
+        # Chunks of a file come in order and only overlap their predecessor
+        start = text.find(chunk["document"], position.get(path, 0))
+        if start == -1:
+            continue
+        position[path] = start + 1
+        first = text.count("\n", 0, start) + 1
+        spans[chunk["id"]] = (first, first + chunk["document"].count("\n"))
+    return spans
+
+
+def _evaluate(
+    repo_name: str,
+    labels: List[Dict],
+    n_results: List[int],
+    hierarchical: bool,
+    spans: Dict[str, Tuple[int, int]],
+) -> Dict:
+    recall = {k: [] for k in n_results}
+    line_recall = {k: [] for k in n_results}
+    context_tokens = {k: [] for k in n_results}
+    reciprocal_ranks = []
+    latencies = []
+    for label in labels:
+        relevant = set(label["relevant"])
+        lines = label.get("lines") or {}
+        for k in n_results:
+            started = time.perf_counter()
+            results = query_repository(
+                repo_name, label["query"], n_results=k, hierarchical=hierarchical
+            )
+            latencies.append(time.perf_counter() - started)
+            files = {result["metadata"]["file_path"] for result in results}
+            recall[k].append(len(relevant & files) / len(relevant))
+            context_tokens[k].append(
+                sum(len(result["document"]) for result in results) // CHARS_PER_TOKEN
+            )
+            if lines:
+                covered = sum(
+                    any(
+                        result["metadata"]["file_path"] == path
+                        and result["id"] in spans
+                        and spans[result["id"]][0] <= last
+                        and spans[result["id"]][1] >= first
+                        for result in results
+                    )
+                    for path, (first, last) in lines.items()
+                )
+                line_recall[k].append(covered / len(lines))
+            if k == max(n_results):
+                rank = next(
+                    (
+                        i
+                        for i, result in enumerate(results, 1)
+                        if result["metadata"]["file_path"] in relevant
+                    ),
+                    None,
+                )
+                reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    def mean(values: List[float]) -> Optional[float]:
+        return round(statistics.fmean(values), 4) if values else None
+
+    return {
+        **{f"recall@{k}": mean(recall[k]) for k in n_results},
+        **{f"line_recall@{k}": mean(line_recall[k]) for k in n_results},
+        "mrr": mean(reciprocal_ranks),
+        **{f"context_tokens@{k}": mean(context_tokens[k]) for k in n_results},
+        "query_p50_ms": round(statistics.median(latencies) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--source", type=Path, default=BACKEND_DIR)
+    parser.add_argument("--labels", type=Path, default=DEFAULT_LABELS)
+    parser.add_argument("--provider", default="hashing")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[256])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 100, 200])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["flat"])
+    parser.add_argument("--n-results", type=int, nargs="+", default=[5, 8, 15])
+    parser.add_argument("--output", type=Path, help="Also write rows as JSONL")
+    args = parser.parse_args()
+
+    source = args.source.resolve()
+    labels = _resolve_symbols(source, _load_labels(args.labels))
+    n_results = sorted(set(args.n_results))
+    docs, _ = apply_content_policy(
+        load_files(scan_repo_files(str(source)), str(source)), str(source)
+    )
+    print(f"{len(docs)} files, {len(labels)} labeled queries")
+
+    rows = []
+    grid = product(args.dimensions, args.chunk_sizes, args.overlaps, args.modes)
+    for i, (dimensions, chunk_size, overlap, mode) in enumerate(grid):
+        if overlap >= chunk_size:
+            continue
+        repo_name = f"eval-{i}"
+        chunks = chunk_files(docs, repo_name, chunk_size=chunk_size, overlap=overlap)
+        provider = _CountingProvider(
+            get_embedding_provider(args.provider, args.model, dimensions)
+        )
+        started = time.perf_counter()
+        result = index_repository(repo_name, chunks, provider=provider)
+        if mode == "hierarchical":
+            build_summary_index(repo_name, docs, provider, result["index_run"])
+        index_seconds = time.perf_counter() - started
+
+        document_bytes = sum(len(chunk["document"].encode()) for chunk in chunks)
+        summary_bytes = _summary_index_bytes(repo_name, provider.vector_size)
+        row = {
+            "provider": provider.name,
+            "model": provider.model,
+            "dimensions": provider.vector_size,
+            "chunk_size": chunk_size,
+            "overlap": overlap,
+            "mode": mode,
+            "chunks": len(chunks),
+            "tokens_embedded": provider.characters // CHARS_PER_TOKEN,
+            "index_kib": round(
+                (
+                    len(chunks) * provider.vector_size * 4
+                    + document_bytes
+                    + summary_bytes
+                )
+                / 1024,
+                1,
+            ),
+            "index_seconds": round(index_seconds, 2),
+            **_evaluate(
+                repo_name,
+                labels,
+                n_results,
+                mode == "hierarchical",
+                _line_spans(docs, chunks),
+            ),
+        }
+        get_repo_registry().delete_repo(repo_name)
+        rows.append(row)
+        print(json.dumps(row))
+
+    if args.output:
+        with args.output.open("w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the OpenAI API, for load tests.
+
+Serves /v1/embeddings (deterministic feature-hashing vectors, so retrieval
+still behaves sensibly) and /v1/chat/completions (canned answers, valid JSON
+in JSON mode, optional SSE streaming) with configurable latency:
+
+    FAKE_OPENAI_EMBEDDING_LATENCY_SECONDS  per embeddings request (default 0.05)
+    FAKE_OPENAI_CHAT_LATENCY_SECONDS       time to first token (default 0.5)
+    FAKE_OPENAI_TOKENS_PER_SECOND          generation speed (default 200)
+    FAKE_OPENAI_JITTER                     +/- fraction applied to every delay (default 0.2)
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1:
+
+    uvicorn benchmarks.fake_openai:app --port 8100
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from services.embedding_providers import HashingEmbeddingProvider
+
+DEFAULT_DIMENSIONS = 1536
+# Characters per generated token
+CHARS_PER_TOKEN = 4
+
+EMBEDDING_LATENCY = float(os.getenv("FAKE_OPENAI_EMBEDDING_LATENCY_SECONDS", "0.05"))
+CHAT_LATENCY = float(os.getenv("FAKE_OPENAI_CHAT_LATENCY_SECONDS", "0.5"))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_OPENAI_TOKENS_PER_SECOND", "200"))
+JITTER = float(os.getenv("FAKE_OPENAI_JITTER", "0.2"))
+
+app = FastAPI(title="Fake OpenAI")
+
+
+def _delay(seconds: float) -> float:
+    return max(0.0, seconds * (1 + random.uniform(-JITTER, JITTER)))
+
+
+def _answer(body: Dict[str, Any]) -> str:
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps(
+            {
+                "sections": [
+                    {
+                        "id": i,
+                        "title": f"Section {i}",
+                        "content": f"# Section {i}\n\nText.",
+                    }
+                    for i in range(1, 11)
+                ]
+            }
+        )
+    prompt = body["messages"][-1]["content"]
+    words = min(body.get("max_tokens") or 200, 200)
+    return " ".join(["lorem"] * words) + f" ({len(prompt)} prompt chars)"
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    texts: List[str] = body["input"]
+    if isinstance(texts, str):
+        texts = [texts]
+    dimensions = body.get("dimensions") or DEFAULT_DIMENSIONS
+    await asyncio.sleep(_delay(EMBEDDING_LATENCY))
+    vectors = HashingEmbeddingProvider(dimensions).embed(texts)
+    if body.get("encoding_format") == "base64":
+        vectors = [
+            base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode()
+            for vector in vectors
+        ]
+    tokens = sum(len(text) for text in texts) // CHARS_PER_TOKEN
+    return {
+        "object": "list",
+        "model": body["model"],
+        "data": [
+            {"object": "embedding", "index": i, "embedding": vector}
+            for i, vector in enumerate(vectors)
+        ],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    content = _answer(body)
+    generation_seconds = len(content) / CHARS_PER_TOKEN / TOKENS_PER_SECOND
+    prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // CHARS_PER_TOKEN
+    completion_tokens = len(content) // CHARS_PER_TOKEN
+    common = {
+        "id": "chatcmpl-fake",
+        "created": int(time.time()),
+        "model": body["model"],
+    }
+    await asyncio.sleep(_delay(CHAT_LATENCY))
+
+    if body.get("stream"):
+
+        async def events():
+            pieces = [content[i : i + 64] for i in range(0, len(content), 64)]
+            for piece in pieces:
+                await asyncio.sleep(_delay(generation_seconds / len(pieces)))
+                chunk = {
+                    **common,
+                    "object": "chat.completion.chunk",
+                    "choices": [
+                        {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+                    ],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {
+                **common,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(_delay(generation_seconds))
+    return {
+        **common,
+        "object": "chat.completion",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
@@ -0,0 +1,287 @@
+"""
+HTTP load test for one backend worker against local stand-ins.
+
+Boots `uvicorn main:app` (one worker) with OpenAI replaced by
+benchmarks.fake_openai and Chroma running in-process
+(CHROMA_LOCAL_PATH=:memory:), ingests a repo, then drives an open-loop mix
+of /ask, /query, overview /docs and file /docs requests at each target rate
+in `--rps`. Arrivals do not wait for responses, so an overloaded worker
+shows up as growing latency and errors rather than a politely lower rate.
+
+Per rate step and endpoint it reports requests sent, completed, error rate,
+achieved throughput and latency percentiles, plus the worker's event-loop
+lag (GET /api/metrics/event-loop) over the step. Use `--target` to load an
+already running backend instead.
+
+Usage (from backend/):
+    python -m benchmarks.load_test --rps 2 5 10 20 --duration 30 \
+        --mix ask=1 query=4 docs=0.2 file_docs=0.5 --chat-latency 0.8
+"""
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_QUESTIONS = Path(__file__).resolve().parent / "data" / "backend_queries.jsonl"
+ENDPOINTS = ("ask", "query", "docs", "file_docs")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(samples: List[float], percentile: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+    return round(ordered[rank] * 1000, 1)
+
+
+@contextmanager
+def _server(app: str, port: int, env: Dict[str, str]) -> Iterator[str]:
+    """Run `uvicorn app` on `port` until the block exits."""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            app,
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError(f"{app} exited with status {process.returncode}")
+            try:
+                httpx.get(url + "/", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError(f"{app} did not start on port {port}")
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _parse_mix(values: List[str]) -> Dict[str, float]:
+    mix = {}
+    for value in values:
+        name, _, weight = value.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        repo_name: str,
+        questions: List[str],
+        files: List[str],
+        unique: bool,
+    ):
+        self.client = client
+        self.repo_name = repo_name
+        self.questions = questions
+        self.files = files
+        self.unique = unique
+        self.sequence = 0
+
+    def _question(self) -> str:
+        self.sequence += 1
+        question = random.choice(self.questions)
+        # Identical concurrent requests are coalesced; unique ones each do the work
+        return f"{question} ({self.sequence})" if self.unique else question
+
+    def _request(self, endpoint: str):
+        repo = self.repo_name
+        if endpoint == "ask":
+            return "POST", f"/api/repos/{repo}/ask", {"question": self._question()}
+        if endpoint == "query":
+            return "POST", f"/api/repos/{repo}/query", {"question": self._question()}
+        if endpoint == "docs":
+            return "GET", f"/api/repos/{repo}/docs", {"include_tree": False}
+        path = random.choice(self.files)
+        return "GET", f"/api/repos/{repo}/files/{path}/docs", {"mode": "sample"}
+
+    async def _send(self, endpoint: str, results: Dict[str, List]) -> None:
+        method, path, params = self._request(endpoint)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, params=params)
+            outcome = str(response.status_code)
+        except httpx.TimeoutException:
+            outcome = "timeout"
+        except httpx.TransportError as e:
+            outcome = type(e).__name__
+        results[endpoint].append((outcome, time.perf_counter() - started))
+
+    async def run_step(
+        self, rps: float, duration: float, mix: Dict[str, float], poisson: bool
+    ) -> Dict:
+        await self.client.get("/api/metrics/event-loop", params={"reset": True})
+        results: Dict[str, List] = defaultdict(list)
+        names, weights = list(mix), list(mix.values())
+        tasks = []
+        started = time.perf_counter()
+        next_arrival = started
+        while next_arrival < started + duration:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            endpoint = random.choices(names, weights)[0]
+            tasks.append(asyncio.ensure_future(self._send(endpoint, results)))
+            next_arrival += random.expovariate(rps) if poisson else 1 / rps
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        loop_lag = (await self.client.get("/api/metrics/event-loop")).json()
+
+        rows = []
+        for endpoint in names:
+            outcomes = results[endpoint]
+            ok = [latency for outcome, latency in outcomes if outcome == "200"]
+            errors = Counter(outcome for outcome, _ in outcomes if outcome != "200")
+            rows.append(
+                {
+                    "endpoint": endpoint,
+                    "sent": len(outcomes),
+                    "ok": len(ok),
+                    "error_rate": (
+                        round(sum(errors.values()) / len(outcomes), 4)
+                        if outcomes
+                        else None
+                    ),
+                    "errors": dict(errors),
+                    "throughput_rps": round(len(ok) / elapsed, 2),
+                    "p50_ms": _percentile(ok, 50),
+                    "p95_ms": _percentile(ok, 95),
+                    "p99_ms": _percentile(ok, 99),
+                }
+            )
+        return {
+            "target_rps": rps,
+            "achieved_rps": round(sum(row["ok"] for row in rows) / elapsed, 2),
+            "elapsed_seconds": round(elapsed, 1),
+            "loop_lag": loop_lag,
+            "endpoints": rows,
+        }
+
+
+async def _run(args: argparse.Namespace, url: str) -> List[Dict]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(
+        base_url=url, timeout=args.timeout, limits=limits
+    ) as client:
+        repo_name = args.repo_url.rstrip("/").split("/")[-1].replace(".git", "")
+        if not args.skip_ingest:
+            print(f"Ingesting {args.repo_url}...")
+            response = await client.post(
+                "/api/ingest", params={"repo_url": args.repo_url}, timeout=None
+            )
+            response.raise_for_status()
+        listing = (await client.get(f"/api/repos/{repo_name}/files")).json()
+        files = [entry["file_path"] for entry in listing["files"]]
+        with args.questions.open() as f:
+            questions = [json.loads(line)["query"] for line in f if line.strip()]
+
+        test = LoadTest(client, repo_name, questions, files, not args.allow_coalescing)
+        steps = []
+        for rps in args.rps:
+            step = await test.run_step(rps, args.duration, args.mix, args.poisson)
+            print(json.dumps(step))
+            steps.append(step)
+        return steps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rps", type=float, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per step")
+    parser.add_argument(
+        "--mix",
+        nargs="+",
+        default=["ask=1", "query=4", "docs=0.2", "file_docs=0.5"],
+        help="endpoint=weight for endpoints in " + ", ".join(ENDPOINTS),
+    )
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--repo-url", default=str(BACKEND_DIR.parent), help="Repo to ingest"
+    )
+    parser.add_argument("--skip-ingest", action="store_true")
+    parser.add_argument("--questions", type=Path, default=DEFAULT_QUESTIONS)
+    parser.add_argument(
+        "--allow-coalescing",
+        action="store_true",
+        help="Reuse questions verbatim, so concurrent duplicates share one computation",
+    )
+    parser.add_argument("--target", help="Load this running backend instead")
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument(
+        "--app-env", nargs="*", default=[], help="KEY=VALUE settings for the backend"
+    )
+    parser.add_argument("--output", type=Path, help="Also write steps as JSONL")
+    args = parser.parse_args()
+    args.mix = _parse_mix(args.mix)
+
+    if args.target:
+        steps = asyncio.run(_run(args, args.target))
+    else:
+        fake_env = {
+            "FAKE_OPENAI_EMBEDDING_LATENCY_SECONDS": str(args.embedding_latency),
+            "FAKE_OPENAI_CHAT_LATENCY_SECONDS": str(args.chat_latency),
+            "FAKE_OPENAI_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        }
+        with tempfile.TemporaryDirectory() as data_dir, _server(
+            "benchmarks.fake_openai:app", _free_port(), fake_env
+        ) as openai_url:
+            app_env = {
+                "OPENAI_BASE_URL": openai_url + "/v1",
+                "OPENAI_API_KEY": "fake",
+                "CHROMA_LOCAL_PATH": ":memory:",
+                "EMBEDDING_PROVIDER": "openai",
+                "SLASHDOCS_DATA_DIR": data_dir,
+                **dict(value.split("=", 1) for value in args.app_env),
+            }
+            with _server("main:app", _free_port(), app_env) as url:
+                steps = asyncio.run(_run(args, url))
+
+    if args.output:
+        with args.output.open("w") as f:
+            f.writelines(json.dumps(step) + "\n" for step in steps)
+
+
+if __name__ == "__main__":
+    main()
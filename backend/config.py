@@ -1,7 +1,12 @@
 from dataclasses import dataclass
 from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 
 class MissingConfigError(KeyError):
     """Raised when an expected environment variable is absent."""
@@ -14,11 +19,135 @@ class ChromaSettings:
     database: str
 
 
+@dataclass(frozen=True)
+class LocalChromaSettings:
+    path: Optional[str]
+
+
+@dataclass(frozen=True)
+class ChromaPoolSettings:
+    max_workers: int
+    max_connections: int
+    keepalive_seconds: int
+    timeout_seconds: float
+    collection_ttl_seconds: float
+
+
 @dataclass(frozen=True)
 class OpenAISettings:
     api_key: str
 
 
+@dataclass(frozen=True)
+class EmbeddingSettings:
+    provider: str
+    model: Optional[str]
+    dimensions: Optional[int]
+    local_workers: int
+    local_batch_size: int
+    quantization: str
+    rescore_factor: int
+
+
+@dataclass(frozen=True)
+class ContentPolicySettings:
+    enabled: bool
+    max_file_bytes: int
+    max_avg_line_length: int
+    max_entropy: float
+    extra_skip_patterns: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class DedupSettings:
+    enabled: bool
+    threshold: float
+
+
+@dataclass(frozen=True)
+class IngestSettings:
+    commit_batch_chunks: int
+    resume_on_startup: bool
+    stale_job_seconds: float
+
+
+@dataclass(frozen=True)
+class IngestQueueSettings:
+    backend: str
+    redis_url: str
+    lease_seconds: float
+    max_attempts: int
+    retry_backoff_seconds: float
+    poll_seconds: float
+    in_process_workers: int
+
+
+@dataclass(frozen=True)
+class HierarchySettings:
+    enabled: bool
+    candidate_files: int
+    candidate_directories: int
+
+
+@dataclass(frozen=True)
+class MigrationSettings:
+    batch_chunks: int
+    max_chunks_per_second: float
+    retain_seconds: float
+
+
+@dataclass(frozen=True)
+class WebhookSettings:
+    secret: Optional[str]
+    debounce_seconds: float
+    max_delay_seconds: float
+    max_concurrent_reindexes: int
+
+
+@dataclass(frozen=True)
+class ResilienceSettings:
+    ask_deadline_seconds: float
+    docs_deadline_seconds: float
+    query_deadline_seconds: float
+    openai_timeout_seconds: float
+    breaker_failure_threshold: int
+    breaker_reset_seconds: float
+    hedging_enabled: bool
+    hedge_percentile: float
+    hedge_min_samples: int
+    hedge_max_workers: int
+
+
+@dataclass(frozen=True)
+class LoopMonitorSettings:
+    interval_seconds: float
+
+
+@dataclass(frozen=True)
+class ProfilingSettings:
+    admin_token: Optional[str]
+    sample_interval_seconds: float
+    slow_request_seconds: float
+    buffer_seconds: float
+    retention_count: int
+    retention_seconds: float
+
+
+@dataclass(frozen=True)
+class CompressionSettings:
+    minimum_size: int
+
+
+@dataclass(frozen=True)
+class WarmupSettings:
+    repos: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class StorageSettings:
+    data_dir: Path
+
+
 def _require_env(name: str) -> str:
     value = os.getenv(name)
     if not value:
@@ -36,9 +165,311 @@ def get_chroma_settings() -> ChromaSettings:
     )
 
 
+@lru_cache(maxsize=1)
+def get_local_chroma_settings() -> LocalChromaSettings:
+    """Return the in-process Chroma location, if Chroma Cloud is not used.
+
+    CHROMA_LOCAL_PATH runs Chroma in-process instead: a directory for a
+    persistent index, or ":memory:" for an ephemeral one (evaluation runs,
+    load tests). Unset (the default) uses Chroma Cloud.
+    """
+    return LocalChromaSettings(path=os.getenv("CHROMA_LOCAL_PATH") or None)
+
+
+def _number_env(name: str, default, cast=int):
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError as e:
+        raise MissingConfigError(f"Invalid value for {name}: {value!r}") from e
+
+
+@lru_cache(maxsize=1)
+def get_chroma_pool_settings() -> ChromaPoolSettings:
+    """Return concurrency, connection pool and timeout limits for Chroma calls."""
+    return ChromaPoolSettings(
+        max_workers=_number_env("CHROMA_MAX_WORKERS", 16),
+        max_connections=_number_env("CHROMA_MAX_CONNECTIONS", 32),
+        keepalive_seconds=_number_env("CHROMA_KEEPALIVE_SECONDS", 40),
+        timeout_seconds=_number_env("CHROMA_TIMEOUT_SECONDS", 30.0, float),
+        collection_ttl_seconds=_number_env(
+            "CHROMA_COLLECTION_TTL_SECONDS", 600.0, float
+        ),
+    )
+
+
 @lru_cache(maxsize=1)
 def get_openai_settings() -> OpenAISettings:
     """Return validated configuration for the OpenAI client."""
     return OpenAISettings(
         api_key=_require_env("OPENAI_API_KEY"),
     )
+
+
+@lru_cache(maxsize=1)
+def get_storage_settings() -> StorageSettings:
+    """Return the location of the backend's local durable state (caches, stores)."""
+    default_dir = Path(__file__).resolve().parent / ".slashdocs"
+    return StorageSettings(
+        data_dir=Path(os.getenv("SLASHDOCS_DATA_DIR") or default_dir),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_compression_settings() -> CompressionSettings:
+    """Return the smallest response body (COMPRESSION_MINIMUM_SIZE bytes) that is compressed."""
+    return CompressionSettings(
+        minimum_size=_number_env("COMPRESSION_MINIMUM_SIZE", 1024),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_warmup_settings() -> WarmupSettings:
+    """Return the repos to preload at startup (WARMUP_REPOS, comma-separated; "*" = all)."""
+    repos = os.getenv("WARMUP_REPOS", "")
+    return WarmupSettings(
+        repos=tuple(repo.strip() for repo in repos.split(",") if repo.strip()),
+    )
+
+
+EMBEDDING_QUANTIZATION_MODES = ("none", "int8", "binary")
+
+
+@lru_cache(maxsize=1)
+def get_embedding_settings() -> EmbeddingSettings:
+    """Return the embedding provider used for new indexes.
+
+    EMBEDDING_PROVIDER is "openai" (default), "local" (EMBEDDING_MODEL is the
+    path of a locally supplied sentence-transformers model) or "hashing"
+    (deterministic, offline; for tests and benchmarks).
+
+    EMBEDDING_DIMENSIONS shortens new vectors (unset = the model's native
+    size). EMBEDDING_QUANTIZATION ("none", "int8" or "binary") serves
+    unfiltered queries from a quantized local index, rescoring the best
+    `n_results * EMBEDDING_RESCORE_FACTOR` candidates at full precision.
+    """
+    quantization = (os.getenv("EMBEDDING_QUANTIZATION") or "none").lower()
+    if quantization not in EMBEDDING_QUANTIZATION_MODES:
+        logger.warning(
+            f"Unknown EMBEDDING_QUANTIZATION {quantization!r}; expected one of "
+            f"{', '.join(EMBEDDING_QUANTIZATION_MODES)}. Serving full-precision queries."
+        )
+        quantization = "none"
+    return EmbeddingSettings(
+        provider=os.getenv("EMBEDDING_PROVIDER", "openai"),
+        model=os.getenv("EMBEDDING_MODEL") or None,
+        dimensions=_number_env("EMBEDDING_DIMENSIONS", None),
+        local_workers=_number_env("EMBEDDING_LOCAL_WORKERS", 2),
+        local_batch_size=_number_env("EMBEDDING_LOCAL_BATCH_SIZE", 64),
+        quantization=quantization,
+        rescore_factor=_number_env("EMBEDDING_RESCORE_FACTOR", 4),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_content_policy_settings() -> ContentPolicySettings:
+    """Return the rules that keep lockfiles, generated and minified files out of the index.
+
+    CONTENT_POLICY_SKIP_PATTERNS adds comma-separated glob patterns to the
+    built-in ones; CONTENT_POLICY_ENABLED=false indexes every file.
+    """
+    patterns = os.getenv("CONTENT_POLICY_SKIP_PATTERNS", "")
+    return ContentPolicySettings(
+        enabled=os.getenv("CONTENT_POLICY_ENABLED", "true").lower() != "false",
+        max_file_bytes=_number_env("CONTENT_POLICY_MAX_FILE_BYTES", 512 * 1024),
+        max_avg_line_length=_number_env("CONTENT_POLICY_MAX_AVG_LINE_LENGTH", 200),
+        max_entropy=_number_env("CONTENT_POLICY_MAX_ENTROPY", 5.5, cast=float),
+        extra_skip_patterns=tuple(
+            pattern.strip() for pattern in patterns.split(",") if pattern.strip()
+        ),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_dedup_settings() -> DedupSettings:
+    """Return near-duplicate chunk grouping settings.
+
+    Chunks whose estimated Jaccard similarity reaches DEDUP_THRESHOLD share
+    one embedding and are collapsed to one hit at query time.
+    """
+    return DedupSettings(
+        enabled=os.getenv("DEDUP_ENABLED", "true").lower() != "false",
+        threshold=_number_env("DEDUP_THRESHOLD", 0.9, cast=float),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_ingest_settings() -> IngestSettings:
+    """Return ingest settings.
+
+    Chunks are embedded and committed INGEST_COMMIT_BATCH_CHUNKS at a time,
+    so a repo becomes searchable progressively while it is being indexed.
+    Each batch is checkpointed; at startup, jobs whose process has not
+    reported for INGEST_STALE_JOB_SECONDS are resumed (INGEST_RESUME_ON_STARTUP=false
+    leaves them for a manual retry, which also resumes). Running jobs report
+    every quarter of that interval, through clones and embedding alike.
+    """
+    return IngestSettings(
+        commit_batch_chunks=_number_env("INGEST_COMMIT_BATCH_CHUNKS", 200),
+        resume_on_startup=os.getenv("INGEST_RESUME_ON_STARTUP", "true").lower()
+        != "false",
+        stale_job_seconds=_number_env("INGEST_STALE_JOB_SECONDS", 60.0, cast=float),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_ingest_queue_settings() -> IngestQueueSettings:
+    """Return distributed ingest settings.
+
+    INGEST_QUEUE is "inline" (default: the API process runs the whole
+    ingest), or the durable queue that ingest stages are handed to for
+    worker processes (`python ingest_worker.py`): "sqlite"
+    (`<data_dir>/ingest_queue.db`, shared by processes on one host), "redis"
+    (INGEST_QUEUE_REDIS_URL, shared across hosts; needs the redis package)
+    or "memory" (in-process, for tests). A leased stage that is not renewed
+    within INGEST_LEASE_SECONDS becomes visible to other workers again;
+    failed stages are retried with exponential backoff from
+    INGEST_RETRY_BACKOFF_SECONDS, up to INGEST_TASK_MAX_ATTEMPTS attempts.
+    Idle workers poll every INGEST_WORKER_POLL_SECONDS.
+    INGEST_IN_PROCESS_WORKERS worker threads also run inside the API process
+    (default 1 for "memory", else 0).
+    """
+    backend = os.getenv("INGEST_QUEUE", "inline")
+    return IngestQueueSettings(
+        backend=backend,
+        redis_url=os.getenv("INGEST_QUEUE_REDIS_URL", "redis://localhost:6379/0"),
+        lease_seconds=_number_env("INGEST_LEASE_SECONDS", 120.0, cast=float),
+        max_attempts=_number_env("INGEST_TASK_MAX_ATTEMPTS", 5),
+        retry_backoff_seconds=_number_env(
+            "INGEST_RETRY_BACKOFF_SECONDS", 5.0, cast=float
+        ),
+        poll_seconds=_number_env("INGEST_WORKER_POLL_SECONDS", 1.0, cast=float),
+        in_process_workers=_number_env(
+            "INGEST_IN_PROCESS_WORKERS", 1 if backend == "memory" else 0
+        ),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_hierarchy_settings() -> HierarchySettings:
+    """Return two-stage (file, then chunk) retrieval settings.
+
+    With HIERARCHICAL_INDEX=true, ingest also embeds file and directory
+    summaries, and queries first pick HIERARCHY_CANDIDATE_FILES files (plus
+    the files of the best HIERARCHY_CANDIDATE_DIRECTORIES directories) before
+    searching chunks within them.
+    """
+    return HierarchySettings(
+        enabled=os.getenv("HIERARCHICAL_INDEX", "false").lower() == "true",
+        candidate_files=_number_env("HIERARCHY_CANDIDATE_FILES", 20),
+        candidate_directories=_number_env("HIERARCHY_CANDIDATE_DIRECTORIES", 3),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_migration_settings() -> MigrationSettings:
+    """Return embedding-model migration settings.
+
+    A migration re-embeds a repo into a new collection version
+    MIGRATION_BATCH_CHUNKS at a time, at most MIGRATION_MAX_CHUNKS_PER_SECOND
+    (0 = unthrottled), and keeps the previous version for
+    MIGRATION_RETAIN_SECONDS after cutover so in-flight queries can finish.
+    """
+    return MigrationSettings(
+        batch_chunks=_number_env("MIGRATION_BATCH_CHUNKS", 100),
+        max_chunks_per_second=_number_env(
+            "MIGRATION_MAX_CHUNKS_PER_SECOND", 50.0, cast=float
+        ),
+        retain_seconds=_number_env("MIGRATION_RETAIN_SECONDS", 300.0, cast=float),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_webhook_settings() -> WebhookSettings:
+    """Return push-webhook re-indexing settings.
+
+    Webhooks are rejected unless GITHUB_WEBHOOK_SECRET is set. Pushes to a
+    repo are coalesced until none arrived for WEBHOOK_DEBOUNCE_SECONDS, or
+    WEBHOOK_MAX_DELAY_SECONDS after the first one, whichever comes first; at
+    most WEBHOOK_MAX_CONCURRENT_REINDEXES re-indexes run at once.
+    """
+    return WebhookSettings(
+        secret=os.getenv("GITHUB_WEBHOOK_SECRET") or None,
+        debounce_seconds=_number_env("WEBHOOK_DEBOUNCE_SECONDS", 60.0, cast=float),
+        max_delay_seconds=_number_env("WEBHOOK_MAX_DELAY_SECONDS", 600.0, cast=float),
+        max_concurrent_reindexes=_number_env("WEBHOOK_MAX_CONCURRENT_REINDEXES", 2),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_resilience_settings() -> ResilienceSettings:
+    """Return deadline, circuit-breaker and hedging settings for outbound calls.
+
+    DEADLINE_{ASK,DOCS,QUERY}_SECONDS bound the matching endpoints and every
+    OpenAI/Chroma call they make; OPENAI_TIMEOUT_SECONDS bounds OpenAI calls
+    made without a deadline (ingest, background jobs). A dependency's breaker
+    opens after CIRCUIT_BREAKER_FAILURES consecutive failures and lets a
+    probe through after CIRCUIT_BREAKER_RESET_SECONDS. Idempotent calls
+    (query embeddings, Chroma queries) are duplicated once they take longer
+    than the HEDGE_PERCENTILE of their recent latencies, once
+    HEDGE_MIN_SAMPLES have been seen (HEDGING_ENABLED=false disables this).
+    Hedged calls run on a pool of HEDGE_MAX_WORKERS threads while it has idle
+    workers, and on the caller's thread, unhedged, when it does not.
+    """
+    return ResilienceSettings(
+        ask_deadline_seconds=_number_env("DEADLINE_ASK_SECONDS", 60.0, cast=float),
+        docs_deadline_seconds=_number_env("DEADLINE_DOCS_SECONDS", 180.0, cast=float),
+        query_deadline_seconds=_number_env("DEADLINE_QUERY_SECONDS", 15.0, cast=float),
+        openai_timeout_seconds=_number_env("OPENAI_TIMEOUT_SECONDS", 60.0, cast=float),
+        breaker_failure_threshold=_number_env("CIRCUIT_BREAKER_FAILURES", 5),
+        breaker_reset_seconds=_number_env(
+            "CIRCUIT_BREAKER_RESET_SECONDS", 30.0, cast=float
+        ),
+        hedging_enabled=os.getenv("HEDGING_ENABLED", "true").lower() != "false",
+        hedge_percentile=_number_env("HEDGE_PERCENTILE", 95.0, cast=float),
+        hedge_min_samples=_number_env("HEDGE_MIN_SAMPLES", 20),
+        hedge_max_workers=_number_env("HEDGE_MAX_WORKERS", 32),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_loop_monitor_settings() -> LoopMonitorSettings:
+    """Return the event-loop lag sampling interval.
+
+    LOOP_LAG_SAMPLE_SECONDS (default 0.25; 0 disables sampling) sets how
+    often the lag monitor wakes up; see GET /api/metrics/event-loop.
+    """
+    return LoopMonitorSettings(
+        interval_seconds=_number_env("LOOP_LAG_SAMPLE_SECONDS", 0.25, cast=float),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_profiling_settings() -> ProfilingSettings:
+    """Return on-demand and slow-request profiling settings.
+
+    A request with an `X-Profile: 1` header (or `?profile=1`) and a matching
+    `X-Admin-Token` (ADMIN_TOKEN; unset disables on-demand profiling and the
+    admin endpoints) is sampled every PROFILE_SAMPLE_INTERVAL_SECONDS and its
+    flamegraph stored. PROFILE_SLOW_REQUEST_SECONDS > 0 (default 0, off)
+    keeps a sampler running and stores a profile for every request slower
+    than that, from the last PROFILE_BUFFER_SECONDS of samples. At most
+    PROFILE_RETENTION_COUNT profiles younger than PROFILE_RETENTION_SECONDS
+    are kept.
+    """
+    return ProfilingSettings(
+        admin_token=os.getenv("ADMIN_TOKEN") or None,
+        sample_interval_seconds=_number_env(
+            "PROFILE_SAMPLE_INTERVAL_SECONDS", 0.01, cast=float
+        ),
+        slow_request_seconds=_number_env(
+            "PROFILE_SLOW_REQUEST_SECONDS", 0.0, cast=float
+        ),
+        buffer_seconds=_number_env("PROFILE_BUFFER_SECONDS", 300.0, cast=float),
+        retention_count=_number_env("PROFILE_RETENTION_COUNT", 50),
+        retention_seconds=_number_env(
+            "PROFILE_RETENTION_SECONDS", 7 * 24 * 3600.0, cast=float
+        ),
+    )
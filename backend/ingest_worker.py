@@ -0,0 +1,57 @@
+"""
+Ingest worker process: runs the stages of distributed ingests (see
+services.distributed_ingest) from the queue selected by INGEST_QUEUE
+("sqlite" for workers on the API's host, "redis" for workers anywhere).
+Throughput grows with the number of workers, up to the embedding and
+Chroma rate limits.
+
+Usage (from backend/):
+    python ingest_worker.py --threads 4
+"""
+
+from pathlib import Path
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+sys.path.append(str(Path(__file__).resolve().parent))
+load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env")
+
+from config import get_ingest_queue_settings
+from services.distributed_ingest import IngestWorker
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--threads", type=int, default=2, help="Stages run concurrently"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    backend = get_ingest_queue_settings().backend
+    if backend not in ("sqlite", "redis"):
+        raise SystemExit(
+            f"INGEST_QUEUE={backend} is not shared with other processes; "
+            "use sqlite or redis"
+        )
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+    worker = IngestWorker(args.threads)
+    worker.start()
+    stopped.wait()
+    # Running stages finish; anything cut short is re-leased by another worker
+    worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,23 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
 import os
+import asyncio
 import logging
+import shutil
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Awaitable, Dict, Optional, Set, Tuple
 from dotenv import load_dotenv
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
+logger = logging.getLogger(__name__)
 
 # Load .env from backend directory
 env_path = Path(__file__).resolve().parent / ".env"
@@ -19,20 +27,157 @@ import sys
 from pathlib import Path as _Path
 
 sys.path.append(str(_Path(__file__).resolve().parent))
-from services.repo_handler import ingest_repo
+from services.repo_handler import clone_repo, scan_repo_files
 from services.preprocessing import load_files
+from services.content_policy import apply_content_policy
+from services.prioritization import prioritize_docs
+from services.ingest_jobs import (
+    ACTIVE_STATUSES,
+    FAILED,
+    PARTIAL,
+    READY,
+    RUNNING,
+    claim_job,
+    create_job,
+    get_job,
+    get_latest_job,
+    list_interrupted_jobs,
+    new_job_id,
+    touch_job,
+    update_job,
+)
+from services.ingest_checkpoints import (
+    chunk_fingerprint,
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from services.embedding_providers import EmbeddingProviderError, get_embedding_provider
+from services.model_migration import (
+    MigrationError,
+    complete_migration,
+    get_migration_status,
+    pending_retirements,
+    prepare_migration,
+    retire_inactive_collections,
+    sync_version,
+)
+from services.repo_registry import RETIRE_AFTER_KEY, new_index_run
 from services.chunking import chunk_files
-from services.chromadb_service import index_repository
-from services.retrieval import query_repository, get_all_files
+from services.chromadb_service import get_repo_registry, index_repository
+from services.hierarchy import build_summary_index
+from services.distributed_ingest import (
+    IngestWorker,
+    queue_stats,
+    run_distributed_ingest,
+)
+from services.retrieval import aget_all_files, aquery_repository, query_repositories
+from services.scope import Scope, ScopeError, parse_scope
 from services.doc_generation import (
     generate_overview_docs,
     generate_file_docs,
     answer_question,
+    answer_question_across_repos,
 )
+from services.batch_docs import pregenerate_repo_docs
+from services.file_tree import get_path_index, invalidate_path_index
+from services.doc_store import delete_repo_docs, get_stored_file_docs, save_file_docs
 from models.documentation import DocsData
+from models.search import CrossRepoQueryRequest
+from services.singleflight import KeyedLocks, SingleFlight
+from services.warmup import warm_up
+from services.webhooks import (
+    EVENT_HEADER,
+    SIGNATURE_HEADER,
+    WebhookError,
+    parse_push,
+    verify_signature,
+)
+from services.reindex_scheduler import PendingReindex, ReindexScheduler
+from services.resilience import CircuitOpenError, deadline, get_resilience_metrics
+from services.loop_monitor import EventLoopLagMonitor
+from services.profiling import get_profile_store
+from config import (
+    get_compression_settings,
+    get_hierarchy_settings,
+    get_ingest_queue_settings,
+    get_ingest_settings,
+    get_loop_monitor_settings,
+    get_migration_settings,
+    get_profiling_settings,
+    get_resilience_settings,
+    get_warmup_settings,
+    get_webhook_settings,
+)
+from utils.compression import CompressionMiddleware
+from utils.profiling import ADMIN_TOKEN_HEADER, ProfilingMiddleware, is_admin
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    repos = get_warmup_settings().repos
+    if repos:
+        # Warm up in the background so the worker accepts requests immediately
+        app.state.warmup = _spawn(run_in_threadpool(warm_up, repos), "Warm-up")
+    if get_ingest_settings().resume_on_startup:
+        app.state.resume = _spawn(
+            _resume_interrupted_ingests(), "Resuming interrupted ingests"
+        )
+    app.state.retirements = _spawn(
+        _resume_retirements(), "Resuming collection retirements"
+    )
+    queue_settings = get_ingest_queue_settings()
+    ingest_worker = None
+    if queue_settings.backend != "inline" and queue_settings.in_process_workers > 0:
+        ingest_worker = IngestWorker(queue_settings.in_process_workers)
+        ingest_worker.start()
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    if ingest_worker is not None:
+        # Unfinished stages are picked up again once their lease lapses
+        await run_in_threadpool(ingest_worker.stop, 30)
 
 
-app = FastAPI(title="SlashDocs Backend")
+app = FastAPI(title="SlashDocs Backend", lifespan=lifespan)
+
+# Concurrent identical requests share one computation; ingest is keyed by repo
+request_flight = SingleFlight("requests")
+ingest_flight = SingleFlight("ingest")
+migration_flight = SingleFlight("migration")
+repo_locks = KeyedLocks()
+# Job id and compact flag of the in-flight ingest of each repo (by URL key),
+# for callers that attach to it
+ingest_job_ids: Dict[str, str] = {}
+ingest_compact: Dict[str, bool] = {}
+# Fire-and-forget work started by requests; referenced so it is not collected
+background_tasks: Set[asyncio.Task] = set()
+loop_monitor = EventLoopLagMonitor(get_loop_monitor_settings().interval_seconds)
+
+
+def _spawn(coroutine: Awaitable, description: str) -> asyncio.Task:
+    """Run a coroutine in the background, logging its failure."""
+    task = asyncio.ensure_future(coroutine)
+    background_tasks.add(task)
+
+    def done(task: asyncio.Task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            logger.error(f"{description} failed: {type(error).__name__}: {error}")
+
+    task.add_done_callback(done)
+    return task
+
+
+async def _with_deadline(seconds: float, fn):
+    """
+    Await fn() for at most `seconds`; every OpenAI/Chroma call it makes
+    (including from worker threads) is bounded by the same deadline.
+    """
+    with deadline(seconds):
+        return await asyncio.wait_for(fn(), seconds)
+
 
 # --- CORS ---
 origins = ["http://localhost:3000", "https://your-vercel-app.vercel.app"]
@@ -43,6 +188,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Compression (brotli when installed, else gzip) for responses over the threshold ---
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=get_compression_settings().minimum_size,
+)
+
+# --- Profiling: on demand for admins, and of requests slower than the threshold ---
+app.add_middleware(
+    ProfilingMiddleware,
+    admin_token=get_profiling_settings().admin_token,
+    slow_request_seconds=get_profiling_settings().slow_request_seconds,
+)
+
 
 @app.get("/")
 def root():
@@ -50,90 +208,1018 @@ def root():
 
 
 @app.post("/api/ingest")
-async def ingest(repo_url: str):
+async def ingest(
+    repo_url: str,
+    pregenerate_docs: bool = False,
+    top_n: Optional[int] = None,
+    compact: bool = True,
+    background: bool = False,
+):
     """
     Ingests a GitHub repo → preprocess → embed → store in ChromaDB
+    Optionally schedules file docs pre-generation (all files, or the top_n most central).
+    compact=true removes chunks left over from the previous index of the repo.
+    background=true returns the job id immediately; high-value files are indexed
+    first, so the repo is queryable once the job reports "partial".
+    """
+    try:
+        job_id, attached, task = await _submit_ingest(
+            repo_url, compact=compact, pregenerate_docs=pregenerate_docs, top_n=top_n
+        )
+        if background:
+            return {"status": "accepted", "job_id": job_id, "attached": attached}
+
+        result = await asyncio.shield(task)
+        return {
+            "status": "success",
+            "indexed": result,
+            "attached": attached,
+            "job_id": job_id,
+        }
+    except IngestConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class IngestConflict(RuntimeError):
+    """An ingest of the repo is already running with different options."""
+
+    def __init__(self, message: str, task: asyncio.Task):
+        super().__init__(message)
+        self.task = task
+
+
+def _ingest_key(repo_url: str) -> str:
+    """Identify a repo by its URL, so same-named repos of different owners differ."""
+    key = repo_url.strip().rstrip("/")
+    if key.endswith(".git"):
+        key = key[: -len(".git")]
+    return key
+
+
+async def _submit_ingest(
+    repo_url: str,
+    *,
+    compact: bool = True,
+    pregenerate_docs: bool = False,
+    top_n: Optional[int] = None,
+    job_id: Optional[str] = None,
+    commit_sha: Optional[str] = None,
+) -> Tuple[str, bool, asyncio.Task]:
+    """
+    Start (or attach to) the ingest of a repo, at `commit_sha` or the
+    default branch's head.
+
+    Returns:
+        (job id, whether an in-flight ingest was joined, the ingest task)
+
+    Raises:
+        IngestConflict: the repo is already being ingested with another
+            compact flag
+    """
+    # Extract repo name for deterministic chunk IDs
+    repo_name = repo_url.split("/")[-1].replace(".git", "")
+    key = _ingest_key(repo_url)
+
+    # A duplicate ingest of the same repo attaches to the running job. The
+    # flight is registered before the job record is written, so concurrent
+    # requests cannot start a second one meanwhile.
+    attached = ingest_flight.in_flight(key)
+    job_created = None
+    if attached:
+        if ingest_compact[key] != compact:
+            raise IngestConflict(
+                f"{repo_url} is already being ingested with compact={ingest_compact[key]}",
+                ingest_flight.task(key),
+            )
+        job_id = ingest_job_ids[key]
+    else:
+        if job_id is None:
+            job_id = new_job_id()
+            job_created = asyncio.ensure_future(
+                run_in_threadpool(create_job, repo_name, repo_url, job_id)
+            )
+        ingest_job_ids[key] = job_id
+        ingest_compact[key] = compact
+
+    async def run_ingest():
+        if job_created is not None:
+            await job_created
+        # Keeps the job from looking interrupted to other workers while it
+        # waits for the repo lock or sits in a long clone
+        heartbeat = _spawn(_heartbeat(job_id), f"Heartbeat of ingest job {job_id}")
+        registry = get_repo_registry()
+        previous = {}
+        try:
+            async with repo_locks.hold(repo_name):
+                if await run_in_threadpool(registry.exists, repo_name):
+                    previous = await run_in_threadpool(
+                        registry.get_index_metadata, repo_name
+                    )
+                await run_in_threadpool(update_job, job_id, status=RUNNING)
+                if get_ingest_queue_settings().backend == "inline":
+                    # Clone, embed and upsert are blocking; keep them off the event loop
+                    result = await run_in_threadpool(
+                        _run_ingest_pipeline,
+                        repo_url,
+                        repo_name,
+                        compact,
+                        job_id,
+                        commit_sha,
+                    )
+                else:
+                    result = await run_distributed_ingest(
+                        job_id,
+                        repo_url,
+                        repo_name,
+                        compact,
+                        on_progress=lambda committed, total: _record_progress(
+                            job_id, repo_name, committed, total
+                        ),
+                        commit_sha=commit_sha,
+                    )
+                # Stored file docs and the local indexes describe the previous index
+                await run_in_threadpool(delete_repo_docs, repo_name)
+                _invalidate_local_indexes(repo_name)
+                await run_in_threadpool(update_job, job_id, status=READY, result=result)
+                if pregenerate_docs:
+                    _spawn(
+                        run_in_threadpool(
+                            pregenerate_repo_docs, repo_name, top_n=top_n
+                        ),
+                        f"Docs pre-generation for {repo_name}",
+                    )
+                return result
+        except Exception as e:
+            # The checkpoint is kept: retrying the ingest resumes after the last
+            # batch. Until then the repo falls back to its last complete run.
+            await run_in_threadpool(update_job, job_id, status=FAILED, error=str(e))
+            try:
+                await run_in_threadpool(registry.abandon_index_run, repo_name, previous)
+            except Exception as restore_error:
+                logger.error(
+                    f"Could not reset the index status of {repo_name}: {restore_error}"
+                )
+            raise
+        finally:
+            heartbeat.cancel()
+
+    task = ingest_flight.start(key, run_ingest)
+    if not attached:
+        # Runs right after the flight forgets the task, so nobody can attach
+        # in between and find no job id
+        task.add_done_callback(lambda _: _forget_ingest(key, job_id))
+    if job_created is not None:
+        # The job can be looked up as soon as its id is returned
+        await asyncio.shield(job_created)
+    return job_id, attached, task
+
+
+def _forget_ingest(key: str, job_id: str):
+    if ingest_job_ids.get(key) == job_id:
+        del ingest_job_ids[key]
+        del ingest_compact[key]
+
+
+async def _heartbeat(job_id: str):
+    interval = get_ingest_settings().stale_job_seconds / 4
+    while True:
+        await asyncio.sleep(interval)
+        await run_in_threadpool(touch_job, job_id)
+
+
+async def _reindex_after_push(pending: PendingReindex):
+    try:
+        _, attached, task = await _submit_ingest(
+            pending.repo_url, commit_sha=pending.commit_sha
+        )
+    except IngestConflict as e:
+        task, attached = e.task, True
+    await asyncio.shield(task)
+    if attached:
+        # The joined ingest may have cloned before the push; index the pushed commit
+        _, _, task = await _submit_ingest(
+            pending.repo_url, commit_sha=pending.commit_sha
+        )
+        await asyncio.shield(task)
+
+
+reindex_scheduler = ReindexScheduler(
+    _reindex_after_push,
+    debounce_seconds=get_webhook_settings().debounce_seconds,
+    max_delay_seconds=get_webhook_settings().max_delay_seconds,
+    max_concurrent=get_webhook_settings().max_concurrent_reindexes,
+)
+
+
+@app.post("/api/webhooks/github")
+async def github_webhook(request: Request):
+    """
+    Re-index a repo after pushes to its default branch. Deliveries must be
+    signed with GITHUB_WEBHOOK_SECRET; bursts of pushes are debounced and
+    coalesced into one re-index of the latest commit, which only re-embeds
+    changed chunks. Repos that were never ingested are ignored.
+    """
+    secret = get_webhook_settings().secret
+    if not secret:
+        raise HTTPException(status_code=503, detail="GITHUB_WEBHOOK_SECRET is not set")
+    body = await request.body()
+    try:
+        verify_signature(body, request.headers.get(SIGNATURE_HEADER), secret)
+    except WebhookError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+    event_type = request.headers.get(EVENT_HEADER)
+    if event_type == "ping":
+        return {"status": "pong"}
+    if event_type != "push":
+        return {"status": "ignored", "reason": f"event {event_type}"}
+    try:
+        event = parse_push(await request.json())
+    except (WebhookError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if event is None:
+        return {"status": "ignored", "reason": "not a push to the default branch"}
+    if not await run_in_threadpool(get_repo_registry().exists, event.repo_name):
+        return {"status": "ignored", "reason": f"{event.repo_name} is not indexed"}
+
+    pending = reindex_scheduler.submit(event)
+    return {
+        "status": "scheduled",
+        "repo_name": event.repo_name,
+        "commit_sha": pending.commit_sha,
+        "coalesced_pushes": pending.pushes,
+    }
+
+
+@app.get("/api/webhooks/status")
+async def webhook_status():
+    """
+    Pending and running push-triggered re-indexes.
+    """
+    return reindex_scheduler.stats()
+
+
+async def _resume_interrupted_ingests():
+    """
+    Re-run ingest jobs left unfinished by a previous process; each resumes
+    from its checkpoint. Jobs are claimed atomically so only one worker
+    picks each up.
+    """
+    stale_seconds = get_ingest_settings().stale_job_seconds
+    for job in await run_in_threadpool(list_interrupted_jobs, stale_seconds):
+        if await run_in_threadpool(claim_job, job["job_id"], job["updated_at"]):
+            logger.info(
+                f"Resuming interrupted ingest {job['job_id']} of {job['repo_name']}"
+            )
+            try:
+                await _submit_ingest(job["repo_url"], job_id=job["job_id"])
+            except IngestConflict as e:
+                # The repo is being ingested anew; the interrupted job is superseded
+                logger.warning(f"Not resuming ingest {job['job_id']}: {e}")
+                await run_in_threadpool(
+                    update_job, job["job_id"], status=FAILED, error=str(e)
+                )
+
+
+def _invalidate_local_indexes(repo_name: str):
+    invalidate_path_index(repo_name)
+    # Imported here so numpy is only loaded once an index changes
+    from services.quantized_index import invalidate_quantized_index
+
+    invalidate_quantized_index(repo_name)
+
+
+def _record_progress(job_id: str, repo_name: str, committed: int, total: int):
+    update_job(
+        job_id,
+        status=PARTIAL if committed < total else None,
+        chunks_total=total,
+        chunks_indexed=committed,
+    )
+    # New files became searchable; tree and docs should see them
+    _invalidate_local_indexes(repo_name)
+
+
+def _run_ingest_pipeline(
+    repo_url: str,
+    repo_name: str,
+    compact: bool,
+    job_id: str,
+    commit_sha: Optional[str] = None,
+):
+    # Step 1: Clone & scrape repo files
+    repo_dir, commit_sha = clone_repo(repo_url, commit_sha)
+    try:
+        repo_files = scan_repo_files(repo_dir)
+
+        # Step 2: Load + extract metadata (repo-relative paths keep chunk ids stable)
+        docs = load_files(repo_files, repo_dir)
+
+        # Step 2.25: Drop lockfiles, generated, minified and vendored content
+        docs, policy_report = apply_content_policy(docs, repo_dir)
+
+        # Step 2.5: Create Chunks at the file level, high-value files first
+        chunks = chunk_files(prioritize_docs(docs, repo_dir), repo_name)
+    finally:
+        # Every push re-clones; the checkout is not needed past chunking
+        shutil.rmtree(repo_dir, ignore_errors=True)
+    update_job(job_id, chunks_total=len(chunks))
+
+    # Step 3: Resume an interrupted run of the same work, if there is one
+    provider = get_embedding_provider()
+    fingerprint = chunk_fingerprint(chunks, provider.describe())
+    checkpoint = load_checkpoint(repo_name, commit_sha, fingerprint)
+    index_run = checkpoint["index_run"] if checkpoint else new_index_run()
+    resume_from = checkpoint["chunks_committed"] if checkpoint else 0
+    batches = checkpoint["batches_committed"] if checkpoint else 0
+    # A file is fully committed once its last chunk is
+    last_chunk_ends = [
+        chunk["metadata"]["chunk_index"] == chunk["metadata"]["total_chunks"] - 1
+        for chunk in chunks
+    ]
+
+    def on_progress(committed: int, total: int):
+        nonlocal batches
+        batches += 1
+        save_checkpoint(
+            repo_name,
+            commit_sha=commit_sha,
+            fingerprint=fingerprint,
+            index_run=index_run,
+            files_total=len(docs),
+            files_committed=sum(last_chunk_ends[:committed]),
+            chunks_total=total,
+            chunks_committed=committed,
+            batches_committed=batches,
+        )
+        _record_progress(job_id, repo_name, committed, total)
+
+    result = index_repository(
+        repo_name,
+        chunks,
+        commit_sha=commit_sha,
+        repo_url=repo_url,
+        provider=provider,
+        on_progress=on_progress,
+        index_run=index_run,
+        resume_from=resume_from,
+    )
+    # Step 4: File/directory summaries for two-stage retrieval
+    if get_hierarchy_settings().enabled:
+        result["summary_index"] = build_summary_index(
+            repo_name, docs, provider, index_run
+        )
+    clear_checkpoint(repo_name)
+    result["content_policy"] = policy_report
+    if compact:
+        result["compaction"] = get_repo_registry().compact_repo(repo_name)
+    return result
+
+
+@app.get("/api/ingest/queue")
+async def get_ingest_queue():
+    """
+    Queued and leased stages of distributed ingests, per stage
+    (empty when INGEST_QUEUE=inline).
+    """
+    backend = get_ingest_queue_settings().backend
+    if backend == "inline":
+        return {"backend": backend, "stages": {}}
+    try:
+        return {"backend": backend, "stages": await run_in_threadpool(queue_stats)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """
+    Status of an ingest job, including the fraction of the repo that is searchable.
+    """
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingest job {job_id}")
+    return job
+
+
+@app.get("/api/repos/{repo_name}/status")
+async def get_repo_status(repo_name: str):
+    """
+    Readiness of a repo: "partial" while an ingest is still committing batches,
+    "ready" once fully indexed, with the latest ingest job.
+    """
+    try:
+        job = await run_in_threadpool(get_latest_job, repo_name)
+        indexed = await run_in_threadpool(get_repo_registry().exists, repo_name)
+        metadata = (
+            await run_in_threadpool(get_repo_registry().get_index_metadata, repo_name)
+            if indexed
+            else {}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if metadata.get("index_status"):
+        status = metadata["index_status"]
+        fraction = metadata.get("searchable_fraction", 1.0)
+    elif job is not None and job["status"] in ACTIVE_STATUSES:
+        status, fraction = "indexing", 0.0
+    elif indexed:
+        # Indexed before readiness was recorded
+        status, fraction = "ready", 1.0
+    else:
+        raise HTTPException(
+            status_code=404, detail=f"Repository {repo_name} is not indexed"
+        )
+    return {
+        "repo_name": repo_name,
+        "index_status": status,
+        "searchable_fraction": fraction,
+        "latest_job": job,
+    }
+
+
+@app.get("/api/repos")
+async def list_repos():
+    """
+    List indexed repositories with their index metadata.
+    """
+    try:
+        repos = await run_in_threadpool(get_repo_registry().list_repos)
+        return {"repos": repos, "count": len(repos)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/repos/gc")
+async def collect_stale_repos(older_than_days: float = 30, dry_run: bool = True):
+    """
+    Find (and with dry_run=false, delete) repos not re-indexed within older_than_days.
+    """
+    try:
+        stale = await run_in_threadpool(
+            get_repo_registry().collect_garbage, older_than_days, dry_run
+        )
+        return {"stale_repos": stale, "deleted": not dry_run}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _require_indexed(repo_name: str) -> None:
+    if not await run_in_threadpool(get_repo_registry().exists, repo_name):
+        raise HTTPException(
+            status_code=404, detail=f"Repository {repo_name} is not indexed"
+        )
+
+
+@app.get("/api/repos/{repo_name}/stats")
+async def get_repo_stats(repo_name: str):
+    """
+    Chunk count and index metadata (embedding model, index time, commit) of a repo.
     """
+    await _require_indexed(repo_name)
     try:
-        # Step 1: Clone & scrape repo files
-        repo_files = ingest_repo(repo_url)
+        return await run_in_threadpool(get_repo_registry().get_stats, repo_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Step 2: Load + extract metadata
-        docs = load_files(repo_files)
 
-        # Extract repo name for deterministic chunk IDs
-        repo_name = repo_url.split("/")[-1].replace(".git", "")
+@app.delete("/api/repos/{repo_name}")
+async def delete_repo(repo_name: str):
+    """
+    Delete a repository's index and stored docs.
+    """
+    try:
+        deleted = await run_in_threadpool(get_repo_registry().delete_repo, repo_name)
+        _invalidate_local_indexes(repo_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(
+            status_code=404, detail=f"Repository {repo_name} is not indexed"
+        )
+    return {"status": "deleted", "repo_name": repo_name}
 
-        # Step 2.5: Create Chunks at the file level
-        chunks = chunk_files(docs, repo_name)
 
-        result = index_repository(repo_name, chunks)
+@app.post("/api/repos/{repo_name}/compact")
+async def compact_repo(repo_name: str):
+    """
+    Remove chunks left over from earlier index runs of a repository.
+    """
+    await _require_indexed(repo_name)
+    try:
+        result = await run_in_threadpool(get_repo_registry().compact_repo, repo_name)
+        _invalidate_local_indexes(repo_name)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        return {"status": "success", "indexed": result}
+@app.post("/api/repos/{repo_name}/snapshot")
+async def export_repo_snapshot(repo_name: str):
+    """
+    Export a repo's chunks, metadata and embeddings to a portable snapshot.
+    """
+    # Imported here so numpy is only loaded once snapshots are used
+    from services.snapshots import SnapshotError, export_snapshot
+
+    await _require_indexed(repo_name)
+    try:
+        async with repo_locks.hold(repo_name):
+            return await run_in_threadpool(export_snapshot, repo_name)
+    except SnapshotError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/repos/{repo_name}/docs", response_model=DocsData)
-async def get_repo_docs(repo_name: str) -> DocsData:
+@app.post("/api/repos/{repo_name}/migrate")
+async def migrate_repo_embeddings(
+    repo_name: str,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    dimensions: Optional[int] = None,
+):
+    """
+    Re-embed a repo with another embedding provider/model (default: the
+    configured one) into a new collection version, in the background.
+    Queries keep using the current vectors until the new version is complete.
+    """
+    await _require_indexed(repo_name)
+    if migration_flight.in_flight(repo_name):
+        return {"status": "accepted", "repo_name": repo_name, "attached": True}
+    try:
+        target_provider = get_embedding_provider(provider, model, dimensions)
+        target = await run_in_threadpool(prepare_migration, repo_name, target_provider)
+    except (EmbeddingProviderError, MigrationError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    migration_flight.start(
+        repo_name, lambda: _run_migration(repo_name, target, target_provider)
+    )
+    return {
+        "status": "accepted",
+        "repo_name": repo_name,
+        "attached": False,
+        "collection_name": target.name,
+        **target_provider.describe(),
+    }
+
+
+async def _run_migration(repo_name: str, target, provider):
+    try:
+        # Bulk re-embedding runs alongside ingests; the final catch-up and the
+        # switch hold the repo's ingest lock so no write is missed
+        await run_in_threadpool(sync_version, repo_name, target, provider)
+        async with repo_locks.hold(repo_name):
+            result = await run_in_threadpool(
+                complete_migration, repo_name, target, provider
+            )
+            _invalidate_local_indexes(repo_name)
+    except Exception as e:
+        logger.error(f"Migration of {repo_name} failed: {type(e).__name__}: {e}")
+        raise
+    _schedule_retirement(repo_name, get_migration_settings().retain_seconds)
+    return result
+
+
+def _schedule_retirement(repo_name: str, delay: float):
+    _spawn(
+        _retire_after_grace_period(repo_name, delay),
+        f"Retiring old collections of {repo_name}",
+    )
+
+
+async def _retire_after_grace_period(repo_name: str, delay: float):
+    # Queries that resolved the old collection before the switch may still use it
+    await asyncio.sleep(max(0.0, delay))
+    if migration_flight.in_flight(repo_name):
+        # The next version is being built; its switch schedules a new retirement
+        return
+    await run_in_threadpool(retire_inactive_collections, repo_name)
+
+
+async def _resume_retirements():
+    """Schedule retirements a previous process did not get to."""
+    now = time.time()
+    for repo_name, retire_after in (
+        await run_in_threadpool(pending_retirements)
+    ).items():
+        _schedule_retirement(repo_name, retire_after - now)
+
+
+@app.get("/api/repos/{repo_name}/migration")
+async def get_repo_migration(repo_name: str):
+    """
+    The collection version serving a repo and the progress of any migration.
+    """
+    await _require_indexed(repo_name)
+    try:
+        status = await run_in_threadpool(get_migration_status, repo_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {**status, "in_progress": migration_flight.in_flight(repo_name)}
+
+
+@app.get("/api/snapshots")
+async def list_index_snapshots():
+    """
+    List index snapshots stored under the data directory, newest first.
+    """
+    from services.snapshots import list_snapshots
+
+    snapshots = await run_in_threadpool(list_snapshots)
+    return {"snapshots": snapshots, "count": len(snapshots)}
+
+
+@app.post("/api/snapshots/{snapshot_name}/import")
+async def import_index_snapshot(
+    snapshot_name: str, repo_name: Optional[str] = None, replace: bool = False
+):
+    """
+    Load a snapshot into Chroma without re-embedding. The repo keeps the
+    snapshot's name unless repo_name is given; replace=true overwrites an
+    existing index.
+    """
+    from services.snapshots import (
+        SnapshotError,
+        import_snapshot,
+        read_manifest,
+        snapshot_path,
+    )
+
+    try:
+        directory = snapshot_path(snapshot_name)
+        manifest = await run_in_threadpool(read_manifest, directory)
+    except SnapshotError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    repo_name = repo_name or manifest["repo_name"]
+    if migration_flight.in_flight(repo_name):
+        raise HTTPException(
+            status_code=409, detail=f"{repo_name} is being migrated; import it after"
+        )
+    try:
+        async with repo_locks.hold(repo_name):
+            result = await run_in_threadpool(
+                import_snapshot, directory, repo_name, replace=replace
+            )
+            _invalidate_local_indexes(repo_name)
+        if RETIRE_AFTER_KEY in result:
+            # A replaced index is served from a new version; drop the old one later
+            _schedule_retirement(repo_name, result[RETIRE_AFTER_KEY] - time.time())
+        return result
+    except SnapshotError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get(
+    "/api/repos/{repo_name}/docs",
+    response_model=DocsData,
+    response_class=ORJSONResponse,
+)
+async def get_repo_docs(
+    repo_name: str, include_tree: bool = True, tree_depth: Optional[int] = None
+) -> DocsData:
     """
     Generate structured overview documentation for a repository.
+    include_tree=false omits the file tree and tree_depth limits it; use the tree endpoint for the rest.
 
     Returns:
         DocsData object with sections, file_tree, and metadata
     """
     try:
-        docs = generate_overview_docs(repo_name)
+        docs = await request_flight.do(
+            ("docs", repo_name, include_tree, tree_depth),
+            lambda: _with_deadline(
+                get_resilience_settings().docs_deadline_seconds,
+                lambda: run_in_threadpool(
+                    generate_overview_docs, repo_name, include_tree, tree_depth
+                ),
+            ),
+        )
         return docs
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out generating docs")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/repos/{repo_name}/files")
+@app.get("/api/repos/{repo_name}/files", response_class=ORJSONResponse)
 async def list_repo_files(repo_name: str):
     """
     List all files in an indexed repository.
     """
     try:
-        files = get_all_files(repo_name)
+        files = await request_flight.do(
+            ("files", repo_name), lambda: aget_all_files(repo_name)
+        )
         return {"repo_name": repo_name, "files": files, "count": len(files)}
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out listing files")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/repos/{repo_name}/tree", response_class=ORJSONResponse)
+async def get_repo_tree(
+    repo_name: str,
+    path: str = "",
+    depth: int = 1,
+    offset: int = 0,
+    limit: int = 500,
+    format: str = "nested",
+):
+    """
+    Return the children of one directory from the repo's cached path index.
+    depth expands that many levels; offset/limit page the directory's direct children.
+    format="flat" returns a compact list of paths with folders ending in "/".
+    """
+    if format not in ("nested", "flat"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if depth < 1 or limit < 1:
+        raise HTTPException(status_code=400, detail="depth and limit must be >= 1")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must be >= 0")
+
+    try:
+        index = await request_flight.do(
+            ("path_index", repo_name),
+            lambda: run_in_threadpool(get_path_index, repo_name),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if not index.has_directory(path):
+        raise HTTPException(
+            status_code=404, detail=f"No directory {path!r} in {repo_name}"
+        )
+
+    _, total = index.children(path)
+    response = {
+        "repo_name": repo_name,
+        "path": path.strip("/"),
+        "depth": depth,
+        "offset": offset,
+        "limit": limit,
+        "total_children": total,
+        "has_more": offset + limit < total,
+        "file_count": index.file_count(path),
+    }
+    if format == "flat":
+        response["entries"] = index.to_flat(path, depth, offset, limit)
+    else:
+        response["children"] = index.to_file_nodes(path, depth, offset, limit)
+    return response
+
 
 @app.get("/api/repos/{repo_name}/files/{file_path:path}/docs")
-async def get_file_docs(repo_name: str, file_path: str):
+async def get_file_docs(
+    repo_name: str, file_path: str, mode: str = "full", refresh: bool = False
+):
     """
     Generate documentation for a specific file.
+    mode="full" covers every chunk (map-reduce for large files); "sample" uses top search hits.
+    Full-mode docs are served from the doc store when present, unless refresh=true.
     """
     try:
-        docs = generate_file_docs(repo_name, file_path)
+        if mode == "full" and not refresh:
+            stored = await run_in_threadpool(get_stored_file_docs, repo_name, file_path)
+            if stored is not None:
+                return stored
+
+        docs = await request_flight.do(
+            ("file_docs", repo_name, file_path, mode),
+            lambda: _with_deadline(
+                get_resilience_settings().docs_deadline_seconds,
+                lambda: run_in_threadpool(
+                    generate_file_docs, repo_name, file_path, mode=mode
+                ),
+            ),
+        )
+        if mode == "full":
+            await run_in_threadpool(save_file_docs, repo_name, file_path, docs)
         return docs
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out generating file docs")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/repos/{repo_name}/query")
-async def query_repo(repo_name: str, question: str, n_results: int = 10):
+@app.post("/api/repos/{repo_name}/docs/pregenerate")
+async def pregenerate_docs(
+    repo_name: str,
+    background_tasks: BackgroundTasks,
+    top_n: Optional[int] = None,
+    max_workers: int = 4,
+    runner: Optional[str] = None,
+    skip_existing: bool = True,
+):
+    """
+    Schedule pre-generation of file docs for a repository.
+    runner: omit for a bounded worker pool, "openai" for the Batch API, "local" for its stand-in.
+    """
+    if runner not in (None, "openai", "local"):
+        raise HTTPException(status_code=400, detail=f"Unknown runner: {runner}")
+
+    background_tasks.add_task(
+        pregenerate_repo_docs,
+        repo_name,
+        top_n=top_n,
+        max_workers=max_workers,
+        runner=runner,
+        skip_existing=skip_existing,
+    )
+    return {"status": "scheduled", "repo_name": repo_name, "top_n": top_n}
+
+
+def _parse_scope(scope: Optional[str]) -> Optional[Scope]:
+    try:
+        return parse_scope(scope)
+    except ScopeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/api/repos/{repo_name}/query", response_class=ORJSONResponse)
+async def query_repo(
+    repo_name: str,
+    question: str,
+    n_results: int = 10,
+    include_documents: bool = True,
+    hierarchical: Optional[bool] = None,
+    scope: Optional[str] = None,
+):
     """
     Query a repository using semantic search.
     Returns relevant code chunks without LLM generation.
+    include_documents=false returns ids, metadata, scores and a short snippet only.
+    hierarchical=true searches file/directory summaries first (default: HIERARCHICAL_INDEX).
+    scope limits the search to subtrees, languages or globs, e.g.
+    "services/api lang:python" or "src/**/*.ts" (see services.scope).
     """
+    search_scope = _parse_scope(scope)
     try:
-        results = query_repository(repo_name, question, n_results=n_results)
+        results = await request_flight.do(
+            (
+                "query",
+                repo_name,
+                question,
+                n_results,
+                include_documents,
+                hierarchical,
+                search_scope,
+            ),
+            lambda: _with_deadline(
+                get_resilience_settings().query_deadline_seconds,
+                lambda: aquery_repository(
+                    repo_name,
+                    question,
+                    n_results=n_results,
+                    include_documents=include_documents,
+                    hierarchical=hierarchical,
+                    scope=search_scope,
+                ),
+            ),
+        )
         return {"repo_name": repo_name, "query": question, "results": results}
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out querying repository")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/repos/{repo_name}/ask")
-async def ask_question(repo_name: str, question: str):
+async def ask_question(repo_name: str, question: str, scope: Optional[str] = None):
     """
     Ask a question about the repository and get an AI-generated answer.
     Uses RAG (Retrieval-Augmented Generation).
+    scope limits the context to subtrees, languages or globs (see /query).
     """
+    search_scope = _parse_scope(scope)
     try:
-        result = answer_question(repo_name, question)
+        result = await request_flight.do(
+            ("ask", repo_name, question, search_scope),
+            lambda: _with_deadline(
+                get_resilience_settings().ask_deadline_seconds,
+                lambda: run_in_threadpool(
+                    answer_question, repo_name, question, search_scope
+                ),
+            ),
+        )
         return result
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out answering question")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/query", response_class=ORJSONResponse)
+async def query_across_repos(request: CrossRepoQueryRequest):
+    """
+    Search several repositories at once and return one merged ranking.
+    With generate_answer=true, also answers the question over the merged context.
+    """
+
+    def run_query():
+        if request.generate_answer:
+            return answer_question_across_repos(
+                request.repo_names,
+                request.question,
+                n_results=request.n_results,
+                per_repo_limit=request.per_repo_limit,
+                filter_metadata=request.filter_metadata,
+            )
+
+        merged = query_repositories(
+            request.repo_names,
+            request.question,
+            n_results=request.n_results,
+            per_repo_limit=request.per_repo_limit,
+            filter_metadata=request.filter_metadata,
+        )
+        return {
+            "repo_names": request.repo_names,
+            "query": request.question,
+            "results": merged["results"],
+            "failed_repos": merged["failed_repos"],
+        }
+
+    settings = get_resilience_settings()
+    seconds = (
+        settings.ask_deadline_seconds
+        if request.generate_answer
+        else settings.query_deadline_seconds
+    )
+    try:
+        return await request_flight.do(
+            ("cross_repo_query", request.model_dump_json()),
+            lambda: _with_deadline(seconds, lambda: run_in_threadpool(run_query)),
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out querying repositories")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/metrics/resilience")
+async def resilience_metrics():
+    """
+    Latency percentiles (with hedging vs. first attempt only), hedges,
+    deadline misses and circuit breaker states per outbound call type.
+    """
+    return get_resilience_metrics()
+
+
+@app.get("/api/metrics/event-loop")
+async def event_loop_metrics(reset: bool = False):
+    """
+    Event-loop lag percentiles; reset=true starts a new measurement window.
+    """
+    stats = loop_monitor.stats()
+    if reset:
+        loop_monitor.reset()
+    return stats
+
+
+def _require_admin(x_admin_token: Optional[str] = Header(None)):
+    admin_token = get_profiling_settings().admin_token
+    if not admin_token:
+        raise HTTPException(status_code=503, detail="ADMIN_TOKEN is not set")
+    if not is_admin(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail=f"Invalid {ADMIN_TOKEN_HEADER}")
+
+
+@app.get("/api/admin/profiles", dependencies=[Depends(_require_admin)])
+async def list_profiles():
+    """
+    Stored request profiles, newest first.
+    """
+    return {"profiles": await run_in_threadpool(get_profile_store().list)}
+
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(_require_admin)])
+async def get_profile(profile_id: str, format: str = "svg"):
+    """
+    A stored profile as an SVG flamegraph, or format="folded" for the folded
+    stacks (flamegraph.pl, speedscope).
+    """
+    if format not in ("svg", "folded"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    path = get_profile_store().path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No profile {profile_id!r}")
+    media_type = "image/svg+xml" if format == "svg" else "text/plain"
+    return FileResponse(path, media_type=media_type)
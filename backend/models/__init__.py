@@ -8,10 +8,12 @@ from models.documentation import (
     DocumentationMetadata,
     DocsData,
 )
+from models.search import CrossRepoQueryRequest
 
 __all__ = [
     "Section",
     "FileNode",
     "DocumentationMetadata",
     "DocsData",
+    "CrossRepoQueryRequest",
 ]
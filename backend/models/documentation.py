@@ -92,6 +92,11 @@ class DocsData(BaseModel):
         ..., description="Documentation sections", min_length=1
     )
     file_tree: List[FileNode] = Field(..., description="Repository file tree structure")
+    file_tree_truncated: bool = Field(
+        False,
+        description="True when file_tree was omitted or the depth limit left "
+        "out folder contents; fetch the rest from the tree endpoint",
+    )
     metadata: DocumentationMetadata = Field(..., description="Repository metadata")
 
     class Config:
@@ -0,0 +1,38 @@
+"""
+Pydantic models for search endpoints.
+"""
+
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class CrossRepoQueryRequest(BaseModel):
+    """
+    Request body for searching several repositories at once.
+    """
+
+    repo_names: List[str] = Field(
+        ..., description="Repositories to search", min_length=1
+    )
+    question: str = Field(..., description="Search query or question")
+    n_results: int = Field(10, description="Number of merged results", ge=1, le=100)
+    per_repo_limit: Optional[int] = Field(
+        None, description="Maximum results taken from any one repository", ge=1
+    )
+    filter_metadata: Optional[Dict] = Field(
+        None, description="Metadata filters applied in every repository"
+    )
+    generate_answer: bool = Field(
+        False, description="Also generate an answer over the merged context"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "repo_names": ["payments", "gateway", "web"],
+                "question": "Where do we call the billing service?",
+                "n_results": 10,
+                "per_repo_limit": 4,
+                "generate_answer": False,
+            }
+        }
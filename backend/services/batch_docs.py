@@ -0,0 +1,411 @@
+"""
+Batch pre-generation of file documentation for an entire repository.
+
+Docs are generated ahead of time (all files, or the top-N most referenced
+ones) and persisted in the doc store, so the file docs endpoint can serve them
+without an LLM call. Generation runs either on a bounded thread pool or as
+OpenAI Batch API jobs; LocalBatchRunner executes the same JSONL batch format
+in-process for testing.
+"""
+
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import io
+import json
+import logging
+import re
+import time
+import uuid
+
+from services.doc_generation import (
+    DOCS_MODEL,
+    MAP_MAX_TOKENS,
+    REDUCE_MAX_CHARS,
+    SINGLE_PASS_MAX_CHARS,
+    chunk_summary_messages,
+    file_docs_messages,
+    generate_file_docs,
+    reduce_messages,
+    reduce_summaries,
+)
+from services.doc_store import list_documented_files, save_file_docs
+from services.embeddings import get_openai_client
+from services.retrieval import get_all_files, get_file_chunks, iter_repo_chunks
+from services.summary_cache import (
+    file_sections,
+    get_cached_summaries,
+    store_summary,
+    summary_key,
+)
+
+logger = logging.getLogger(__name__)
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_\-]*")
+
+
+def rank_files_by_centrality(repo_name: str) -> List[str]:
+    """
+    Rank a repository's files by how many other files reference them.
+
+    A file is referenced by another file when its stem ("retrieval" for
+    services/retrieval.py) appears as an identifier in that file's chunks.
+    Stems shared by several files (index, __init__, utils) split their score.
+
+    Returns:
+        File paths, most central first
+    """
+    identifiers_by_file: Dict[str, set] = defaultdict(set)
+    for chunk in iter_repo_chunks(repo_name):
+        file_path = chunk["metadata"].get("file_path")
+        if file_path:
+            identifiers_by_file[file_path].update(
+                _IDENTIFIER.findall(chunk["document"])
+            )
+
+    files_by_stem: Dict[str, List[str]] = defaultdict(list)
+    for file_path in identifiers_by_file:
+        files_by_stem[Path(file_path).stem].append(file_path)
+
+    referrers: Counter = Counter()
+    for identifiers in identifiers_by_file.values():
+        for stem in identifiers & files_by_stem.keys():
+            referrers[stem] += 1
+
+    scores = {}
+    for file_path, identifiers in identifiers_by_file.items():
+        stem = Path(file_path).stem
+        references = referrers[stem] - (1 if stem in identifiers else 0)
+        scores[file_path] = references / len(files_by_stem[stem])
+
+    return sorted(scores, key=lambda path: (-scores[path], path))
+
+
+class BatchRunner(ABC):
+    """
+    Executes chat-completion requests in the OpenAI Batch API JSONL format.
+    """
+
+    def run(self, requests: List[Dict]) -> Dict[str, str]:
+        """
+        Execute batch request lines and return custom_id -> completion text.
+
+        Requests that failed are absent from the result.
+        """
+        input_jsonl = "\n".join(json.dumps(request) for request in requests)
+        output_jsonl = self._execute(input_jsonl)
+
+        contents = {}
+        for line in output_jsonl.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                logger.warning(
+                    f"Batch request {record.get('custom_id')} failed: {record.get('error')}"
+                )
+                continue
+            contents[record["custom_id"]] = response["body"]["choices"][0]["message"][
+                "content"
+            ]
+        return contents
+
+    @abstractmethod
+    def _execute(self, input_jsonl: str) -> str:
+        """Run a JSONL batch input and return the batch output JSONL."""
+
+
+class OpenAIBatchRunner(BatchRunner):
+    """
+    Submits the batch to the OpenAI Batch API and polls until it finishes.
+    """
+
+    def __init__(self, poll_interval: float = 30.0, timeout: float = 24 * 3600):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def _execute(self, input_jsonl: str) -> str:
+        client = get_openai_client()
+        input_file = client.files.create(
+            file=("docs_batch.jsonl", io.BytesIO(input_jsonl.encode("utf-8"))),
+            purpose="batch",
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        logger.info(f"Submitted OpenAI batch {batch.id}")
+
+        deadline = time.monotonic() + self.timeout
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() > deadline:
+                client.batches.cancel(batch.id)
+                raise TimeoutError(f"OpenAI batch {batch.id} did not finish in time")
+            time.sleep(self.poll_interval)
+            batch = client.batches.retrieve(batch.id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(
+                f"OpenAI batch {batch.id} ended with status {batch.status}"
+            )
+
+        return client.files.content(batch.output_file_id).text
+
+
+class LocalBatchRunner(BatchRunner):
+    """
+    Executes Batch API JSONL in-process with a bounded thread pool.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+
+    def _execute(self, input_jsonl: str) -> str:
+        client = get_openai_client()
+        requests = [json.loads(line) for line in input_jsonl.splitlines() if line]
+
+        def execute(request: Dict) -> Dict:
+            record = {
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": None,
+                "error": None,
+            }
+            try:
+                response = client.chat.completions.create(**request["body"])
+                record["response"] = {
+                    "status_code": 200,
+                    "body": response.model_dump(),
+                }
+            except Exception as e:
+                record["error"] = {"code": type(e).__name__, "message": str(e)}
+            return record
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            records = list(pool.map(execute, requests))
+        return "\n".join(json.dumps(record) for record in records)
+
+
+def get_batch_runner(runner: str) -> BatchRunner:
+    if runner == "openai":
+        return OpenAIBatchRunner()
+    if runner == "local":
+        return LocalBatchRunner()
+    raise ValueError(f"Unknown batch runner: {runner}")
+
+
+def _batch_request(
+    custom_id: str, messages: List[Dict], max_tokens: int, temperature: float
+) -> Dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": DOCS_MODEL,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+    }
+
+
+def _docs_payload(
+    file_path: str, chunks: List[Dict], documentation: str, strategy: str
+) -> Dict:
+    return {
+        "file_path": file_path,
+        "language": chunks[0]["metadata"].get("language", "unknown"),
+        "documentation": documentation,
+        "strategy": strategy,
+        "chunks_covered": len(chunks),
+    }
+
+
+def _pregenerate_with_batches(
+    repo_name: str, file_paths: List[str], runner: BatchRunner
+) -> Tuple[List[str], List[str]]:
+    """
+    Generate docs in two batches: (1) single-pass docs for small files plus
+    uncached section summaries of large files, (2) reduce calls for large files.
+    """
+    documented, failed = [], []
+    file_chunks = {path: get_file_chunks(repo_name, path) for path in file_paths}
+    file_chunks = {path: chunks for path, chunks in file_chunks.items() if chunks}
+
+    single_pass, map_reduce = {}, {}
+    map_requests, summary_targets, requested_keys = [], {}, set()
+    for n, (file_path, chunks) in enumerate(file_chunks.items()):
+        language = chunks[0]["metadata"].get("language", "unknown")
+        if sum(len(c["document"]) for c in chunks) <= SINGLE_PASS_MAX_CHARS:
+            custom_id = f"file-{n}"
+            single_pass[custom_id] = file_path
+            code = "\n\n".join(c["document"] for c in chunks)
+            map_requests.append(
+                _batch_request(
+                    custom_id, file_docs_messages(file_path, language, code), 800, 0.7
+                )
+            )
+            continue
+
+        sections = file_sections(chunks)
+        keys = [summary_key(section, DOCS_MODEL) for section in sections]
+        map_reduce[file_path] = keys
+        cached = get_cached_summaries(keys)
+        for i, (section, key) in enumerate(zip(sections, keys)):
+            if key in cached or key in requested_keys:
+                continue
+            custom_id = f"section-{n}-{i}"
+            summary_targets[custom_id] = key
+            requested_keys.add(key)
+            messages = chunk_summary_messages(
+                file_path, language, i, len(sections), section
+            )
+            map_requests.append(
+                _batch_request(custom_id, messages, MAP_MAX_TOKENS, 0.2)
+            )
+
+    outputs = runner.run(map_requests) if map_requests else {}
+
+    for custom_id, key in summary_targets.items():
+        if custom_id in outputs:
+            store_summary(key, DOCS_MODEL, outputs[custom_id])
+
+    for custom_id, file_path in single_pass.items():
+        if custom_id in outputs:
+            payload = _docs_payload(
+                file_path, file_chunks[file_path], outputs[custom_id], "single_pass"
+            )
+            save_file_docs(repo_name, file_path, payload)
+            documented.append(file_path)
+        else:
+            failed.append(file_path)
+
+    reduce_requests, reduce_targets = [], {}
+    for n, (file_path, keys) in enumerate(map_reduce.items()):
+        summaries = get_cached_summaries(keys)
+        if len(summaries) < len(set(keys)):
+            failed.append(file_path)
+            continue
+        ordered = [summaries[key] for key in keys]
+        language = file_chunks[file_path][0]["metadata"].get("language", "unknown")
+
+        if sum(len(s) for s in ordered) > REDUCE_MAX_CHARS:
+            # Too large for one reduce prompt; collapse synchronously instead
+            try:
+                docs = reduce_summaries(file_path, language, ordered)
+                save_file_docs(
+                    repo_name,
+                    file_path,
+                    _docs_payload(
+                        file_path, file_chunks[file_path], docs, "map_reduce"
+                    ),
+                )
+                documented.append(file_path)
+            except Exception as e:
+                logger.error(f"Reduce failed for {file_path}: {type(e).__name__}: {e}")
+                failed.append(file_path)
+            continue
+
+        custom_id = f"reduce-{n}"
+        reduce_targets[custom_id] = file_path
+        reduce_requests.append(
+            _batch_request(
+                custom_id, reduce_messages(file_path, language, ordered), 800, 0.7
+            )
+        )
+
+    outputs = runner.run(reduce_requests) if reduce_requests else {}
+    for custom_id, file_path in reduce_targets.items():
+        if custom_id in outputs:
+            payload = _docs_payload(
+                file_path, file_chunks[file_path], outputs[custom_id], "map_reduce"
+            )
+            save_file_docs(repo_name, file_path, payload)
+            documented.append(file_path)
+        else:
+            failed.append(file_path)
+
+    return documented, failed
+
+
+def _pregenerate_with_pool(
+    repo_name: str, file_paths: List[str], max_workers: int
+) -> Tuple[List[str], List[str]]:
+    documented, failed = [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(generate_file_docs, repo_name, file_path): file_path
+            for file_path in file_paths
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                save_file_docs(repo_name, file_path, future.result())
+                documented.append(file_path)
+            except Exception as e:
+                logger.error(
+                    f"Failed to pre-generate docs for {file_path}: {type(e).__name__}: {e}"
+                )
+                failed.append(file_path)
+    return documented, failed
+
+
+def pregenerate_repo_docs(
+    repo_name: str,
+    top_n: Optional[int] = None,
+    max_workers: int = 4,
+    runner: Optional[str] = None,
+    skip_existing: bool = True,
+) -> Dict:
+    """
+    Pre-generate and persist file documentation for a repository.
+
+    Args:
+        repo_name: Name of the repository
+        top_n: Only document the N most central files (default: all files)
+        max_workers: Size of the worker pool when not using a batch runner
+        runner: None for the thread pool, "openai" for the Batch API, "local"
+            for the in-process Batch API stand-in
+        skip_existing: Skip files that already have stored docs
+
+    Returns:
+        Report with counts of documented, skipped and failed files
+    """
+    started = time.monotonic()
+
+    if top_n is not None:
+        file_paths = rank_files_by_centrality(repo_name)[:top_n]
+    else:
+        file_paths = sorted(f["file_path"] for f in get_all_files(repo_name))
+
+    existing = list_documented_files(repo_name) if skip_existing else set()
+    pending = [path for path in file_paths if path not in existing]
+
+    logger.info(
+        f"Pre-generating docs for {len(pending)} files of {repo_name} "
+        f"({len(file_paths) - len(pending)} already stored, runner={runner or 'pool'})"
+    )
+
+    if runner:
+        documented, failed = _pregenerate_with_batches(
+            repo_name, pending, get_batch_runner(runner)
+        )
+    else:
+        documented, failed = _pregenerate_with_pool(repo_name, pending, max_workers)
+
+    report = {
+        "repo_name": repo_name,
+        "files_considered": len(file_paths),
+        "files_skipped": len(file_paths) - len(pending),
+        "files_documented": len(documented),
+        "failed": failed,
+        "runner": runner or "pool",
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+    }
+    logger.info(f"Pre-generation finished for {repo_name}: {report}")
+    return report
@@ -1,27 +1,36 @@
-import chromadb
-from chromadb.api import ClientAPI
-from chromadb.api.models.Collection import Collection
+from typing import TYPE_CHECKING, Optional
+
 from fastapi import Depends
 
 from ..config import get_chroma_settings
 
-_client: ClientAPI | None = None
-_collection: Collection | None = None
-_SETTINGS = get_chroma_settings()
+if TYPE_CHECKING:
+    from chromadb.api import ClientAPI
+    from chromadb.api.models.Collection import Collection
+
+_client: Optional["ClientAPI"] = None
+_collection: Optional["Collection"] = None
 
 
-def get_chroma_client() -> ClientAPI:
+def get_chroma_client() -> "ClientAPI":
     global _client
     if _client is None:
+        import chromadb
+
+        # Settings are read on first use, so importing this module never
+        # fails when the environment is not configured yet
+        settings = get_chroma_settings()
         _client = chromadb.CloudClient(
-            api_key=_SETTINGS.api_key,
-            tenant=_SETTINGS.tenant,
-            database=_SETTINGS.database,
+            api_key=settings.api_key,
+            tenant=settings.tenant,
+            database=settings.database,
         )
     return _client
 
 
-def get_chroma_collection(client: ClientAPI = Depends(get_chroma_client)) -> Collection:
+def get_chroma_collection(
+    client: "ClientAPI" = Depends(get_chroma_client),
+) -> "Collection":
     global _collection
     if _collection is None:
         _collection = client.get_or_create_collection(name="my_collection")
@@ -1,41 +1,161 @@
-from typing import Any, Mapping, Sequence, List, Dict
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Mapping,
+    Sequence,
+    List,
+    Dict,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
 
-import chromadb
-from chromadb.api import ClientAPI
-from chromadb.api.models.Collection import Collection
+from config import (
+    get_chroma_pool_settings,
+    get_chroma_settings,
+    get_dedup_settings,
+    get_ingest_settings,
+    get_local_chroma_settings,
+)
+from services.embedding_providers import (
+    EmbeddingProvider,
+    EmbeddingProviderError,
+    get_embedding_provider,
+    provider_for_metadata,
+)
+from services.repo_registry import RepoRegistry, new_index_run
 
-from config import get_chroma_settings
-from services.embeddings import generate_embeddings
+if TYPE_CHECKING:
+    from chromadb.api import ClientAPI
+    from chromadb.api.models.Collection import Collection
 
-_client: ClientAPI | None = None
+logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
 
-def get_chroma_client() -> ClientAPI:
+_client: Optional["ClientAPI"] = None
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_registry: RepoRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_chroma_client() -> "ClientAPI":
     """
-    Return a singleton Chroma Cloud client.
+    Return a singleton Chroma Cloud client (or an in-process one when
+    CHROMA_LOCAL_PATH is set).
+
+    The client's HTTP connection pool is sized from ChromaPoolSettings so that
+    every thread of the Chroma executor can hold a keep-alive connection.
+    chromadb is imported on first use to keep startup fast.
     """
     global _client
     if _client is None:
+        import chromadb
+        from chromadb.config import Settings
+
+        local_path = get_local_chroma_settings().path
+        if local_path == ":memory:":
+            _client = chromadb.EphemeralClient()
+            return _client
+        if local_path is not None:
+            _client = chromadb.PersistentClient(path=local_path)
+            return _client
+
         settings = get_chroma_settings()
+        pool = get_chroma_pool_settings()
         _client = chromadb.CloudClient(
             api_key=settings.api_key,
             tenant=settings.tenant,
             database=settings.database,
+            settings=Settings(
+                chroma_http_max_connections=pool.max_connections,
+                chroma_http_max_keepalive_connections=pool.max_connections,
+                chroma_http_keepalive_secs=pool.keepalive_seconds,
+            ),
         )
     return _client
 
 
-def get_repo_collection(repo_id: str, *, client: ClientAPI | None = None) -> Collection:
+def get_chroma_executor() -> ThreadPoolExecutor:
+    """
+    Return the bounded thread pool that runs blocking Chroma calls for async code.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_chroma_pool_settings().max_workers,
+                thread_name_prefix="chroma",
+            )
+        return _executor
+
+
+async def run_in_chroma_pool(
+    fn: Callable[..., T], *args: Any, timeout: Optional[float] = None, **kwargs: Any
+) -> T:
+    """
+    Run a blocking retrieval call on the Chroma executor without blocking the
+    event loop.
+
+    Args:
+        fn: Blocking function to run
+        timeout: Seconds to wait before raising asyncio.TimeoutError
+            (default: ChromaPoolSettings.timeout_seconds)
+
+    Note:
+        On timeout the caller stops waiting, but the worker thread finishes
+        its call in the background; the pool bound keeps such stragglers from
+        piling up without limit.
+    """
+    loop = asyncio.get_running_loop()
+    # Carry the request's deadline (services.resilience) into the worker
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    if timeout is None:
+        timeout = get_chroma_pool_settings().timeout_seconds
+    return await asyncio.wait_for(
+        loop.run_in_executor(get_chroma_executor(), call), timeout
+    )
+
+
+def get_repo_registry() -> RepoRegistry:
+    """
+    Return the process-wide repo registry (collection-handle cache + lifecycle).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = RepoRegistry(
+                get_chroma_client,
+                ttl_seconds=get_chroma_pool_settings().collection_ttl_seconds,
+            )
+        return _registry
+
+
+def get_repo_collection(
+    repo_id: str, *, client: Optional["ClientAPI"] = None
+) -> "Collection":
     """
     Lazy-create a per-repo collection following the `repo_{id}` convention.
+
+    Handles from the default client are cached by the repo registry, so
+    `get_or_create_collection` is not issued on every query.
     """
-    active_client = client or get_chroma_client()
-    name = f"repo_{repo_id}"
-    return active_client.get_or_create_collection(name=name)
+    if client is not None:
+        return client.get_or_create_collection(name=f"repo_{repo_id}")
+    return get_repo_registry().get_collection(repo_id)
 
 
 def upsert_documents(
-    collection: Collection,
+    collection: "Collection",
     *,
     ids: Sequence[str],
     embeddings: Sequence[Sequence[float]],
@@ -53,40 +173,238 @@ def upsert_documents(
     )
 
 
-def index_repository(repo_name: str, chunks: List[Dict]) -> Dict[str, Any]:
+def index_repository(
+    repo_name: str,
+    chunks: List[Dict],
+    *,
+    commit_sha: Optional[str] = None,
+    repo_url: Optional[str] = None,
+    provider: Optional[EmbeddingProvider] = None,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    index_run: Optional[str] = None,
+    resume_from: int = 0,
+) -> Dict[str, Any]:
     """
-    Index a repository's chunks into ChromaDB with OpenAI embeddings.
+    Index a repository's chunks into ChromaDB, committing them in order.
+
+    Chunks should arrive highest-value first (see services.prioritization):
+    the repo is marked "partial" and queryable after the first batch.
 
     Args:
         repo_name: Name of the repository (used for collection ID)
         chunks: List of chunk dictionaries containing 'id', 'document', and 'metadata'
+        commit_sha: Commit the chunks were taken from, recorded in the registry
+        repo_url: Source URL, recorded in the registry
+        provider: Embedding provider (default: the configured one)
+        batch_size: Chunks embedded and committed per batch
+            (default: INGEST_COMMIT_BATCH_CHUNKS)
+        on_progress: Called with (chunks committed, total) after each batch
+        index_run: Run id to write under (default: a new run); pass the
+            interrupted run's id together with resume_from to resume it
+        resume_from: Number of leading chunks already committed by that run
 
     Returns:
         Dictionary with indexing status and metadata
     """
     # Get or create collection for this repo
+    registry = get_repo_registry()
     collection = get_repo_collection(repo_name)
+    index_run = index_run or new_index_run()
+    provider = provider or get_embedding_provider()
 
-    # Extract data from chunks
-    ids = [chunk["id"] for chunk in chunks]
-    documents = [chunk["document"] for chunk in chunks]
-    metadatas = [chunk["metadata"] for chunk in chunks]
-
-    # Generate embeddings using OpenAI
-    embeddings = generate_embeddings(documents)
-
-    # Upsert to ChromaDB
-    upsert_documents(
-        collection,
-        ids=ids,
-        embeddings=embeddings,
-        documents=documents,
-        metadatas=metadatas,
-    )
+    ensure_compatible_provider(repo_name, collection, provider)
+
+    ids, documents, metadatas, representatives = prepare_chunks(chunks, index_run)
+    group_sizes = Counter(representatives)
+
+    # Commit in batches so the repo is searchable while the rest is embedded.
+    # Representatives come first in their group, so every member's vector
+    # is available by the time its batch is written.
+    batch_size = batch_size or get_ingest_settings().commit_batch_chunks
+    embeddings: Dict[int, List[float]] = {}
+    embedded = 0
+    reused = 0
+    total = len(chunks)
+
+    if resume_from:
+        # Members of groups whose representative was already committed reuse
+        # the stored vector instead of re-embedding it
+        needed = sorted(
+            {rep for rep in representatives[resume_from:] if rep < resume_from}
+        )
+        if needed:
+            stored = collection.get(
+                ids=[ids[i] for i in needed], include=["embeddings"]
+            )
+            position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+            embeddings.update(
+                (position[chunk_id], list(vector))
+                for chunk_id, vector in zip(stored["ids"], stored["embeddings"])
+            )
+            missing = [i for i in needed if i not in embeddings]
+            embeddings.update(
+                zip(missing, provider.embed([documents[i] for i in missing]))
+            )
+        logger.info(
+            f"Resuming {repo_name} run {index_run} at chunk {resume_from}/{total}"
+        )
+
+    for start in range(resume_from, total, batch_size):
+        end = min(start + batch_size, total)
+        pending = [i for i in range(start, end) if representatives[i] == i]
+        vectors, batch_reused = embed_chunks(
+            collection,
+            provider,
+            [ids[i] for i in pending],
+            [documents[i] for i in pending],
+        )
+        embeddings.update((i, vectors[ids[i]]) for i in pending)
+        embedded += len(pending) - batch_reused
+        reused += batch_reused
+
+        upsert_documents(
+            collection,
+            ids=ids[start:end],
+            embeddings=[embeddings[representatives[i]] for i in range(start, end)],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+        )
+
+        registry.record_index(
+            repo_name,
+            chunk_count=end,
+            index_run=index_run,
+            index_status="ready" if end == total else "partial",
+            searchable_fraction=end / total,
+            **provider.describe(),
+            commit_sha=commit_sha,
+            repo_url=repo_url,
+        )
+        if on_progress is not None:
+            on_progress(end, total)
+
+    if not chunks:
+        registry.record_index(
+            repo_name,
+            chunk_count=0,
+            index_run=index_run,
+            **provider.describe(),
+            commit_sha=commit_sha,
+            repo_url=repo_url,
+        )
 
     return {
         "repo_name": repo_name,
-        "collection_name": f"repo_{repo_name}",
+        "collection_name": collection.name,
         "chunks_indexed": len(chunks),
+        "chunks_embedded": embedded,
+        "chunks_reused": reused,
+        "resumed_from": resume_from,
+        "duplicate_groups": sum(1 for size in group_sizes.values() if size > 1),
+        "commit_sha": commit_sha,
+        "index_run": index_run,
+        **provider.describe(),
         "status": "success",
     }
+
+
+def ensure_compatible_provider(
+    repo_name: str, collection: "Collection", provider: EmbeddingProvider
+) -> None:
+    """
+    Vectors from different embedders are not comparable; refuse to add
+    `provider`'s vectors to a collection indexed with another one.
+
+    Raises:
+        EmbeddingProviderError: If the repo is indexed with another provider
+    """
+    existing = provider_for_metadata(collection.metadata)
+    if existing.describe() != provider.describe() and collection.count() > 0:
+        raise EmbeddingProviderError(
+            f"{repo_name} is indexed with {existing.name}/{existing.model}; "
+            f"migrate it (POST /api/repos/{repo_name}/migrate) or delete it before "
+            f"re-indexing with {provider.name}/{provider.model}"
+        )
+
+
+def prepare_chunks(
+    chunks: List[Dict], index_run: str
+) -> Tuple[List[str], List[str], List[Dict[str, Any]], List[int]]:
+    """
+    Split chunks into the ids, documents and metadatas written to Chroma, and
+    group near-duplicates (see services.dedup), which share their
+    representative's embedding.
+
+    Returns:
+        (ids, documents, metadatas, representatives), where representatives[i]
+        is the index of chunk i's group representative (always <= i)
+    """
+    ids = [chunk["id"] for chunk in chunks]
+    documents = [chunk["document"] for chunk in chunks]
+    # Stamp each chunk with this run so compaction can find leftovers of older runs
+    metadatas = [{**chunk["metadata"], "index_run": index_run} for chunk in chunks]
+
+    if get_dedup_settings().enabled:
+        from services.dedup import group_near_duplicates
+
+        representatives = group_near_duplicates(
+            documents, get_dedup_settings().threshold
+        )
+    else:
+        representatives = list(range(len(documents)))
+    group_sizes = Counter(representatives)
+    for i, representative in enumerate(representatives):
+        if group_sizes[representative] > 1:
+            metadatas[i]["dup_group"] = ids[representative]
+            metadatas[i]["dup_group_size"] = group_sizes[representative]
+    return ids, documents, metadatas, representatives
+
+
+def embed_chunks(
+    collection: "Collection",
+    provider: EmbeddingProvider,
+    ids: List[str],
+    documents: List[str],
+) -> Tuple[Dict[str, List[float]], int]:
+    """
+    Vectors of the given chunks keyed by id. Chunks whose text did not change
+    since the last run keep their stored vector; the rest are embedded.
+
+    Returns:
+        (vectors by id, number of stored vectors reused)
+    """
+    vectors = _unchanged_embeddings(collection, ids, documents)
+    reused = len(vectors)
+    pending = [i for i, chunk_id in enumerate(ids) if chunk_id not in vectors]
+    vectors.update(
+        zip([ids[i] for i in pending], provider.embed([documents[i] for i in pending]))
+    )
+    return vectors, reused
+
+
+def _unchanged_embeddings(
+    collection: "Collection", ids: List[str], documents: List[str]
+) -> Dict[str, List[float]]:
+    """
+    Stored vectors of the given chunks whose text is unchanged, keyed by id,
+    so re-indexing a repo only embeds what changed since its last run.
+    """
+    if not ids:
+        return {}
+    stored = collection.get(ids=ids, include=["documents", "embeddings"])
+    expected = dict(zip(ids, documents))
+    return {
+        chunk_id: list(vector)
+        for chunk_id, document, vector in zip(
+            stored["ids"], stored["documents"], stored["embeddings"]
+        )
+        if expected.get(chunk_id) == document
+    }
+
+
+def get_repo_embedding_provider(repo_name: str) -> EmbeddingProvider:
+    """
+    Return the provider a repo was indexed with, for embedding its queries.
+    """
+    return provider_for_metadata(get_repo_collection(repo_name).metadata)
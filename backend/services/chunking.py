@@ -4,6 +4,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
 
 class ChunkingError(Exception):
     """Raised when chunking fails for a specific file."""
@@ -14,8 +17,8 @@ class ChunkingError(Exception):
 def chunk_files(
     file_objects: List[Dict],
     repo_name: str,
-    chunk_size: int = 1000,
-    overlap: int = 200,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
 ) -> List[Dict]:
     """
     Chunk files into smaller pieces for embedding.
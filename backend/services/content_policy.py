@@ -0,0 +1,307 @@
+"""
+Content policy stage between loading and chunking.
+
+Drops files that would cost embedding tokens without helping retrieval:
+lockfiles, vendored and build output, snapshots, generated code (by name,
+header marker or `.gitattributes` linguist hints), minified bundles and
+high-entropy data blobs. Every decision is counted in an ingest report.
+"""
+
+from collections import Counter
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+import math
+
+from config import ContentPolicySettings, get_content_policy_settings
+from services.preprocessing import relative_source
+
+logger = logging.getLogger(__name__)
+
+# Rough size of an embedding token in characters, for the report
+CHARS_PER_TOKEN = 4
+
+LOCKFILE_PATTERNS = (
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "bun.lockb",
+    "composer.lock",
+    "Gemfile.lock",
+    "Cargo.lock",
+    "poetry.lock",
+    "Pipfile.lock",
+    "uv.lock",
+    "go.sum",
+    "*.lock",
+)
+VENDORED_PATTERNS = (
+    "vendor/*",
+    "third_party/*",
+    "third-party/*",
+    "node_modules/*",
+    "bower_components/*",
+    "dist/*",
+    # Generic names; only build output at the repo root, not e.g. src/build/
+    "/build/*",
+    "/out/*",
+    ".next/*",
+    "coverage/*",
+)
+GENERATED_PATTERNS = (
+    "*.min.js",
+    "*.min.css",
+    "*.bundle.js",
+    "*.map",
+    "*.snap",
+    "__snapshots__/*",
+    "*.pb.go",
+    "*_pb2.py",
+    "*_pb2_grpc.py",
+    "*.generated.*",
+    "*.g.dart",
+)
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "auto-generated", "autogenerated")
+# Generated-code markers only count in a file's leading comment block, which
+# is read up to this many lines
+HEADER_MAX_LINES = 40
+LINE_COMMENT_PREFIXES = ("#", "//", "--", ";", "%")
+BLOCK_COMMENTS = (("/*", "*/"), ("<!--", "-->"), ('"""', '"""'), ("'''", "'''"))
+# In prose "#" starts a heading, so only HTML comments form a header there
+PROSE_BLOCK_COMMENTS = (("<!--", "-->"),)
+
+# Unwrapped paragraphs are normal in prose; only code is checked for minification
+PROSE_EXTENSIONS = (".md", ".markdown", ".rst", ".txt", ".adoc", ".asciidoc")
+# Besides a high average line length, minified code is large and made of very
+# long lines: a share of them, or one huge line
+MINIFIED_MIN_CHARS = 2048
+LONG_LINE_CHARS = 1000
+MINIFIED_LONG_LINE_SHARE = 0.5
+MINIFIED_MAX_LINE_CHARS = 10000
+
+# Entropy is only meaningful once a file has enough characters. It is taken
+# over ASCII, the alphabet of encoded blobs (base64, hex); text with a larger
+# share of other characters (e.g. CJK prose) is not checked
+ENTROPY_MIN_CHARS = 2048
+ENTROPY_MAX_NON_ASCII_SHARE = 0.1
+
+
+def _matches(path: str, pattern: str) -> bool:
+    """
+    Glob match against a repo-relative path. Patterns without a slash match
+    the file name; patterns ending in "/*" match that directory at any depth,
+    or only at the repo root if they start with "/".
+    """
+    if pattern.endswith("/*"):
+        directory = pattern[:-2]
+        if directory.startswith("/"):
+            return f"/{path}".startswith(f"{directory}/")
+        return f"/{directory}/" in f"/{path}"
+    if "/" not in pattern:
+        return fnmatch(path.rsplit("/", 1)[-1], pattern)
+    return fnmatch(path, pattern)
+
+
+def parse_gitattributes(text: str) -> List[Tuple[str, str]]:
+    """
+    Extract (pattern, rule) pairs for linguist-generated / linguist-vendored.
+    """
+    rules = []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        pattern = fields[0].lstrip("/")
+        if pattern.endswith("/**"):
+            pattern = pattern[:-3] + "/*"
+        for attribute in fields[1:]:
+            name, _, value = attribute.partition("=")
+            if name in ("linguist-generated", "linguist-vendored") and value not in (
+                "false",
+                "0",
+            ):
+                rules.append((pattern, name))
+    return rules
+
+
+def _is_prose(path: str) -> bool:
+    return path.lower().endswith(PROSE_EXTENSIONS)
+
+
+def _leading_comment(content: str, prose: bool = False) -> str:
+    """
+    The comment block a file starts with (after a shebang or blank lines),
+    where tools put their "generated" headers.
+    """
+    line_prefixes = () if prose else LINE_COMMENT_PREFIXES
+    blocks = PROSE_BLOCK_COMMENTS if prose else BLOCK_COMMENTS
+    header = []
+    closing = None
+    for line in content.splitlines()[:HEADER_MAX_LINES]:
+        stripped = line.strip()
+        if closing is not None:
+            header.append(stripped)
+            if closing in stripped:
+                closing = None
+            continue
+        if not stripped or (not header and stripped.startswith("#!")):
+            continue
+        block = next((pair for pair in blocks if stripped.startswith(pair[0])), None)
+        if block is not None:
+            header.append(stripped)
+            opening, end = block
+            if end not in stripped[len(opening) :]:
+                closing = end
+        elif line_prefixes and stripped.startswith(line_prefixes):
+            header.append(stripped)
+        else:
+            break
+    return "\n".join(header)
+
+
+def _looks_minified(path: str, content: str, max_avg_line_length: int) -> bool:
+    if _is_prose(path) or len(content) < MINIFIED_MIN_CHARS:
+        return False
+    lines = content.splitlines() or [content]
+    if len(content) / len(lines) <= max_avg_line_length:
+        return False
+    lengths = [len(line) for line in lines]
+    long_lines = sum(1 for length in lengths if length >= LONG_LINE_CHARS)
+    return (
+        long_lines / len(lines) >= MINIFIED_LONG_LINE_SHARE
+        or max(lengths) >= MINIFIED_MAX_LINE_CHARS
+    )
+
+
+def _entropy(text: str) -> Optional[float]:
+    """
+    Shannon entropy (bits per character) of the text's ASCII characters, or
+    None if too much of it is non-ASCII for that to mean anything.
+    """
+    data = text.encode("ascii", errors="ignore")
+    if len(data) < len(text) * (1 - ENTROPY_MAX_NON_ASCII_SHARE):
+        return None
+    counts = Counter(data)
+    total = len(data)
+    return -sum(n / total * math.log2(n / total) for n in counts.values())
+
+
+class ContentPolicy:
+    """
+    Decides which loaded files are worth chunking and embedding.
+    """
+
+    def __init__(
+        self,
+        settings: ContentPolicySettings,
+        attribute_rules: Optional[List[Tuple[str, str]]] = None,
+    ):
+        self.settings = settings
+        self.attribute_rules = attribute_rules or []
+        self.name_rules = (
+            [(pattern, "lockfile") for pattern in LOCKFILE_PATTERNS]
+            + [(pattern, "vendored") for pattern in VENDORED_PATTERNS]
+            + [(pattern, "generated") for pattern in GENERATED_PATTERNS]
+            + [(pattern, "pattern") for pattern in settings.extra_skip_patterns]
+        )
+
+    @classmethod
+    def for_repo(
+        cls, repo_dir: str, settings: Optional[ContentPolicySettings] = None
+    ) -> "ContentPolicy":
+        """Build the policy for a checkout, including its .gitattributes hints."""
+        attributes = Path(repo_dir) / ".gitattributes"
+        rules = []
+        if attributes.is_file():
+            rules = parse_gitattributes(
+                attributes.read_text(encoding="utf-8", errors="ignore")
+            )
+        return cls(settings or get_content_policy_settings(), rules)
+
+    def skip_reason(self, path: str, content: str) -> Optional[str]:
+        """
+        Return the rule that excludes a file, or None to keep it.
+
+        Args:
+            path: Repo-relative path with "/" separators
+            content: File text
+        """
+        for pattern, rule in self.name_rules:
+            if _matches(path, pattern):
+                return rule
+        for pattern, rule in self.attribute_rules:
+            if _matches(path, pattern):
+                return rule
+
+        if len(content.encode("utf-8", errors="ignore")) > self.settings.max_file_bytes:
+            return "too_large"
+
+        header = _leading_comment(content, prose=_is_prose(path))
+        if any(marker in header for marker in GENERATED_MARKERS):
+            return "generated_header"
+
+        if _looks_minified(path, content, self.settings.max_avg_line_length):
+            return "minified"
+
+        if len(content) >= ENTROPY_MIN_CHARS:
+            entropy = _entropy(content)
+            if entropy is not None and entropy > self.settings.max_entropy:
+                return "high_entropy"
+        return None
+
+
+def apply_content_policy(
+    docs: List[Dict], repo_dir: str, policy: Optional[ContentPolicy] = None
+) -> Tuple[List[Dict], Dict]:
+    """
+    Filter loaded files (as returned by load_files) before chunking.
+
+    Args:
+        docs: File dictionaries with "source" and "content"
+        repo_dir: Checkout root, for repo-relative matching and .gitattributes
+        policy: Policy to apply (default: ContentPolicy.for_repo(repo_dir))
+
+    Returns:
+        (kept docs, report) where the report counts files and estimated tokens
+        kept and skipped, with a per-rule breakdown
+    """
+    policy = policy or ContentPolicy.for_repo(repo_dir)
+    kept: List[Dict] = []
+    report = {
+        "files_kept": 0,
+        "files_skipped": 0,
+        "estimated_tokens_kept": 0,
+        "estimated_tokens_skipped": 0,
+        "skipped_by_rule": {},
+    }
+
+    for doc in docs:
+        tokens = len(doc["content"]) // CHARS_PER_TOKEN
+        reason = None
+        if policy.settings.enabled:
+            path = relative_source(doc, repo_dir)
+            reason = policy.skip_reason(path, doc["content"])
+
+        if reason is None:
+            kept.append(doc)
+            report["files_kept"] += 1
+            report["estimated_tokens_kept"] += tokens
+            continue
+
+        report["files_skipped"] += 1
+        report["estimated_tokens_skipped"] += tokens
+        rule = report["skipped_by_rule"].setdefault(
+            reason, {"files": 0, "estimated_tokens": 0, "examples": []}
+        )
+        rule["files"] += 1
+        rule["estimated_tokens"] += tokens
+        if len(rule["examples"]) < 5:
+            rule["examples"].append(path)
+
+    logger.info(
+        f"Content policy kept {report['files_kept']} files, skipped "
+        f"{report['files_skipped']} (~{report['estimated_tokens_skipped']} tokens)"
+    )
+    return kept, report
@@ -0,0 +1,118 @@
+"""
+Near-duplicate chunk detection with MinHash + LSH.
+
+Copy-pasted modules, generated clients and per-package boilerplate produce
+chunks that are nearly identical. Grouping them at index time lets us embed
+one representative per group (members reuse its vector); retrieval
+collapses each group to a single hit.
+"""
+
+from typing import Dict, List, Sequence
+import hashlib
+import logging
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates
+SHINGLE_SIZE = 5
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+_rng = np.random.default_rng(20240601)
+# Multiply-shift hashing: odd multipliers, wrapping uint64 arithmetic
+_A = _rng.integers(0, 2**63, NUM_PERMUTATIONS, dtype=np.uint64) << np.uint64(1)
+_A |= np.uint64(1)
+_B = _rng.integers(0, 2**63, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    tokens = _TOKEN.findall(text)
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = {" ".join(tokens)}
+    else:
+        shingles = {
+            " ".join(tokens[i : i + SHINGLE_SIZE])
+            for i in range(len(tokens) - SHINGLE_SIZE + 1)
+        }
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little"
+            )
+            for s in shingles
+        ],
+        dtype=np.uint64,
+    )
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    MinHash signature of a text's token 5-gram shingles.
+    """
+    hashes = _shingle_hashes(text)
+    with np.errstate(over="ignore"):
+        permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) >> np.uint64(32)
+    return permuted.min(axis=1)
+
+
+def estimated_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+def group_near_duplicates(
+    documents: Sequence[str], threshold: float = 0.9
+) -> List[int]:
+    """
+    Group documents whose estimated Jaccard similarity is at least `threshold`.
+
+    Returns:
+        For each document, the index of its group's representative (the
+        group's first document). Unique documents are their own representative.
+    """
+    representatives = list(range(len(documents)))
+    exact: Dict[str, int] = {}
+    buckets: Dict[tuple, List[int]] = {}
+    signatures: Dict[int, np.ndarray] = {}
+    rows = NUM_PERMUTATIONS // BANDS
+
+    for i, document in enumerate(documents):
+        digest = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        if digest in exact:
+            representatives[i] = exact[digest]
+            continue
+        exact[digest] = i
+
+        signature = minhash_signature(document)
+        keys = [
+            (band, signature[band * rows : (band + 1) * rows].tobytes())
+            for band in range(BANDS)
+        ]
+        # Only earlier representatives are candidates, so groups never chain
+        for key in keys:
+            match = next(
+                (
+                    candidate
+                    for candidate in buckets.get(key, ())
+                    if estimated_jaccard(signature, signatures[candidate]) >= threshold
+                ),
+                None,
+            )
+            if match is not None:
+                representatives[i] = match
+                exact[digest] = match
+                break
+        else:
+            signatures[i] = signature
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+
+    duplicates = sum(1 for i, rep in enumerate(representatives) if rep != i)
+    logger.info(
+        f"Near-duplicate detection: {duplicates} of {len(documents)} chunks "
+        f"grouped under {len(documents) - duplicates} representatives"
+    )
+    return representatives
@@ -0,0 +1,518 @@
+"""
+Distributed ingest: the API process enqueues an ingest job's stages on the
+task queue (services.task_queue) and worker processes (ingest_worker.py)
+run them:
+
+    clone     clone the repo, load, filter and prioritize its files
+    chunk     chunk the files, group near-duplicates, split into batches;
+              enqueues one embed task per batch
+    embed     embed one batch, reusing stored vectors of unchanged chunks;
+              enqueues the batch's upsert
+    upsert    write one batch to Chroma; the repo is searchable from the first
+    finalize  mark the index ready, build the summary index, compact
+
+Stages pass their results on as blobs of the job, so any worker on any host
+can run any stage, and batches are embedded and upserted by as many workers
+as are running. Each stage keeps the first result written for it and task
+names are fixed, so a retried or re-leased stage redoes its work without
+changing the outcome. Workers lease later stages first: jobs in flight
+finish, and become searchable, before new ones start.
+"""
+
+from array import array
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import shutil
+import threading
+import uuid
+import zlib
+
+from starlette.concurrency import run_in_threadpool
+
+from config import (
+    get_hierarchy_settings,
+    get_ingest_queue_settings,
+    get_ingest_settings,
+)
+from services.chromadb_service import (
+    embed_chunks,
+    ensure_compatible_provider,
+    get_repo_collection,
+    get_repo_registry,
+    prepare_chunks,
+    upsert_documents,
+)
+from services.chunking import chunk_files
+from services.content_policy import apply_content_policy
+from services.embedding_providers import (
+    EmbeddingProviderError,
+    get_embedding_provider,
+    provider_for_metadata,
+)
+from services.hierarchy import build_summary_index
+from services.preprocessing import load_files
+from services.prioritization import prioritize_docs
+from services.repo_handler import clone_repo, scan_repo_files
+from services.repo_registry import new_index_run
+from services.task_queue import DEAD, DONE, Task, TaskQueue, get_task_queue
+
+logger = logging.getLogger(__name__)
+
+CLONE = "clone"
+CHUNK = "chunk"
+EMBED = "embed"
+UPSERT = "upsert"
+FINALIZE = "finalize"
+STAGES = (CLONE, CHUNK, EMBED, UPSERT, FINALIZE)
+LEASE_ORDER = tuple(reversed(STAGES))
+
+# Failures that a retry cannot fix
+PERMANENT_ERRORS = (EmbeddingProviderError,)
+
+
+class IngestStageError(RuntimeError):
+    """Raised when a stage of a distributed ingest failed for good."""
+
+
+def _dump(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, default=str).encode("utf-8"))
+
+
+def _load(data: Optional[bytes]) -> Any:
+    return json.loads(zlib.decompress(data)) if data is not None else None
+
+
+def _enqueue(queue: TaskQueue, group: str, name: str, kind: str, **payload) -> None:
+    queue.enqueue(
+        group,
+        name,
+        kind,
+        payload,
+        max_attempts=get_ingest_queue_settings().max_attempts,
+    )
+
+
+def _job(queue: TaskQueue, task: Task) -> Dict[str, Any]:
+    """repo_url, commit_sha, repo_name, compact and index_run of the task's ingest job."""
+    return _load(queue.get_blob(task.group, "job"))
+
+
+# --- stages ---
+
+
+def _clone(queue: TaskQueue, task: Task) -> None:
+    if queue.get_blob(task.group, "docs") is None:
+        job = _job(queue, task)
+        repo_dir, commit_sha = clone_repo(job["repo_url"], job.get("commit_sha"))
+        try:
+            docs = load_files(scan_repo_files(repo_dir), repo_dir)
+            docs, policy_report = apply_content_policy(docs, repo_dir)
+            docs = prioritize_docs(docs, repo_dir)
+        finally:
+            shutil.rmtree(repo_dir, ignore_errors=True)
+        queue.put_blob(
+            task.group,
+            "docs",
+            _dump(
+                {
+                    "docs": docs,
+                    "commit_sha": commit_sha,
+                    "content_policy": policy_report,
+                }
+            ),
+        )
+    _enqueue(queue, task.group, CHUNK, CHUNK)
+
+
+def _chunk(queue: TaskQueue, task: Task) -> None:
+    job = _job(queue, task)
+    repo_name = job["repo_name"]
+    manifest = _load(queue.get_blob(task.group, "manifest"))
+    if manifest is None:
+        cloned = _load(queue.get_blob(task.group, "docs"))
+        chunks = chunk_files(cloned["docs"], repo_name)
+        provider = get_embedding_provider()
+        ensure_compatible_provider(repo_name, get_repo_collection(repo_name), provider)
+
+        ids, documents, metadatas, representatives = prepare_chunks(
+            chunks, job["index_run"]
+        )
+        batch_size = get_ingest_settings().commit_batch_chunks
+        batch_sizes = []
+        for start in range(0, len(ids), batch_size):
+            batch = range(start, min(start + batch_size, len(ids)))
+            queue.put_blob(
+                task.group,
+                f"batch:{len(batch_sizes)}",
+                _dump(
+                    {
+                        "ids": ids[batch.start : batch.stop],
+                        "documents": documents[batch.start : batch.stop],
+                        "metadatas": metadatas[batch.start : batch.stop],
+                        "representatives": [ids[representatives[i]] for i in batch],
+                        # Every vector the batch needs; representatives in
+                        # earlier batches are usually stored by now
+                        "needed": {
+                            ids[representatives[i]]: documents[representatives[i]]
+                            for i in batch
+                        },
+                    }
+                ),
+            )
+            batch_sizes.append(len(batch))
+        manifest = {
+            "commit_sha": cloned["commit_sha"],
+            "embedding": provider.describe(),
+            "batch_sizes": batch_sizes,
+            "chunks_total": len(ids),
+            "duplicate_groups": sum(
+                1 for size in Counter(representatives).values() if size > 1
+            ),
+        }
+        queue.put_blob(task.group, "manifest", _dump(manifest))
+
+    for batch in range(len(manifest["batch_sizes"])):
+        _enqueue(queue, task.group, f"{EMBED}:{batch}", EMBED, batch=batch)
+
+
+def _embed(queue: TaskQueue, task: Task) -> None:
+    batch_number = task.payload["batch"]
+    if queue.get_blob(task.group, f"vectors:{batch_number}") is None:
+        batch = _load(queue.get_blob(task.group, f"batch:{batch_number}"))
+        manifest = _load(queue.get_blob(task.group, "manifest"))
+        needed = batch["needed"]
+        vectors, reused = embed_chunks(
+            get_repo_collection(_job(queue, task)["repo_name"]),
+            provider_for_metadata(manifest["embedding"]),
+            list(needed),
+            list(needed.values()),
+        )
+        flat = array("f")
+        for representative in batch["representatives"]:
+            flat.extend(vectors[representative])
+        queue.put_blob(
+            task.group,
+            f"embedded:{batch_number}",
+            _dump({"embedded": len(needed) - reused, "reused": reused}),
+        )
+        queue.put_blob(task.group, f"vectors:{batch_number}", flat.tobytes())
+    _enqueue(queue, task.group, f"{UPSERT}:{batch_number}", UPSERT, batch=batch_number)
+
+
+def _upsert(queue: TaskQueue, task: Task) -> None:
+    job = _job(queue, task)
+    repo_name = job["repo_name"]
+    batch_number = task.payload["batch"]
+    batch = _load(queue.get_blob(task.group, f"batch:{batch_number}"))
+    manifest = _load(queue.get_blob(task.group, "manifest"))
+    flat = array("f")
+    flat.frombytes(queue.get_blob(task.group, f"vectors:{batch_number}"))
+    dimensions = len(flat) // len(batch["ids"])
+    upsert_documents(
+        get_repo_collection(repo_name),
+        ids=batch["ids"],
+        embeddings=[
+            flat[i * dimensions : (i + 1) * dimensions].tolist()
+            for i in range(len(batch["ids"]))
+        ],
+        documents=batch["documents"],
+        metadatas=batch["metadatas"],
+    )
+
+    # A run that lost its lease may finish after the job did; it must not
+    # mark the finished index partial again
+    if not queue.extend(task, get_ingest_queue_settings().lease_seconds):
+        logger.warning(f"Stage {task.task_id} lost its lease; not recording progress")
+        return
+    others = [
+        entry for entry in queue.group_tasks(task.group) if entry["name"] != task.name
+    ]
+    committed = _committed_chunks(others, manifest) + len(batch["ids"])
+    get_repo_registry().record_index(
+        repo_name,
+        chunk_count=committed,
+        index_run=job["index_run"],
+        index_status="partial",
+        searchable_fraction=committed / manifest["chunks_total"],
+        **manifest["embedding"],
+        commit_sha=manifest["commit_sha"],
+        repo_url=job["repo_url"],
+    )
+
+
+def _finalize(queue: TaskQueue, task: Task) -> None:
+    if queue.get_blob(task.group, "result") is not None:
+        return
+    job = _job(queue, task)
+    repo_name = job["repo_name"]
+    index_run = job["index_run"]
+    manifest = _load(queue.get_blob(task.group, "manifest"))
+    cloned = _load(queue.get_blob(task.group, "docs"))
+    provider = provider_for_metadata(manifest["embedding"])
+    registry = get_repo_registry()
+
+    registry.record_index(
+        repo_name,
+        chunk_count=manifest["chunks_total"],
+        index_run=index_run,
+        **manifest["embedding"],
+        commit_sha=manifest["commit_sha"],
+        repo_url=job["repo_url"],
+    )
+    embedded = [
+        _load(queue.get_blob(task.group, f"embedded:{batch}"))
+        for batch in range(len(manifest["batch_sizes"]))
+    ]
+    result = {
+        "repo_name": repo_name,
+        "collection_name": get_repo_collection(repo_name).name,
+        "chunks_indexed": manifest["chunks_total"],
+        "chunks_embedded": sum(stats["embedded"] for stats in embedded),
+        "chunks_reused": sum(stats["reused"] for stats in embedded),
+        "batches": len(manifest["batch_sizes"]),
+        "duplicate_groups": manifest["duplicate_groups"],
+        "commit_sha": manifest["commit_sha"],
+        "index_run": index_run,
+        **manifest["embedding"],
+        "status": "success",
+    }
+    # Step 4: File/directory summaries for two-stage retrieval
+    if get_hierarchy_settings().enabled:
+        result["summary_index"] = build_summary_index(
+            repo_name, cloned["docs"], provider, index_run
+        )
+    result["content_policy"] = cloned["content_policy"]
+    if job["compact"]:
+        result["compaction"] = registry.compact_repo(repo_name)
+    queue.put_blob(task.group, "result", _dump(result))
+
+
+_HANDLERS: Dict[str, Callable[[TaskQueue, Task], None]] = {
+    CLONE: _clone,
+    CHUNK: _chunk,
+    EMBED: _embed,
+    UPSERT: _upsert,
+    FINALIZE: _finalize,
+}
+
+
+def _committed_chunks(tasks: List[Dict[str, Any]], manifest: Dict) -> int:
+    return sum(
+        manifest["batch_sizes"][int(entry["name"].split(":")[1])]
+        for entry in tasks
+        if entry["kind"] == UPSERT and entry["status"] == DONE
+    )
+
+
+def _maybe_finalize(queue: TaskQueue, group: str) -> None:
+    """
+    Enqueue the job's finalize stage once every other stage is done. Runs
+    after each completion, so whichever stage finishes last triggers it.
+    """
+    tasks = queue.group_tasks(group)
+    if any(entry["kind"] == FINALIZE or entry["status"] != DONE for entry in tasks):
+        return
+    # The chunk stage enqueues every batch before it completes
+    if any(entry["kind"] == CHUNK for entry in tasks):
+        _enqueue(queue, group, FINALIZE, FINALIZE)
+
+
+# --- workers ---
+
+
+class IngestWorker:
+    """
+    Runs ingest stages from the task queue on `threads` threads, renewing
+    the leases of running stages until they finish.
+    """
+
+    def __init__(self, threads: int = 1, queue: Optional[TaskQueue] = None):
+        self.threads = threads
+        self.queue = queue or get_task_queue()
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._active: Dict[str, Task] = {}
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(self.threads)
+        ]
+        self._threads.append(
+            threading.Thread(
+                target=self._renew_leases, name="ingest-heartbeat", daemon=True
+            )
+        )
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Ingest worker {self.worker_id} started {self.threads} threads")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop leasing; running stages finish first (up to `timeout`)."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_once(self) -> bool:
+        """Lease and run one stage; False if none was available."""
+        settings = get_ingest_queue_settings()
+        task = self.queue.lease(LEASE_ORDER, settings.lease_seconds)
+        if task is None:
+            return False
+        logger.info(
+            f"Worker {self.worker_id} running {task.task_id} "
+            f"(attempt {task.attempts}/{task.max_attempts})"
+        )
+        with self._active_lock:
+            self._active[task.task_id] = task
+        try:
+            _HANDLERS[task.kind](self.queue, task)
+        except Exception as e:
+            retry_delay = (
+                None
+                if isinstance(e, PERMANENT_ERRORS)
+                else settings.retry_backoff_seconds * 2 ** (task.attempts - 1)
+            )
+            status = self.queue.fail(task, f"{type(e).__name__}: {e}", retry_delay)
+            logger.error(
+                f"Stage {task.task_id} failed ({status or 'lease lost'}): "
+                f"{type(e).__name__}: {e}"
+            )
+            return True
+        finally:
+            with self._active_lock:
+                self._active.pop(task.task_id, None)
+
+        if not self.queue.complete(task):
+            logger.warning(f"Stage {task.task_id} finished after losing its lease")
+        elif task.kind != FINALIZE:
+            _maybe_finalize(self.queue, task.group)
+        return True
+
+    def _run(self) -> None:
+        poll_seconds = get_ingest_queue_settings().poll_seconds
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Ingest worker {self.worker_id}: {type(e).__name__}: {e}")
+            self._stop.wait(poll_seconds)
+
+    def _renew_leases(self) -> None:
+        lease_seconds = get_ingest_queue_settings().lease_seconds
+        while not self._stop.wait(lease_seconds / 3):
+            with self._active_lock:
+                tasks = list(self._active.values())
+            for task in tasks:
+                try:
+                    if not self.queue.extend(task, lease_seconds):
+                        logger.warning(f"Lost the lease of {task.task_id}")
+                except Exception as e:
+                    logger.error(
+                        f"Renewing {task.task_id} failed: {type(e).__name__}: {e}"
+                    )
+
+
+# --- producer ---
+
+
+def queue_stats() -> Dict[str, Dict[str, int]]:
+    """Queued and leased tasks per stage."""
+    return get_task_queue().stats(STAGES)
+
+
+def submit_ingest(
+    job_id: str,
+    repo_url: str,
+    repo_name: str,
+    compact: bool,
+    commit_sha: Optional[str] = None,
+) -> None:
+    """
+    Enqueue an ingest job's first stage. Submitting a job again (e.g. when
+    resuming after a restart) keeps its queued and finished stages.
+    """
+    queue = get_task_queue()
+    if queue.get_blob(job_id, "job") is None:
+        queue.put_blob(
+            job_id,
+            "job",
+            _dump(
+                {
+                    "repo_url": repo_url,
+                    "commit_sha": commit_sha,
+                    "repo_name": repo_name,
+                    "compact": compact,
+                    "index_run": new_index_run(),
+                }
+            ),
+        )
+    _enqueue(queue, job_id, CLONE, CLONE)
+
+
+async def run_distributed_ingest(
+    job_id: str,
+    repo_url: str,
+    repo_name: str,
+    compact: bool,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    commit_sha: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Submit an ingest job to the workers and wait for it to finish.
+
+    Args:
+        commit_sha: Commit to index (default: the default branch's head)
+        on_progress: Called (in a worker thread) with the committed and total
+            chunk counts whenever more batches are searchable
+
+    Returns:
+        The index result, as index_repository reports it
+
+    Raises:
+        IngestStageError: If a stage failed on its last attempt
+    """
+    queue = get_task_queue()
+    poll_seconds = get_ingest_queue_settings().poll_seconds
+    await run_in_threadpool(
+        submit_ingest, job_id, repo_url, repo_name, compact, commit_sha
+    )
+
+    manifest = None
+    committed = 0
+    while True:
+        await asyncio.sleep(poll_seconds)
+        tasks = await run_in_threadpool(queue.group_tasks, job_id)
+        dead = next((entry for entry in tasks if entry["status"] == DEAD), None)
+        if dead is not None:
+            await run_in_threadpool(queue.delete_group, job_id)
+            raise IngestStageError(
+                f"Ingest stage {dead['name']} failed after {dead['attempts']} "
+                f"attempts: {dead['error']}"
+            )
+        if any(
+            entry["kind"] == FINALIZE and entry["status"] == DONE for entry in tasks
+        ):
+            result = _load(await run_in_threadpool(queue.get_blob, job_id, "result"))
+            await run_in_threadpool(queue.delete_group, job_id)
+            return result
+
+        if manifest is None:
+            manifest = _load(
+                await run_in_threadpool(queue.get_blob, job_id, "manifest")
+            )
+        if manifest is not None:
+            done = _committed_chunks(tasks, manifest)
+            if done > committed and on_progress is not None:
+                await run_in_threadpool(on_progress, done, manifest["chunks_total"])
+            committed = done
+        # A worker that died between completing a stage and enqueueing
+        # finalize leaves it to this check
+        await run_in_threadpool(_maybe_finalize, queue, job_id)
@@ -7,80 +7,56 @@ import logging
 import json
 from datetime import datetime
 from collections import defaultdict
-from openai import OpenAI
-from config import get_openai_settings
-from services.retrieval import query_repository, get_all_files
+from concurrent.futures import ThreadPoolExecutor
+from services.embeddings import create_chat_completion
+from services.retrieval import (
+    get_file_chunks,
+    query_repositories,
+    query_repository,
+)
+from services.file_tree import FOLDER, get_path_index
+from services.resilience import submit_in_context
+from services.scope import Scope
+from services.summary_cache import (
+    file_sections,
+    get_cached_summaries,
+    store_summary,
+    summary_key,
+)
 from models.documentation import Section, FileNode, DocumentationMetadata, DocsData
 
 logger = logging.getLogger(__name__)
 
+DOCS_MODEL = "gpt-4o-mini"
 
-def build_file_tree(repo_name: str) -> List[FileNode]:
+# Files up to this size are documented in a single LLM call; larger files go
+# through map (per-section summaries) and reduce.
+SINGLE_PASS_MAX_CHARS = 12000
+REDUCE_MAX_CHARS = 24000
+MAP_MAX_TOKENS = 300
+MAP_MAX_WORKERS = 8
+
+
+def build_file_tree(repo_name: str, max_depth: Optional[int] = None) -> List[FileNode]:
     """
     Build a hierarchical file tree from indexed repository files.
 
     Args:
         repo_name: Name of the repository
+        max_depth: Number of levels to expand (default: the whole tree);
+            folders below it are returned with children=None
 
     Returns:
         List of root FileNode objects representing the file tree
     """
     try:
-        # Get all unique files from the repository
-        files = get_all_files(repo_name)
+        index = get_path_index(repo_name)
 
-        if not files:
+        if not index.files:
             logger.warning(f"No files found for {repo_name}")
             return []
 
-        # Build tree structure
-        root = {}
-
-        for file in files:
-            file_path = file["file_path"]
-            # Remove leading slash if present
-            file_path = file_path.lstrip("/")
-            parts = file_path.split("/")
-
-            current = root
-            for i, part in enumerate(parts):
-                if part not in current:
-                    is_file = i == len(parts) - 1
-                    current[part] = {
-                        "name": part,
-                        "path": "/".join(parts[: i + 1]),
-                        "type": "file" if is_file else "folder",
-                        "children": {} if not is_file else None,
-                    }
-
-                if i < len(parts) - 1:
-                    current = current[part]["children"]
-
-        # Convert dict structure to list of FileNode objects
-        def dict_to_file_nodes(node_dict: Dict) -> List[FileNode]:
-            nodes = []
-            # Sort: folders first, then files; alphabetically within each group
-            sorted_items = sorted(
-                node_dict.items(), key=lambda x: (x[1]["type"] == "file", x[0].lower())
-            )
-
-            for name, data in sorted_items:
-                children = None
-                if data["type"] == "folder" and data["children"]:
-                    children = dict_to_file_nodes(data["children"])
-
-                nodes.append(
-                    FileNode(
-                        name=data["name"],
-                        path=data["path"],
-                        type=data["type"],
-                        children=children,
-                    )
-                )
-
-            return nodes
-
-        file_tree = dict_to_file_nodes(root)
+        file_tree = index.to_file_nodes(depth=max_depth)
         logger.info(f"Built file tree with {len(file_tree)} root nodes for {repo_name}")
         return file_tree
 
@@ -102,8 +78,8 @@ def gather_metadata(repo_name: str, file_tree: List[FileNode]) -> DocumentationM
         DocumentationMetadata object
     """
     try:
-        # Get all files
-        files = get_all_files(repo_name)
+        # Get all files (shared with the file tree via the cached path index)
+        files = get_path_index(repo_name).files
 
         # Count files
         file_count = len(files)
@@ -171,12 +147,26 @@ def gather_metadata(repo_name: str, file_tree: List[FileNode]) -> DocumentationM
         )
 
 
-def generate_overview_docs(repo_name: str) -> DocsData:
+def _has_collapsed_folders(nodes: List[FileNode]) -> bool:
+    """Whether a depth-limited tree left out the contents of any folder."""
+    return any(
+        node.type == FOLDER
+        and (node.children is None or _has_collapsed_folders(node.children))
+        for node in nodes
+    )
+
+
+def generate_overview_docs(
+    repo_name: str, include_tree: bool = True, tree_depth: Optional[int] = None
+) -> DocsData:
     """
     Generate high-level overview documentation for a repository with structured JSON output.
 
     Args:
         repo_name: Name of the repository
+        include_tree: Embed the file tree in the response (clients can fetch
+            it lazily from the tree endpoint instead)
+        tree_depth: Only expand this many levels of the embedded tree
 
     Returns:
         DocsData object with sections, file_tree, and metadata
@@ -186,7 +176,8 @@ def generate_overview_docs(repo_name: str) -> DocsData:
 
         # Step 1: Build file tree
         logger.info("Building file tree...")
-        file_tree = build_file_tree(repo_name)
+        file_tree = build_file_tree(repo_name, tree_depth) if include_tree else []
+        file_tree_truncated = not include_tree or _has_collapsed_folders(file_tree)
 
         # Step 2: Gather metadata
         logger.info("Gathering metadata...")
@@ -205,7 +196,10 @@ def generate_overview_docs(repo_name: str) -> DocsData:
                 content="# Overview\n\nNo documentation available. Repository may not be indexed.",
             )
             return DocsData(
-                sections=[fallback_section], file_tree=file_tree, metadata=metadata
+                sections=[fallback_section],
+                file_tree=file_tree,
+                file_tree_truncated=file_tree_truncated,
+                metadata=metadata,
             )
 
         # Build context from top results
@@ -221,9 +215,6 @@ def generate_overview_docs(repo_name: str) -> DocsData:
         context = "\n\n".join(context_parts)
 
         # Step 4: Generate structured documentation with LLM using JSON mode
-        settings = get_openai_settings()
-        client = OpenAI(api_key=settings.api_key)
-
         prompt = f"""You are a technical documentation expert. Generate comprehensive documentation for a codebase.
 
 Repository: {repo_name}
@@ -259,7 +250,7 @@ Requirements:
 - Use proper markdown formatting"""
 
         logger.info("Calling OpenAI API with JSON mode for structured documentation")
-        response = client.chat.completions.create(
+        response = create_chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {
@@ -288,7 +279,12 @@ Requirements:
             # TODO: Could add logic to pad missing sections
 
         # Step 5: Construct final DocsData object
-        docs_data = DocsData(sections=sections, file_tree=file_tree, metadata=metadata)
+        docs_data = DocsData(
+            sections=sections,
+            file_tree=file_tree,
+            file_tree_truncated=file_tree_truncated,
+            metadata=metadata,
+        )
 
         logger.info(
             f"Successfully generated structured docs for {repo_name} with {len(sections)} sections"
@@ -303,47 +299,74 @@ Requirements:
         raise
 
 
-def generate_file_docs(repo_name: str, file_path: str) -> Dict:
+def file_docs_messages(file_path: str, language: str, code: str) -> List[Dict]:
     """
-    Generate documentation for a specific file.
+    Build the chat messages for single-pass documentation of a whole file.
+    """
+    prompt = f"""Generate concise documentation for this code file.
 
-    Args:
-        repo_name: Name of the repository
-        file_path: Path to the file
+File: {file_path}
+Language: {language}
 
-    Returns:
-        Dictionary containing file documentation
-    """
-    try:
-        logger.info(f"Generating docs for file: {file_path}")
+Code:
+{code}
 
-        # Query for this specific file
-        query = f"What does the file {file_path} do?"
-        results = query_repository(
-            repo_name, query, n_results=5, filter_metadata={"file_path": file_path}
-        )
+Please provide:
+1. Brief description of the file's purpose
+2. Key functions/classes and what they do
+3. Any important dependencies or patterns
 
-        if not results:
-            return {
-                "file_path": file_path,
-                "documentation": "No documentation available for this file.",
-            }
+Be concise and focus on what developers need to know."""
 
-        # Build context from file chunks
-        file_content = "\n\n".join([r["document"] for r in results])
-        file_metadata = results[0]["metadata"]
+    return [
+        {
+            "role": "system",
+            "content": "You are a technical documentation expert who writes clear, concise documentation.",
+        },
+        {"role": "user", "content": prompt},
+    ]
 
-        # Generate docs with LLM
-        settings = get_openai_settings()
-        client = OpenAI(api_key=settings.api_key)
 
-        prompt = f"""Generate concise documentation for this code file.
+def chunk_summary_messages(
+    file_path: str, language: str, chunk_index: int, total_chunks: int, code: str
+) -> List[Dict]:
+    """
+    Build the chat messages for the map step: summarize one section of a file.
+    """
+    prompt = f"""Summarize this section of a code file for later use in writing the file's documentation.
 
 File: {file_path}
-Language: {file_metadata.get("language", "unknown")}
+Language: {language}
+Section: {chunk_index + 1} of {total_chunks}
 
 Code:
-{file_content}
+{code}
+
+List the functions, classes, constants and notable logic defined in this section, with one short line each. Mention imports and dependencies. Do not speculate about code outside this section."""
+
+    return [
+        {
+            "role": "system",
+            "content": "You are a technical documentation expert who summarizes code precisely and tersely.",
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+def reduce_messages(file_path: str, language: str, summaries: List[str]) -> List[Dict]:
+    """
+    Build the chat messages for the reduce step: write file docs from section summaries.
+    """
+    joined = "\n\n".join(
+        f"[Section {i}]\n{summary}" for i, summary in enumerate(summaries, 1)
+    )
+    prompt = f"""Generate concise documentation for a code file from summaries of each of its sections, in file order.
+
+File: {file_path}
+Language: {language}
+
+Section summaries:
+{joined}
 
 Please provide:
 1. Brief description of the file's purpose
@@ -352,27 +375,169 @@ Please provide:
 
 Be concise and focus on what developers need to know."""
 
-        logger.info("Calling OpenAI API for file documentation")
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a technical documentation expert who writes clear, concise documentation.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=800,
+    return [
+        {
+            "role": "system",
+            "content": "You are a technical documentation expert who writes clear, concise documentation.",
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _chat_completion(
+    messages: List[Dict], max_tokens: int, temperature: float = 0.7
+) -> str:
+    response = create_chat_completion(
+        model=DOCS_MODEL,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
+    return response.choices[0].message.content
+
+
+def summarize_file_chunks(
+    file_path: str, chunks: List[Dict], max_workers: int = MAP_MAX_WORKERS
+) -> List[str]:
+    """
+    Map step: summarize every section of a file (see summary_cache.file_sections),
+    in parallel, reusing cached summaries.
+
+    Args:
+        file_path: Path to the file
+        chunks: All chunks of the file in chunk order
+        max_workers: Maximum number of concurrent LLM calls
+
+    Returns:
+        One summary per section, in file order
+    """
+    sections = file_sections(chunks)
+    language = chunks[0]["metadata"].get("language", "unknown")
+    keys = [summary_key(section, DOCS_MODEL) for section in sections]
+    cached = get_cached_summaries(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+
+    logger.info(
+        f"Summarizing {file_path}: {len(sections) - len(missing)} cached, {len(missing)} to generate"
+    )
+
+    def summarize(index: int) -> str:
+        summary = _chat_completion(
+            chunk_summary_messages(
+                file_path, language, index, len(sections), sections[index]
+            ),
+            max_tokens=MAP_MAX_TOKENS,
+            temperature=0.2,
         )
+        store_summary(keys[index], DOCS_MODEL, summary)
+        return summary
+
+    if missing:
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(missing)))
+        ) as pool:
+            futures = [submit_in_context(pool, summarize, index) for index in missing]
+            for index, future in zip(missing, futures):
+                cached[keys[index]] = future.result()
+
+    return [cached[key] for key in keys]
+
+
+def reduce_summaries(file_path: str, language: str, summaries: List[str]) -> str:
+    """
+    Reduce step: combine section summaries into the file's documentation.
+
+    Summaries that would overflow one prompt are first collapsed group by group.
+    """
+    while len(summaries) > 1 and sum(len(s) for s in summaries) > REDUCE_MAX_CHARS:
+        groups, current, size = [], [], 0
+        for summary in summaries:
+            if current and size + len(summary) > REDUCE_MAX_CHARS:
+                groups.append(current)
+                current, size = [], 0
+            current.append(summary)
+            size += len(summary)
+        groups.append(current)
+        logger.info(
+            f"Collapsing {len(summaries)} summaries into {len(groups)} for {file_path}"
+        )
+        summaries = [
+            _chat_completion(
+                chunk_summary_messages(
+                    file_path, language, i, len(groups), "\n\n".join(group)
+                ),
+                max_tokens=MAP_MAX_TOKENS * 2,
+                temperature=0.2,
+            )
+            for i, group in enumerate(groups)
+        ]
+
+    return _chat_completion(
+        reduce_messages(file_path, language, summaries), max_tokens=800
+    )
+
+
+def generate_file_docs(repo_name: str, file_path: str, mode: str = "full") -> Dict:
+    """
+    Generate documentation for a specific file.
+
+    In "full" mode every chunk of the file is fetched in order (no embedding
+    call). Files up to SINGLE_PASS_MAX_CHARS are documented in one LLM call;
+    larger files are summarized chunk by chunk in parallel (map) and the
+    summaries combined (reduce). In "sample" mode only the top few chunks of a
+    vector search are used.
 
-        generated_docs = response.choices[0].message.content
+    Args:
+        repo_name: Name of the repository
+        file_path: Path to the file
+        mode: "full" (default) or "sample"
+
+    Returns:
+        Dictionary containing file documentation
+    """
+    try:
+        logger.info(f"Generating docs for file: {file_path} (mode={mode})")
+
+        if mode == "sample":
+            query = f"What does the file {file_path} do?"
+            chunks = query_repository(
+                repo_name, query, n_results=5, filter_metadata={"file_path": file_path}
+            )
+        elif mode == "full":
+            chunks = get_file_chunks(repo_name, file_path)
+        else:
+            raise ValueError(f"Unknown file docs mode: {mode}")
+
+        if not chunks:
+            return {
+                "file_path": file_path,
+                "documentation": "No documentation available for this file.",
+            }
+
+        file_metadata = chunks[0]["metadata"]
+        language = file_metadata.get("language", "unknown")
+        total_chars = sum(len(c["document"]) for c in chunks)
+
+        if mode == "sample" or total_chars <= SINGLE_PASS_MAX_CHARS:
+            strategy = "single_pass"
+            file_content = "\n\n".join([c["document"] for c in chunks])
+            logger.info("Calling OpenAI API for file documentation")
+            generated_docs = _chat_completion(
+                file_docs_messages(file_path, language, file_content), max_tokens=800
+            )
+        else:
+            strategy = "map_reduce"
+            summaries = summarize_file_chunks(file_path, chunks)
+            logger.info(f"Reducing {len(summaries)} summaries for {file_path}")
+            generated_docs = reduce_summaries(file_path, language, summaries)
 
         logger.info(f"Successfully generated docs for {file_path}")
         return {
             "file_path": file_path,
-            "language": file_metadata.get("language", "unknown"),
+            "language": language,
             "documentation": generated_docs,
+            "strategy": strategy,
+            "chunks_covered": len(chunks),
         }
 
     except Exception as e:
@@ -380,13 +545,86 @@ Be concise and focus on what developers need to know."""
         raise
 
 
-def answer_question(repo_name: str, question: str) -> Dict:
+def _answer_from_results(question: str, results: List[Dict]) -> Dict:
+    """
+    Generate an answer to a question from retrieved chunks.
+
+    Results tagged with "repo_name" (cross-repo search) are cited as
+    "repo:path" and keep their repo in the returned sources.
+    """
+    if not results:
+        return {
+            "question": question,
+            "answer": "I couldn't find relevant information in the indexed repository.",
+            "sources": [],
+        }
+
+    # Build context from results
+    context_parts = []
+    sources = []
+    for i, result in enumerate(results, 1):
+        file_path = result["metadata"].get("file_path", "unknown")
+        content = result["document"]
+        similarity = result.get("similarity", 0)
+        repo_name = result.get("repo_name")
+        label = f"{repo_name}:{file_path}" if repo_name else file_path
+
+        context_parts.append(f"[Source {i}] {label}:\n{content}")
+        source = {
+            "file_path": file_path,
+            "chunk_id": result["id"],
+            "similarity": similarity,
+        }
+        if repo_name:
+            source["repo_name"] = repo_name
+        sources.append(source)
+
+    context = "\n\n".join(context_parts)
+
+    # Generate answer with LLM
+    prompt = f"""Answer the following question about the codebase based on the provided code excerpts.
+
+Question: {question}
+
+Code Excerpts:
+{context}
+
+Provide a clear, accurate answer based on the code. If the excerpts don't contain enough information, say so. Cite specific files when relevant."""
+
+    logger.info("Calling OpenAI API to answer question")
+    response = create_chat_completion(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a helpful coding assistant who answers questions about codebases accurately based on provided context.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.7,
+        max_tokens=1000,
+    )
+
+    answer = response.choices[0].message.content
+
+    logger.info("Successfully generated answer")
+    return {
+        "question": question,
+        "answer": answer,
+        "sources": sources[:5],  # Top 5 sources
+    }
+
+
+def answer_question(
+    repo_name: str, question: str, scope: Optional[Scope] = None
+) -> Dict:
     """
     Answer a specific question about the repository using RAG.
 
     Args:
         repo_name: Name of the repository
         question: User's question
+        scope: Only use context from this part of the repo (see services.scope)
 
     Returns:
         Dictionary with answer and source chunks
@@ -395,70 +633,53 @@ def answer_question(repo_name: str, question: str) -> Dict:
         logger.info(f"Answering question for {repo_name}: {question[:50]}...")
 
         # Query for relevant chunks
-        results = query_repository(repo_name, question, n_results=8)
+        results = query_repository(repo_name, question, n_results=8, scope=scope)
 
-        if not results:
-            return {
-                "question": question,
-                "answer": "I couldn't find relevant information in the indexed repository.",
-                "sources": [],
-            }
-
-        # Build context from results
-        context_parts = []
-        sources = []
-        for i, result in enumerate(results, 1):
-            file_path = result["metadata"].get("file_path", "unknown")
-            content = result["document"]
-            similarity = result.get("similarity", 0)
-
-            context_parts.append(f"[Source {i}] {file_path}:\n{content}")
-            sources.append(
-                {
-                    "file_path": file_path,
-                    "chunk_id": result["id"],
-                    "similarity": similarity,
-                }
-            )
-
-        context = "\n\n".join(context_parts)
+        return _answer_from_results(question, results)
 
-        # Generate answer with LLM
-        settings = get_openai_settings()
-        client = OpenAI(api_key=settings.api_key)
-
-        prompt = f"""Answer the following question about the codebase based on the provided code excerpts.
+    except Exception as e:
+        logger.error(f"Error answering question: {type(e).__name__}: {e}")
+        raise
 
-Question: {question}
 
-Code Excerpts:
-{context}
+def answer_question_across_repos(
+    repo_names: List[str],
+    question: str,
+    n_results: int = 8,
+    per_repo_limit: Optional[int] = None,
+    filter_metadata: Optional[Dict] = None,
+) -> Dict:
+    """
+    Answer a question using context merged from several repositories.
 
-Provide a clear, accurate answer based on the code. If the excerpts don't contain enough information, say so. Cite specific files when relevant."""
+    Args:
+        repo_names: Repositories to search
+        question: User's question
+        n_results: Number of merged chunks used as context
+        per_repo_limit: Maximum chunks taken from any one repository
+        filter_metadata: Optional metadata filters applied in every repository
 
-        logger.info("Calling OpenAI API to answer question")
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful coding assistant who answers questions about codebases accurately based on provided context.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=1000,
+    Returns:
+        Dictionary with answer, source chunks (tagged with repo_name) and
+        any repositories that could not be searched
+    """
+    try:
+        logger.info(
+            f"Answering question across {len(repo_names)} repos: {question[:50]}..."
         )
 
-        answer = response.choices[0].message.content
+        merged = query_repositories(
+            repo_names,
+            question,
+            n_results=n_results,
+            per_repo_limit=per_repo_limit,
+            filter_metadata=filter_metadata,
+        )
 
-        logger.info("Successfully generated answer")
-        return {
-            "question": question,
-            "answer": answer,
-            "sources": sources[:5],  # Top 5 sources
-        }
+        answer = _answer_from_results(question, merged["results"])
+        answer["failed_repos"] = merged["failed_repos"]
+        return answer
 
     except Exception as e:
-        logger.error(f"Error answering question: {type(e).__name__}: {e}")
+        logger.error(f"Error answering cross-repo question: {type(e).__name__}: {e}")
         raise
@@ -0,0 +1,66 @@
+"""
+Persistent store of generated file documentation.
+
+File docs are expensive to generate, so they are written here (by batch
+pre-generation and by on-demand requests) and served straight from SQLite.
+"""
+
+from datetime import datetime
+from typing import Dict, Optional
+import json
+
+from services.local_store import LocalStore, get_local_store
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_docs (
+    repo_name TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    docs_json TEXT NOT NULL,
+    generated_at TEXT NOT NULL,
+    PRIMARY KEY (repo_name, file_path)
+);
+"""
+
+
+def _store() -> LocalStore:
+    return get_local_store("docs", _SCHEMA)
+
+
+def get_stored_file_docs(repo_name: str, file_path: str) -> Optional[Dict]:
+    """
+    Return previously generated docs for a file, or None.
+    """
+    row = _store().fetchone(
+        "SELECT docs_json, generated_at FROM file_docs WHERE repo_name = ? AND file_path = ?",
+        (repo_name, file_path),
+    )
+    if row is None:
+        return None
+    docs = json.loads(row["docs_json"])
+    docs["generated_at"] = row["generated_at"]
+    return docs
+
+
+def save_file_docs(repo_name: str, file_path: str, docs: Dict) -> None:
+    _store().execute(
+        "INSERT OR REPLACE INTO file_docs (repo_name, file_path, docs_json, generated_at) "
+        "VALUES (?, ?, ?, ?)",
+        (repo_name, file_path, json.dumps(docs), datetime.utcnow().isoformat() + "Z"),
+    )
+
+
+def list_documented_files(repo_name: str) -> set:
+    rows = _store().fetchall(
+        "SELECT file_path FROM file_docs WHERE repo_name = ?", (repo_name,)
+    )
+    return {row["file_path"] for row in rows}
+
+
+def delete_repo_docs(repo_name: str) -> int:
+    """
+    Drop all stored docs of a repository (e.g. after it is re-indexed).
+
+    Returns:
+        Number of documents removed
+    """
+    return _store().execute("DELETE FROM file_docs WHERE repo_name = ?", (repo_name,))
@@ -0,0 +1,291 @@
+"""
+Pluggable embedding providers.
+
+Every index records the provider and model that produced its vectors (see
+RepoRegistry.record_index), and queries look the provider up from that
+record, so a collection is always queried with the embedder that built it.
+"""
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+import hashlib
+import logging
+import math
+import multiprocessing
+import re
+import threading
+
+from config import get_embedding_settings
+from services.embeddings import DEFAULT_EMBEDDING_MODEL, generate_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProviderError(ValueError):
+    """Raised when a provider is unknown or does not match an existing index."""
+
+
+class EmbeddingProvider(ABC):
+    """
+    Turns texts into vectors. Implementations must be deterministic for a
+    given (name, model) so stored and query vectors are comparable.
+    """
+
+    name: str
+    model: str
+    dimensions: Optional[int] = None
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, returning one vector per text in input order."""
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a search query; callers guard it with a circuit breaker."""
+        return self.embed([text])[0]
+
+    def describe(self) -> Dict[str, str]:
+        """Metadata recorded on a collection built with this provider."""
+        description = {"embedding_provider": self.name, "embedding_model": self.model}
+        if self.dimensions:
+            description["embedding_dimensions"] = self.dimensions
+        return description
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = "openai"
+
+    def __init__(
+        self, model: str = DEFAULT_EMBEDDING_MODEL, dimensions: Optional[int] = None
+    ):
+        self.model = model
+        self.dimensions = dimensions
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return generate_embeddings(texts, model=self.model, dimensions=self.dimensions)
+
+    def embed_query(self, text: str) -> List[float]:
+        return generate_embeddings(
+            [text], model=self.model, dimensions=self.dimensions, dependency=None
+        )[0]
+
+
+# --- local CPU engine ---
+
+_worker_model = None
+
+
+def _init_local_worker(model_path: str, dimensions: Optional[int]) -> None:
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+
+    _worker_model = SentenceTransformer(
+        model_path, device="cpu", truncate_dim=dimensions
+    )
+
+
+def _encode_local_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_model.encode(
+        texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True
+    ).tolist()
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    sentence-transformers model loaded from a local path, with inference
+    batched across a pool of CPU worker processes.
+
+    Requires the optional `sentence-transformers` package; no network access
+    is needed once the model files are on disk.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_path: str,
+        workers: int = 2,
+        batch_size: int = 64,
+        dimensions: Optional[int] = None,
+    ):
+        if not Path(model_path).exists():
+            raise EmbeddingProviderError(
+                f"Local embedding model not found: {model_path}"
+            )
+        self.model_path = model_path
+        self.model = Path(model_path).name
+        self.dimensions = dimensions
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # spawn: the server process holds threads and open sockets
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_local_worker,
+                    initargs=(self.model_path, self.dimensions),
+                )
+            return self._pool
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        embeddings = []
+        for batch_embeddings in self._get_pool().map(_encode_local_batch, batches):
+            embeddings.extend(batch_embeddings)
+        logger.info(f"Generated {len(embeddings)} local embeddings with {self.model}")
+        return embeddings
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+# --- deterministic fake ---
+
+_TOKEN = re.compile(r"[A-Za-z][a-z0-9]*|[A-Z]+(?![a-z])|\d+")
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic, offline embedder based on feature hashing of word and
+    sub-word tokens (identifiers are split on case changes and underscores).
+
+    Good enough for lexical retrieval in tests, load tests and benchmarks;
+    not a substitute for a semantic model.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.model = f"hash-{dimensions}"
+
+    @classmethod
+    def from_model(cls, model: str) -> "HashingEmbeddingProvider":
+        try:
+            return cls(int(model.rsplit("-", 1)[1]))
+        except (IndexError, ValueError):
+            raise EmbeddingProviderError(f"Invalid hashing model name: {model}")
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in _TOKEN.findall(text):
+            digest = hashlib.blake2b(
+                token.lower().encode("utf-8"), digest_size=8
+            ).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(text) for text in texts]
+
+
+_providers: Dict[Tuple[str, str, int], EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def _create_provider(
+    name: str, model: Optional[str], dimensions: Optional[int]
+) -> EmbeddingProvider:
+    settings = get_embedding_settings()
+    if name == "openai":
+        return OpenAIEmbeddingProvider(model or DEFAULT_EMBEDDING_MODEL, dimensions)
+    if name == "hashing":
+        if model:
+            return HashingEmbeddingProvider.from_model(model)
+        return HashingEmbeddingProvider(dimensions or 256)
+    if name == "local":
+        if not settings.model:
+            raise EmbeddingProviderError(
+                "EMBEDDING_MODEL must point to a local model directory"
+            )
+        return LocalEmbeddingProvider(
+            settings.model,
+            settings.local_workers,
+            settings.local_batch_size,
+            dimensions,
+        )
+    raise EmbeddingProviderError(f"Unknown embedding provider: {name}")
+
+
+def _provider_key(
+    name: str, model: Optional[str], dimensions: Optional[int]
+) -> Tuple[str, str, int]:
+    """
+    Cache key under which equivalent requests share one provider instance,
+    whether they come from the settings or from an index's metadata.
+    """
+    if name == "openai":
+        return name, model or DEFAULT_EMBEDDING_MODEL, dimensions or 0
+    if name == "hashing":
+        # The model name encodes the vector size
+        return name, model or f"hash-{dimensions or 256}", 0
+    if name == "local":
+        # There is only the configured local model (checked by the caller), so
+        # indexes and queries share one worker pool per vector size
+        return name, "", dimensions or 0
+    return name, model or "", dimensions or 0
+
+
+def get_embedding_provider(
+    name: Optional[str] = None,
+    model: Optional[str] = None,
+    dimensions: Optional[int] = None,
+) -> EmbeddingProvider:
+    """
+    Return a (cached) provider instance.
+
+    Args:
+        name: Provider name (default: EMBEDDING_PROVIDER)
+        model: Model name (default: EMBEDDING_MODEL or the provider's default)
+        dimensions: Vector size (default: EMBEDDING_DIMENSIONS or the model's
+            native size)
+    """
+    settings = get_embedding_settings()
+    if name is None:
+        name = settings.provider
+        model = model or (settings.model if name != "local" else None)
+        dimensions = dimensions or settings.dimensions
+
+    key = _provider_key(name, model, dimensions)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = _create_provider(name, model, dimensions)
+    if name == "local" and model and model != provider.model:
+        raise EmbeddingProviderError(
+            f"Index was built with local model {model!r} but {provider.model!r} is configured"
+        )
+    return provider
+
+
+def provider_for_metadata(metadata: Optional[Mapping[str, Any]]) -> EmbeddingProvider:
+    """
+    Return the provider that built an index, from its recorded metadata.
+
+    Collections with no embedding record at all (not indexed yet) use the
+    configured provider; older indexes that recorded only a model used OpenAI.
+    """
+    metadata = metadata or {}
+    if "embedding_model" not in metadata:
+        return get_embedding_provider()
+    return get_embedding_provider(
+        metadata.get("embedding_provider", "openai"),
+        metadata.get("embedding_model", DEFAULT_EMBEDDING_MODEL),
+        metadata.get("embedding_dimensions"),
+    )
@@ -1,48 +1,82 @@
-from typing import List
+from typing import TYPE_CHECKING, Any, List, Optional
 import time
 import logging
-from openai import OpenAI, RateLimitError
-from config import get_openai_settings
+from config import get_openai_settings, get_resilience_settings
+from services.resilience import DeadlineExceeded, guarded_call, time_remaining
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 logger = logging.getLogger(__name__)
-_client: OpenAI | None = None
 
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+# Circuit breakers: interactive calls and bulk (ingest) embedding fail independently
+OPENAI_DEPENDENCY = "openai"
+INGEST_DEPENDENCY = "openai-ingest"
+
+_client: Optional["OpenAI"] = None
 
-def get_openai_client() -> OpenAI:
+
+def get_openai_client() -> "OpenAI":
     """
     Return a singleton OpenAI client.
+
+    The openai package is imported on first use to keep startup fast.
     """
     global _client
     if _client is None:
+        from openai import OpenAI
+
         settings = get_openai_settings()
         _client = OpenAI(api_key=settings.api_key)
     return _client
 
 
 def generate_embeddings(
-    texts: List[str], model: str = "text-embedding-3-small", max_retries: int = 5
+    texts: List[str],
+    model: str = DEFAULT_EMBEDDING_MODEL,
+    max_retries: int = 5,
+    dimensions: Optional[int] = None,
+    dependency: Optional[str] = INGEST_DEPENDENCY,
 ) -> List[List[float]]:
     """
     Generate embeddings for a list of text chunks using OpenAI's embedding API.
-    Includes retry logic with exponential backoff for rate limiting.
+    Includes retry logic with exponential backoff for rate limiting and
+    transient errors; each request is bounded by the current deadline (see
+    services.resilience) and goes through the `dependency` circuit breaker.
 
     Args:
         texts: List of text strings to embed
         model: OpenAI embedding model to use (default: text-embedding-3-small)
-        max_retries: Maximum number of retries for rate limit errors
+        max_retries: Maximum number of retries for rate limit and transient errors
+        dimensions: Shorten the vectors to this size (text-embedding-3 models
+            only; default: the model's native size)
+        dependency: Circuit breaker to call through; None when the caller
+            already guards the call (query embeddings)
 
     Returns:
         List of embedding vectors (each vector is a list of floats)
 
     Raises:
         RateLimitError: If rate limit persists after all retries
+        DeadlineExceeded: If the request deadline passes first
+        CircuitOpenError: If OpenAI calls are currently failing fast
     """
+    from openai import (
+        APIConnectionError,
+        APITimeoutError,
+        InternalServerError,
+        RateLimitError,
+    )
+
     client = get_openai_client()
+    request_timeout = get_resilience_settings().openai_timeout_seconds
 
     # OpenAI API accepts up to 2048 texts per request for embedding models
     # For safety, we'll batch in chunks of 100
     batch_size = 100
     all_embeddings = []
+    extra = {"dimensions": dimensions} if dimensions else {}
 
     for i in range(0, len(texts), batch_size):
         batch = texts[i : i + batch_size]
@@ -50,7 +84,20 @@ def generate_embeddings(
         # Retry logic with exponential backoff
         for attempt in range(max_retries):
             try:
-                response = client.embeddings.create(input=batch, model=model)
+
+                def create():
+                    return client.embeddings.create(
+                        input=batch,
+                        model=model,
+                        timeout=time_remaining(request_timeout),
+                        **extra,
+                    )
+
+                response = (
+                    guarded_call(dependency, "embeddings", create)
+                    if dependency
+                    else create()
+                )
 
                 # Extract embeddings from response
                 batch_embeddings = [item.embedding for item in response.data]
@@ -59,16 +106,27 @@ def generate_embeddings(
                 # Success - break retry loop
                 break
 
-            except RateLimitError as e:
+            except (
+                RateLimitError,
+                APITimeoutError,
+                APIConnectionError,
+                InternalServerError,
+            ) as e:
                 if attempt == max_retries - 1:
                     # Last attempt failed
-                    logger.error(f"Rate limit exceeded after {max_retries} attempts")
+                    logger.error(
+                        f"{type(e).__name__} persisted after {max_retries} attempts"
+                    )
                     raise
 
                 # Calculate exponential backoff: 1s, 2s, 4s, 8s, 16s
                 wait_time = 2**attempt
+                # Don't sleep past the deadline only to fail afterwards
+                remaining = time_remaining()
+                if remaining is not None and remaining <= wait_time:
+                    raise DeadlineExceeded("Request deadline exceeded") from e
                 logger.warning(
-                    f"Rate limit hit on batch {i // batch_size + 1}. "
+                    f"{type(e).__name__} on batch {i // batch_size + 1}. "
                     f"Retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})"
                 )
                 time.sleep(wait_time)
@@ -80,3 +138,24 @@ def generate_embeddings(
 
     logger.info(f"Successfully generated {len(all_embeddings)} embeddings")
     return all_embeddings
+
+
+def create_chat_completion(**kwargs: Any) -> Any:
+    """
+    Call the chat completions API under the current deadline and the OpenAI
+    circuit breaker. Takes the same arguments as
+    `client.chat.completions.create`.
+
+    Raises:
+        DeadlineExceeded: If the request deadline passes first
+        CircuitOpenError: If OpenAI calls are currently failing fast
+    """
+    client = get_openai_client()
+    request_timeout = get_resilience_settings().openai_timeout_seconds
+    return guarded_call(
+        OPENAI_DEPENDENCY,
+        "chat",
+        lambda: client.chat.completions.create(
+            timeout=time_remaining(request_timeout), **kwargs
+        ),
+    )
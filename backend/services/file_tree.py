@@ -0,0 +1,166 @@
+"""
+Per-repo path index for serving the file tree lazily.
+
+The index is built once from the repository's file list and cached, so tree
+requests return one directory level (or a few) without rebuilding or sending
+the whole nested tree.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from config import get_chroma_pool_settings
+from models.documentation import FileNode
+from services.retrieval import get_all_files
+
+logger = logging.getLogger(__name__)
+
+FOLDER = "folder"
+FILE = "file"
+
+
+def _normalize(path: str) -> str:
+    return path.strip("/")
+
+
+class PathIndex:
+    """
+    Directory -> sorted children mapping for one repository.
+
+    Paths are repository paths without a leading slash, the same form the
+    FileNode tree uses. The root directory is "".
+    """
+
+    def __init__(self, files: List[Dict]):
+        self.files = files
+        self._children: Dict[str, Dict[str, str]] = {"": {}}
+        self._file_counts: Dict[str, int] = {"": 0}
+
+        for file in files:
+            parts = _normalize(file["file_path"]).split("/")
+            directory = ""
+            self._file_counts[""] += 1
+            for i, part in enumerate(parts):
+                is_file = i == len(parts) - 1
+                self._children[directory].setdefault(part, FILE if is_file else FOLDER)
+                if is_file:
+                    break
+                directory = f"{directory}/{part}" if directory else part
+                self._children.setdefault(directory, {})
+                self._file_counts[directory] = self._file_counts.get(directory, 0) + 1
+
+        # Sort once: folders first, then files; alphabetically within each group
+        self._sorted: Dict[str, List[Tuple[str, str]]] = {
+            directory: sorted(
+                children.items(), key=lambda item: (item[1] == FILE, item[0].lower())
+            )
+            for directory, children in self._children.items()
+        }
+
+    def has_directory(self, path: str) -> bool:
+        return _normalize(path) in self._sorted
+
+    def file_count(self, path: str = "") -> int:
+        return self._file_counts.get(_normalize(path), 0)
+
+    def children(
+        self, path: str = "", offset: int = 0, limit: Optional[int] = None
+    ) -> Tuple[List[Tuple[str, str, str]], int]:
+        """
+        Return one page of a directory's direct children.
+
+        Returns:
+            ([(name, child_path, type), ...], total number of children)
+        """
+        directory = _normalize(path)
+        entries = self._sorted.get(directory, [])
+        page = entries[offset : offset + limit if limit is not None else None]
+        return (
+            [
+                (name, f"{directory}/{name}" if directory else name, node_type)
+                for name, node_type in page
+            ],
+            len(entries),
+        )
+
+    def to_file_nodes(
+        self,
+        path: str = "",
+        depth: Optional[int] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[FileNode]:
+        """
+        Build FileNode objects for a directory, expanding `depth` levels
+        (None = the whole subtree). Folders below the depth limit are returned
+        with children=None. Pagination applies to the top level only.
+        """
+        nodes = []
+        entries, _ = self.children(path, offset, limit)
+        for name, child_path, node_type in entries:
+            children = None
+            if node_type == FOLDER and (depth is None or depth > 1):
+                children = self.to_file_nodes(
+                    child_path, None if depth is None else depth - 1
+                )
+            # Paths come from our own index, so skip per-node validation
+            nodes.append(
+                FileNode.model_construct(
+                    name=name, path=child_path, type=node_type, children=children
+                )
+            )
+        return nodes
+
+    def to_flat(
+        self,
+        path: str = "",
+        depth: Optional[int] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Compact encoding: a flat, tree-ordered list of paths where folders
+        end with "/". Pagination applies to the top level only.
+        """
+        flat = []
+        entries, _ = self.children(path, offset, limit)
+        for _, child_path, node_type in entries:
+            if node_type == FILE:
+                flat.append(child_path)
+                continue
+            flat.append(child_path + "/")
+            if depth is None or depth > 1:
+                flat.extend(
+                    self.to_flat(child_path, None if depth is None else depth - 1)
+                )
+        return flat
+
+
+_indexes: Dict[str, Tuple[PathIndex, float]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_path_index(repo_name: str) -> PathIndex:
+    """
+    Return the cached path index of a repository, building it on first use.
+
+    Entries expire after the collection-handle TTL so other workers' ingests
+    become visible; this process's ingests invalidate it immediately.
+    """
+    cached = _indexes.get(repo_name)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    index = PathIndex(get_all_files(repo_name))
+    ttl = get_chroma_pool_settings().collection_ttl_seconds
+    with _indexes_lock:
+        _indexes[repo_name] = (index, time.monotonic() + ttl)
+    logger.info(f"Built path index for {repo_name} with {len(index.files)} files")
+    return index
+
+
+def invalidate_path_index(repo_name: str) -> None:
+    with _indexes_lock:
+        _indexes.pop(repo_name, None)
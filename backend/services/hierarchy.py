@@ -0,0 +1,192 @@
+"""
+File- and directory-level summary index for two-stage retrieval.
+
+At index time each file gets a short extractive summary (path, leading
+docstring or heading, top-level symbols) and each directory a summary of
+its files; both are embedded into the repo's `repo_{id}__files` collection.
+At query time the summaries pick candidate files and directories, and the
+chunk search is restricted to them, so large repos are searched in a much
+smaller space and answers draw on fewer, more coherent files.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Optional
+import logging
+import re
+
+from config import get_hierarchy_settings
+from services.chromadb_service import get_repo_registry, upsert_documents
+from services.embedding_providers import EmbeddingProvider
+from services.resilience import guarded_call
+
+logger = logging.getLogger(__name__)
+
+FILE = "file"
+DIRECTORY = "directory"
+
+SUMMARY_MAX_CHARS = 1200
+MAX_SYMBOLS = 40
+
+_SYMBOL = re.compile(
+    r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?"
+    r"(?:def|class|function|interface|type|enum|const|let)\s+([A-Za-z_$][\w$]*)",
+    re.MULTILINE,
+)
+_HEADING = re.compile(r"^#{1,3}\s+(.+)$", re.MULTILINE)
+_LEADING_DOC = re.compile(
+    r'^\s*(?:"""|\'\'\'|/\*\*?)(.*?)(?:"""|\'\'\'|\*/)', re.DOTALL
+)
+
+
+def file_symbols(content: str) -> List[str]:
+    """Top-level names defined in a file, or the headings of a document."""
+    names = _SYMBOL.findall(content) or _HEADING.findall(content)
+    return list(dict.fromkeys(name.strip() for name in names))[:MAX_SYMBOLS]
+
+
+def summarize_file(path: str, content: str) -> str:
+    """
+    Extractive summary: path, leading docstring/comment (or first lines) and
+    defined symbols. Cheap enough to build for every file of every ingest.
+    """
+    match = _LEADING_DOC.match(content)
+    lead = match.group(1) if match else content[:300]
+    symbols = file_symbols(content)
+    summary = f"File: {path}\n{' '.join(lead.split())[:400]}"
+    if symbols:
+        summary += f"\nDefines: {', '.join(symbols)}"
+    return summary[:SUMMARY_MAX_CHARS]
+
+
+def summarize_directory(directory: str, files: List[Dict]) -> str:
+    names = ", ".join(file["metadata"]["file_name"] for file in files)
+    symbols = [symbol for file in files for symbol in file_symbols(file["content"])[:5]]
+    summary = f"Directory: {directory}\nFiles: {names}"
+    if symbols:
+        summary += f"\nDefines: {', '.join(symbols[:MAX_SYMBOLS])}"
+    return summary[:SUMMARY_MAX_CHARS]
+
+
+def build_summary_index(
+    repo_name: str, docs: List[Dict], provider: EmbeddingProvider, index_run: str
+) -> Dict:
+    """
+    Embed file and directory summaries of loaded files (repo-relative paths,
+    as returned by load_files with repo_dir) into the summary collection,
+    replacing entries of files that no longer exist.
+
+    Returns:
+        Counts of summarized files and directories
+    """
+    by_directory: Dict[str, List[Dict]] = defaultdict(list)
+    entries = []
+    for doc in docs:
+        metadata = doc["metadata"]
+        by_directory[metadata["directory"]].append(doc)
+        entries.append(
+            (
+                f"{FILE}::{metadata['file_path']}",
+                summarize_file(metadata["file_path"], doc["content"]),
+                {
+                    "kind": FILE,
+                    "file_path": metadata["file_path"],
+                    "directory": metadata["directory"],
+                },
+            )
+        )
+    for directory, files in by_directory.items():
+        entries.append(
+            (
+                f"{DIRECTORY}::{directory}",
+                summarize_directory(directory, files),
+                {"kind": DIRECTORY, "directory": directory},
+            )
+        )
+
+    registry = get_repo_registry()
+    collection = registry.get_summary_collection(repo_name, create=True)
+    ids = [entry[0] for entry in entries]
+    summaries = [entry[1] for entry in entries]
+    for start in range(0, len(entries), 500):
+        batch = slice(start, start + 500)
+        upsert_documents(
+            collection,
+            ids=ids[batch],
+            embeddings=provider.embed(summaries[batch]),
+            documents=summaries[batch],
+            metadatas=[
+                {**entry[2], "index_run": index_run} for entry in entries[batch]
+            ],
+        )
+
+    current = set(ids)
+    stale = [
+        chunk_id
+        for chunk_id in collection.get(include=[])["ids"]
+        if chunk_id not in current
+    ]
+    if stale:
+        collection.delete(ids=stale)
+    registry.invalidate(repo_name)
+
+    logger.info(
+        f"Built summary index for {repo_name}: {len(docs)} files, "
+        f"{len(by_directory)} directories, {len(stale)} stale entries removed"
+    )
+    return {
+        "files": len(docs),
+        "directories": len(by_directory),
+        "stale_removed": len(stale),
+    }
+
+
+def candidate_filter(
+    repo_name: str,
+    query_embedding: List[float],
+    filter_metadata: Optional[Dict] = None,
+) -> Optional[Dict]:
+    """
+    First stage: pick candidate files and directories from the summary index
+    and return a chunk `where` filter restricted to them (combined with
+    `filter_metadata`). Returns `filter_metadata` unchanged when the repo has
+    no summary index.
+    """
+    collection = get_repo_registry().get_summary_collection(repo_name)
+    if collection is None:
+        return filter_metadata
+    settings = get_hierarchy_settings()
+
+    def top(kind: str, n: int) -> List[Dict]:
+        if n <= 0:
+            return []
+        results = guarded_call(
+            "chroma",
+            "summary_query",
+            lambda: collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n,
+                where={"kind": kind},
+                include=["metadatas"],
+            ),
+            hedge=True,
+        )
+        return results["metadatas"][0] if results and results["ids"] else []
+
+    files = [entry["file_path"] for entry in top(FILE, settings.candidate_files)]
+    directories = [
+        entry["directory"] for entry in top(DIRECTORY, settings.candidate_directories)
+    ]
+    if not files and not directories:
+        return filter_metadata
+
+    logger.info(
+        f"Hierarchical search in {repo_name}: {len(files)} candidate files, "
+        f"directories {directories}"
+    )
+    scopes = []
+    if files:
+        scopes.append({"file_path": {"$in": files}})
+    if directories:
+        scopes.append({"directory": {"$in": directories}})
+    scope = scopes[0] if len(scopes) == 1 else {"$or": scopes}
+    return {"$and": [filter_metadata, scope]} if filter_metadata else scope
@@ -0,0 +1,97 @@
+"""
+Durable ingest checkpoints.
+
+After every committed batch the ingest records how far it got. A retried
+or restarted ingest of the same commit with the same chunk set resumes
+after the last committed batch instead of re-embedding everything; chunk
+ids are deterministic, so re-upserting a partly written batch is harmless.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import hashlib
+
+from services.local_store import LocalStore, get_local_store
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    repo_name TEXT PRIMARY KEY,
+    commit_sha TEXT,
+    fingerprint TEXT NOT NULL,
+    index_run TEXT NOT NULL,
+    files_total INTEGER NOT NULL,
+    files_committed INTEGER NOT NULL,
+    chunks_total INTEGER NOT NULL,
+    chunks_committed INTEGER NOT NULL,
+    batches_committed INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+def _store() -> LocalStore:
+    return get_local_store("ingest_checkpoints", _SCHEMA)
+
+
+def chunk_fingerprint(chunks: List[Dict], provider_description: Dict) -> str:
+    """
+    Identify a chunk list (ids, order and content) and the embedder, so a
+    checkpoint is only reused for exactly the same work.
+    """
+    digest = hashlib.sha256(repr(sorted(provider_description.items())).encode())
+    for chunk in chunks:
+        digest.update(chunk["id"].encode("utf-8"))
+        digest.update(hashlib.sha256(chunk["document"].encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+def load_checkpoint(
+    repo_name: str, commit_sha: Optional[str], fingerprint: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Return the repo's checkpoint if it was written for the same commit and
+    chunk fingerprint, else None.
+    """
+    row = _store().fetchone(
+        "SELECT * FROM ingest_checkpoints WHERE repo_name = ?", (repo_name,)
+    )
+    if row is None or row["fingerprint"] != fingerprint:
+        return None
+    if row["commit_sha"] != commit_sha:
+        return None
+    return row
+
+
+def save_checkpoint(
+    repo_name: str,
+    *,
+    commit_sha: Optional[str],
+    fingerprint: str,
+    index_run: str,
+    files_total: int,
+    files_committed: int,
+    chunks_total: int,
+    chunks_committed: int,
+    batches_committed: int,
+) -> None:
+    _store().execute(
+        "INSERT OR REPLACE INTO ingest_checkpoints (repo_name, commit_sha, fingerprint, "
+        "index_run, files_total, files_committed, chunks_total, chunks_committed, "
+        "batches_committed, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            repo_name,
+            commit_sha,
+            fingerprint,
+            index_run,
+            files_total,
+            files_committed,
+            chunks_total,
+            chunks_committed,
+            batches_committed,
+            datetime.utcnow().isoformat() + "Z",
+        ),
+    )
+
+
+def clear_checkpoint(repo_name: str) -> None:
+    _store().execute("DELETE FROM ingest_checkpoints WHERE repo_name = ?", (repo_name,))
@@ -0,0 +1,154 @@
+"""
+Persistent status of ingest jobs.
+
+An ingest commits its chunks in priority order, so a repo becomes searchable
+long before the job finishes. Jobs record how far they got, which the
+status endpoints report as the searchable fraction of the repo.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import json
+import uuid
+
+from services.local_store import LocalStore, get_local_store
+
+QUEUED = "queued"
+RUNNING = "running"
+PARTIAL = "partial"  # some chunks committed and searchable
+READY = "ready"
+FAILED = "failed"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING, PARTIAL)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    job_id TEXT PRIMARY KEY,
+    repo_name TEXT NOT NULL,
+    repo_url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    chunks_total INTEGER NOT NULL DEFAULT 0,
+    chunks_indexed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result_json TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ingest_jobs_repo ON ingest_jobs (repo_name, created_at);
+"""
+
+
+def _store() -> LocalStore:
+    return get_local_store("ingest_jobs", _SCHEMA)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _to_job(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    result_json = row.pop("result_json")
+    row["result"] = json.loads(result_json) if result_json else None
+    row["searchable_fraction"] = (
+        row["chunks_indexed"] / row["chunks_total"] if row["chunks_total"] else 0.0
+    )
+    return row
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def create_job(repo_name: str, repo_url: str, job_id: Optional[str] = None) -> str:
+    job_id = job_id or new_job_id()
+    now = _now()
+    _store().execute(
+        "INSERT INTO ingest_jobs (job_id, repo_name, repo_url, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (job_id, repo_name, repo_url, QUEUED, now, now),
+    )
+    return job_id
+
+
+def update_job(
+    job_id: str,
+    *,
+    status: Optional[str] = None,
+    chunks_total: Optional[int] = None,
+    chunks_indexed: Optional[int] = None,
+    error: Optional[str] = None,
+    result: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Update the given fields of a job; fields left as None are unchanged.
+    """
+    fields = {
+        "status": status,
+        "chunks_total": chunks_total,
+        "chunks_indexed": chunks_indexed,
+        "error": error,
+        "result_json": json.dumps(result, default=str) if result is not None else None,
+    }
+    updates = {key: value for key, value in fields.items() if value is not None}
+    updates["updated_at"] = _now()
+    assignments = ", ".join(f"{key} = ?" for key in updates)
+    _store().execute(
+        f"UPDATE ingest_jobs SET {assignments} WHERE job_id = ?",
+        (*updates.values(), job_id),
+    )
+
+
+def touch_job(job_id: str) -> None:
+    """Record that an active job's process is still working on it."""
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    _store().execute(
+        f"UPDATE ingest_jobs SET updated_at = ? WHERE job_id = ? AND status IN ({placeholders})",
+        (_now(), job_id, *ACTIVE_STATUSES),
+    )
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _to_job(
+        _store().fetchone("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,))
+    )
+
+
+def get_latest_job(repo_name: str) -> Optional[Dict[str, Any]]:
+    return _to_job(
+        _store().fetchone(
+            "SELECT * FROM ingest_jobs WHERE repo_name = ? ORDER BY created_at DESC LIMIT 1",
+            (repo_name,),
+        )
+    )
+
+
+def list_interrupted_jobs(stale_seconds: float) -> List[Dict[str, Any]]:
+    """
+    Active jobs not updated for `stale_seconds`, i.e. whose process most
+    likely died; running jobs are touched more often than that (touch_job).
+    """
+    cutoff = (datetime.utcnow() - timedelta(seconds=stale_seconds)).isoformat() + "Z"
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    rows = _store().fetchall(
+        f"SELECT * FROM ingest_jobs WHERE status IN ({placeholders}) AND updated_at < ? "
+        "ORDER BY created_at",
+        (*ACTIVE_STATUSES, cutoff),
+    )
+    return [_to_job(row) for row in rows]
+
+
+def claim_job(job_id: str, seen_updated_at: str) -> bool:
+    """
+    Take over an interrupted job. Succeeds for exactly one caller: the row is
+    only updated if nobody touched it since `seen_updated_at` was read.
+    """
+    return (
+        _store().execute(
+            "UPDATE ingest_jobs SET status = ?, updated_at = ? "
+            "WHERE job_id = ? AND updated_at = ?",
+            (QUEUED, _now(), job_id, seen_updated_at),
+        )
+        == 1
+    )
@@ -0,0 +1,92 @@
+"""
+Thread-safe SQLite stores for the backend's local durable state.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import logging
+import sqlite3
+import threading
+
+from config import get_storage_settings
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStore:
+    """
+    A single SQLite database file shared by every thread of the process.
+
+    All statements are serialized through one lock so the store can be used
+    from thread pools and from the event loop alike.
+    """
+
+    def __init__(self, path: Path, schema: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(schema)
+        self._conn.commit()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run several statements atomically; commits on success, rolls back on error.
+        """
+        with self._lock:
+            try:
+                yield self._conn
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """
+        Execute a single write statement and return the number of affected rows.
+        """
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def executemany(self, sql: str, rows: Sequence[Sequence[Any]]) -> None:
+        with self.transaction() as conn:
+            conn.executemany(sql, rows)
+
+    def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+
+_stores: Dict[str, LocalStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_local_store(name: str, schema: str) -> LocalStore:
+    """
+    Return the process-wide store `<data_dir>/<name>.db`, creating it on first use.
+
+    Args:
+        name: Database file stem
+        schema: Idempotent DDL (CREATE TABLE IF NOT EXISTS ...) applied on open
+
+    Returns:
+        LocalStore singleton for that name
+    """
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            path = get_storage_settings().data_dir / f"{name}.db"
+            logger.info(f"Opening local store {path}")
+            store = LocalStore(path, schema)
+            _stores[name] = store
+        return store
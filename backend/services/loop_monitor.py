@@ -0,0 +1,74 @@
+"""
+Event-loop lag monitor.
+
+A background task sleeps for a fixed interval and records how late it wakes
+up. Lag grows when something blocks the loop (sync work in an async
+endpoint, a starved thread pool handing results back), so it is the first
+number to look at when latency collapses under concurrency.
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# Samples kept for percentiles
+LAG_WINDOW = 2400
+
+
+class EventLoopLagMonitor:
+    """
+    Samples event-loop lag every `interval_seconds` (0 disables sampling).
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._samples: Deque[float] = deque(maxlen=LAG_WINDOW)
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            lag = max(0.0, time.monotonic() - expected)
+            self._samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self.max_lag = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self._samples)
+
+        def milliseconds(percentile: float) -> Optional[float]:
+            if not ordered:
+                return None
+            rank = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+            return round(ordered[rank] * 1000, 2)
+
+        return {
+            "interval_ms": round(self.interval_seconds * 1000, 2),
+            "samples": len(ordered),
+            "p50_ms": milliseconds(50),
+            "p99_ms": milliseconds(99),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
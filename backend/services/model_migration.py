@@ -0,0 +1,353 @@
+"""
+Zero-downtime embedding model migration with blue/green collections.
+
+A migration re-embeds a repo's chunks with another embedding provider or
+model into a new versioned collection `repo_{id}__v{n}` while queries keep
+using the current one:
+
+1. prepare_migration creates the new version, or reuses an unfinished one
+   for the same provider.
+2. sync_version copies chunks in throttled batches, embedding only those
+   missing from the new version or rewritten by an ingest since they were
+   copied, so it is resumable and cheap to repeat.
+3. complete_migration runs a final sync (callers hold the repo's ingest lock
+   so nothing is written meanwhile) and switches the repo's alias to the new
+   version in one metadata write.
+4. retire_inactive_collections drops the previous version once in-flight
+   queries are done with it (MIGRATION_RETAIN_SECONDS). The time is stored
+   with the switch, so pending_retirements finds it again after a restart.
+"""
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+import logging
+import re
+import time
+
+from config import MigrationSettings, get_migration_settings
+from services.chromadb_service import (
+    get_chroma_client,
+    get_repo_registry,
+    upsert_documents,
+)
+from services.embedding_providers import EmbeddingProvider, provider_for_metadata
+from services.repo_registry import (
+    AUXILIARY_SEPARATOR,
+    COLLECTION_VERSION_KEY,
+    RETIRE_AFTER_KEY,
+    VERSION_PREFIX,
+    collection_name,
+    summary_collection_name,
+    versioned_collection_name,
+)
+
+if TYPE_CHECKING:
+    from chromadb.api.models.Collection import Collection
+
+logger = logging.getLogger(__name__)
+
+# Metadata of a versioned collection
+MIGRATION_STATUS_KEY = "migration_status"
+BUILDING = "building"
+ACTIVE = "active"
+
+
+class MigrationError(ValueError):
+    """Raised when a repo cannot be migrated to the requested provider."""
+
+
+class _Throttle:
+    """Spaces out work to at most `per_second` units per second (0 = unlimited)."""
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.started = time.monotonic()
+        self.done = 0
+
+    def wait(self, units: int) -> None:
+        if self.per_second <= 0:
+            return
+        self.done += units
+        delay = self.started + self.done / self.per_second - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _version_of(repo_name: str, name: str) -> Optional[int]:
+    match = re.fullmatch(
+        re.escape(collection_name(repo_name))
+        + rf"{AUXILIARY_SEPARATOR}{VERSION_PREFIX}(\d+)",
+        name,
+    )
+    return int(match.group(1)) if match else None
+
+
+def _version_metadata(provider: EmbeddingProvider, status: str, **progress) -> Dict:
+    return {**provider.describe(), MIGRATION_STATUS_KEY: status, **progress}
+
+
+def next_collection_version(repo_name: str) -> int:
+    """The version number after every existing (or recorded) one of a repo."""
+    registry = get_repo_registry()
+    versions = [registry.get_index_metadata(repo_name).get(COLLECTION_VERSION_KEY, 0)]
+    for name in registry.list_repo_collections(repo_name):
+        version = _version_of(repo_name, name)
+        if version is not None:
+            versions.append(version)
+    return max(versions) + 1
+
+
+def prepare_migration(repo_name: str, provider: EmbeddingProvider) -> "Collection":
+    """
+    Return the versioned collection to migrate a repo into, reusing an
+    unfinished one built for the same provider.
+
+    Raises:
+        MigrationError: If the repo is already served by that provider
+    """
+    registry = get_repo_registry()
+    metadata = registry.get_index_metadata(repo_name)
+    current = provider_for_metadata(metadata)
+    if current.describe() == provider.describe():
+        raise MigrationError(
+            f"{repo_name} is already embedded with {provider.name}/{provider.model}"
+        )
+
+    client = get_chroma_client()
+    active = registry.get_collection(repo_name).name
+    versions = [metadata.get(COLLECTION_VERSION_KEY, 0)]
+    for name in registry.list_repo_collections(repo_name):
+        version = _version_of(repo_name, name)
+        if version is None or name == active:
+            continue
+        versions.append(version)
+        candidate = client.get_collection(name)
+        candidate_metadata = candidate.metadata or {}
+        if (
+            candidate_metadata.get(MIGRATION_STATUS_KEY) == BUILDING
+            and provider_for_metadata(candidate_metadata).describe()
+            == provider.describe()
+        ):
+            logger.info(f"Resuming migration of {repo_name} into {name}")
+            return candidate
+
+    name = versioned_collection_name(repo_name, max(versions) + 1)
+    logger.info(
+        f"Migrating {repo_name} from {current.name}/{current.model} to "
+        f"{provider.name}/{provider.model} in {name}"
+    )
+    return client.get_or_create_collection(
+        name=name, metadata=_version_metadata(provider, BUILDING)
+    )
+
+
+def _list_ids(collection: "Collection", batch_size: int) -> List[str]:
+    ids: List[str] = []
+    while True:
+        page = collection.get(include=[], limit=batch_size, offset=len(ids))
+        if not page["ids"]:
+            return ids
+        ids.extend(page["ids"])
+
+
+def _sync_collection(
+    source: "Collection",
+    target: "Collection",
+    provider: EmbeddingProvider,
+    settings: MigrationSettings,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, int]:
+    """
+    Make `target` hold every chunk of `source`, embedded with `provider`.
+
+    A chunk is (re-)embedded when it is missing from the target or its
+    index_run differs, i.e. an ingest rewrote it after it was copied.
+    """
+    throttle = _Throttle(settings.max_chunks_per_second)
+    total = source.count()
+    source_ids = set()
+    embedded = 0
+    offset = 0
+    while True:
+        page = source.get(
+            include=["documents", "metadatas"],
+            limit=settings.batch_chunks,
+            offset=offset,
+        )
+        ids = page["ids"]
+        if not ids:
+            break
+        offset += len(ids)
+        source_ids.update(ids)
+
+        copied = target.get(ids=ids, include=["metadatas"])
+        copied_runs = {
+            chunk_id: (metadata or {}).get("index_run")
+            for chunk_id, metadata in zip(copied["ids"], copied["metadatas"])
+        }
+        pending = [
+            i
+            for i, chunk_id in enumerate(ids)
+            if chunk_id not in copied_runs
+            or copied_runs[chunk_id] != (page["metadatas"][i] or {}).get("index_run")
+        ]
+        if pending:
+            documents = [page["documents"][i] for i in pending]
+            # Exact duplicates (see services.dedup) are embedded once
+            unique = list(dict.fromkeys(documents))
+            vectors = dict(zip(unique, provider.embed(unique)))
+            upsert_documents(
+                target,
+                ids=[ids[i] for i in pending],
+                embeddings=[vectors[document] for document in documents],
+                documents=documents,
+                metadatas=[page["metadatas"][i] for i in pending],
+            )
+            embedded += len(unique)
+            throttle.wait(len(unique))
+        if on_batch is not None:
+            on_batch(offset, total)
+
+    stale = [
+        chunk_id
+        for chunk_id in _list_ids(target, settings.batch_chunks)
+        if chunk_id not in source_ids
+    ]
+    for start in range(0, len(stale), settings.batch_chunks):
+        target.delete(ids=stale[start : start + settings.batch_chunks])
+    return {"chunks": len(source_ids), "embedded": embedded, "removed": len(stale)}
+
+
+def sync_version(
+    repo_name: str, target: "Collection", provider: EmbeddingProvider
+) -> Dict[str, Any]:
+    """
+    Bring a version being built up to date with the repo's active collection
+    (chunks and, if built, file/directory summaries). Progress is recorded on
+    the version's metadata.
+    """
+    settings = get_migration_settings()
+    registry = get_repo_registry()
+    source = registry.get_collection(repo_name)
+
+    def on_batch(synced: int, total: int):
+        target.modify(
+            metadata=_version_metadata(
+                provider, BUILDING, chunks_synced=synced, chunks_total=total
+            )
+        )
+
+    result = _sync_collection(source, target, provider, settings, on_batch)
+    summaries = registry.get_summary_collection(repo_name)
+    if summaries is not None:
+        target_summaries = get_chroma_client().get_or_create_collection(
+            summary_collection_name(target.name)
+        )
+        result["summaries"] = _sync_collection(
+            summaries, target_summaries, provider, settings
+        )
+    logger.info(f"Synced {target.name} with {source.name}: {result}")
+    return result
+
+
+def complete_migration(
+    repo_name: str, target: "Collection", provider: EmbeddingProvider
+) -> Dict[str, Any]:
+    """
+    Final sync, then switch the repo to the new version.
+
+    Callers must keep ingests of the repo out while this runs, so nothing is
+    written to the old collection between the final sync and the switch.
+    """
+    result = sync_version(repo_name, target, provider)
+    target.modify(metadata=_version_metadata(provider, ACTIVE))
+    version = _version_of(repo_name, target.name)
+    metadata = get_repo_registry().set_active_collection(
+        repo_name,
+        target.name,
+        version,
+        provider.describe(),
+        retire_after=time.time() + get_migration_settings().retain_seconds,
+    )
+    return {
+        "repo_name": repo_name,
+        "collection_name": target.name,
+        "collection_version": version,
+        "final_sync": result,
+        **{key: metadata.get(key) for key in provider.describe()},
+    }
+
+
+def retire_inactive_collections(repo_name: str) -> List[str]:
+    """
+    Delete every version of a repo other than the active one (and its
+    summaries), and empty the `repo_{id}` anchor once it no longer serves
+    chunks.
+
+    Returns:
+        Names of the deleted or emptied collections
+    """
+    registry = get_repo_registry()
+    active = registry.refresh(repo_name)
+    anchor_name = collection_name(repo_name)
+    keep = {anchor_name, active.name, summary_collection_name(active.name)}
+    client = get_chroma_client()
+    retired = []
+    for name in registry.list_repo_collections(repo_name):
+        if name not in keep:
+            client.delete_collection(name)
+            retired.append(name)
+
+    if active.name != anchor_name:
+        anchor = client.get_collection(anchor_name)
+        batch_size = get_migration_settings().batch_chunks
+        # Deleting shifts later chunks forward, so always take the first page
+        while True:
+            page = anchor.get(include=[], limit=batch_size)
+            if not page["ids"]:
+                break
+            anchor.delete(ids=page["ids"])
+            if anchor_name not in retired:
+                retired.append(anchor_name)
+    registry.set_retire_after(repo_name, None)
+    if retired:
+        logger.info(f"Retired collections of {repo_name}: {retired}")
+    return retired
+
+
+def pending_retirements() -> Dict[str, float]:
+    """Repos with inactive versions to retire, and when (epoch seconds)."""
+    return {
+        repo["repo_name"]: float(repo[RETIRE_AFTER_KEY])
+        for repo in get_repo_registry().list_repos()
+        if repo.get(RETIRE_AFTER_KEY) is not None
+    }
+
+
+def get_migration_status(repo_name: str) -> Dict[str, Any]:
+    """
+    The collection serving a repo and every other version with its progress.
+    """
+    registry = get_repo_registry()
+    metadata = registry.get_index_metadata(repo_name)
+    active = registry.get_collection(repo_name).name
+    client = get_chroma_client()
+    versions = []
+    for name in registry.list_repo_collections(repo_name):
+        version = _version_of(repo_name, name)
+        if version is None:
+            continue
+        versions.append(
+            {
+                "collection_name": name,
+                "collection_version": version,
+                "active": name == active,
+                **(client.get_collection(name).metadata or {}),
+            }
+        )
+    return {
+        "repo_name": repo_name,
+        "active_collection": active,
+        "collection_version": metadata.get(COLLECTION_VERSION_KEY, 0),
+        **provider_for_metadata(metadata).describe(),
+        "versions": versions,
+    }
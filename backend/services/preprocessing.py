@@ -1,5 +1,7 @@
 from pathlib import Path
 
+from services.scope import ancestor_metadata
+
 LANGUAGE_BY_EXTENSION = {
     ".py": "python",
     ".js": "javascript",
@@ -17,10 +19,17 @@ LANGUAGE_BY_EXTENSION = {
     ".rst": "rst",
 }
 
-def load_files(file_paths):
+def load_files(file_paths, repo_dir=None):
+    """
+    Read files and attach metadata. With repo_dir, paths are recorded relative
+    to the checkout ("src/app.py"), so they are stable across clones, and each
+    file carries its directory ancestry for scoped search (services.scope).
+    """
     docs = []
     for path in file_paths:
         text = Path(path).read_text(encoding="utf-8", errors="ignore")
+        if repo_dir is not None:
+            path = Path(path).relative_to(repo_dir).as_posix()
 
         # --- Add metadata here ---
         extension = Path(path).suffix.lower()
@@ -33,6 +42,8 @@ def load_files(file_paths):
             "chars": len(text),
             "language": LANGUAGE_BY_EXTENSION.get(extension, "unknown"),
         }
+        if repo_dir is not None:
+            metadata.update(ancestor_metadata(path))
 
         docs.append({
             "source": str(path),
@@ -40,3 +51,11 @@ def load_files(file_paths):
             "metadata": metadata
         })
     return docs
+
+
+def relative_source(doc, repo_dir):
+    """Repo-relative "/"-separated path of a loaded file, whichever way it was loaded."""
+    path = Path(doc["source"])
+    if path.is_absolute():
+        path = path.relative_to(repo_dir)
+    return path.as_posix()
@@ -0,0 +1,104 @@
+"""
+Ingest ordering: the files that answer most questions are indexed first.
+
+READMEs and docs, then manifests, then entry points, then the rest of the
+source (shallow paths before deep ones), with tests and examples last.
+"""
+
+from pathlib import Path
+from typing import Dict, List
+import re
+
+from services.preprocessing import relative_source
+
+README = re.compile(r"^(readme|index)(\.[a-z]+)?$", re.IGNORECASE)
+DOC_NAMES = re.compile(
+    r"^(contributing|changelog|architecture|overview|getting[-_]started)",
+    re.IGNORECASE,
+)
+DOC_DIRS = {"docs", "doc", "documentation", "guide", "guides"}
+DOC_EXTENSIONS = {".md", ".markdown", ".mdx", ".rst", ".txt"}
+MANIFESTS = {
+    "package.json",
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+    "requirements.txt",
+    "cargo.toml",
+    "go.mod",
+    "pom.xml",
+    "build.gradle",
+    "gemfile",
+    "composer.json",
+    "tsconfig.json",
+    "dockerfile",
+    "docker-compose.yml",
+    "docker-compose.yaml",
+}
+ENTRY_POINTS = {
+    "main",
+    "__main__",
+    "app",
+    "index",
+    "server",
+    "cli",
+    "api",
+    "routes",
+    "__init__",
+}
+LOW_VALUE_DIRS = {
+    "test",
+    "tests",
+    "__tests__",
+    "spec",
+    "specs",
+    "examples",
+    "example",
+    "fixtures",
+    "benchmarks",
+}
+
+# Tiers, in indexing order
+README_TIER = 0
+DOCS_TIER = 1
+MANIFEST_TIER = 2
+ENTRY_POINT_TIER = 3
+SOURCE_TIER = 4
+LOW_VALUE_TIER = 5
+
+
+def file_priority(path: str) -> int:
+    """
+    Return the indexing tier of a repo-relative path (lower goes first).
+    """
+    parts = path.lower().split("/")
+    name = parts[-1]
+    directories = set(parts[:-1])
+    suffix = Path(name).suffix
+
+    if directories & LOW_VALUE_DIRS or name.startswith("test_") or ".test." in name:
+        return LOW_VALUE_TIER
+    if README.match(name) and suffix in DOC_EXTENSIONS:
+        return README_TIER
+    if suffix in DOC_EXTENSIONS and (directories & DOC_DIRS or DOC_NAMES.match(name)):
+        return DOCS_TIER
+    if name in MANIFESTS and len(parts) <= 2:
+        return MANIFEST_TIER
+    if Path(name).stem in ENTRY_POINTS and len(parts) <= 3:
+        return ENTRY_POINT_TIER
+    if suffix in DOC_EXTENSIONS:
+        return DOCS_TIER
+    return SOURCE_TIER
+
+
+def prioritize_docs(docs: List[Dict], repo_dir: str) -> List[Dict]:
+    """
+    Order loaded files (as returned by load_files) for progressive indexing:
+    by tier, then by path depth, then by path.
+    """
+
+    def key(doc: Dict):
+        path = relative_source(doc, repo_dir)
+        return (file_priority(path), path.count("/"), path)
+
+    return sorted(docs, key=key)
@@ -0,0 +1,317 @@
+"""
+Sampling profiler, flamegraph rendering and profile storage.
+
+A single sampler thread snapshots every thread's stack at a fixed interval
+(sys._current_frames) while any profile is being recorded, or all the time
+when slow-request capture is on. A request's profile is the samples taken
+during its lifetime, so it covers the event loop as well as the worker
+threads it hands work to (run_in_threadpool, the Chroma executor, hedged
+calls, the doc summary pool). Threads parked without backend code on their
+stack are left out; samples of concurrent requests are not separated.
+
+Profiles are stored under `<data_dir>/profiles/` as an SVG flamegraph, the
+folded stacks (for flamegraph.pl / speedscope) and a JSON description.
+"""
+
+from collections import Counter, deque
+from functools import lru_cache
+from html import escape
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import re
+import secrets
+import sys
+import threading
+import time
+
+from config import get_profiling_settings, get_storage_settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+_BACKEND_PREFIX = str(BACKEND_DIR) + "/"
+_LIBRARY_MARKERS = ("/site-packages/", "/dist-packages/")
+
+Stack = Tuple[str, ...]
+
+
+def _is_app_file(filename: str) -> bool:
+    return filename.startswith(_BACKEND_PREFIX) and not any(
+        marker in filename for marker in _LIBRARY_MARKERS
+    )
+
+
+def _short_path(filename: str) -> str:
+    for marker in _LIBRARY_MARKERS:
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    if filename.startswith(_BACKEND_PREFIX):
+        return filename[len(_BACKEND_PREFIX) :]
+    # Standard library
+    return filename.rsplit("/", 1)[-1]
+
+
+def _thread_role(name: str) -> str:
+    # "ThreadPoolExecutor-0_3" and "hedge_12" are the same role as their siblings
+    return re.sub(r"[-_]\d+(_\d+)?$", "", name)
+
+
+class StackSampler:
+    """
+    Process-wide stack sampler. Runs while at least one user holds it and
+    keeps the last `buffer_seconds` of samples.
+    """
+
+    def __init__(self, interval_seconds: float, buffer_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._samples: Deque[Tuple[float, Stack]] = deque(
+            maxlen=max(1, int(buffer_seconds / interval_seconds))
+        )
+        self._labels: Dict[Any, str] = {}
+        self._users = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            self._users += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (
+                f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            )
+        return label
+
+    def _stack(self, frame, thread_name: str) -> Optional[Stack]:
+        labels = []
+        in_app = False
+        while frame is not None:
+            code = frame.f_code
+            in_app = in_app or _is_app_file(code.co_filename)
+            labels.append(self._label(code))
+            frame = frame.f_back
+        if not in_app:
+            return None
+        labels.append(f"thread: {_thread_role(thread_name)}")
+        return tuple(reversed(labels))
+
+    def _sample(self) -> None:
+        now = time.monotonic()
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = self._stack(frame, names.get(ident, "unknown"))
+            if stack is not None:
+                self._samples.append((now, stack))
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._users <= 0:
+                    self._thread = None
+                    return
+            self._sample()
+            time.sleep(self.interval_seconds)
+
+    def samples_between(self, start: float, end: float) -> Counter:
+        """Folded stack counts of the samples taken between two monotonic times."""
+        return Counter(
+            stack for taken, stack in list(self._samples) if start <= taken <= end
+        )
+
+
+_sampler: Optional[StackSampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_stack_sampler() -> StackSampler:
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            settings = get_profiling_settings()
+            _sampler = StackSampler(
+                settings.sample_interval_seconds, settings.buffer_seconds
+            )
+        return _sampler
+
+
+# --- flamegraphs ---
+
+FRAME_HEIGHT = 16
+GRAPH_WIDTH = 1200
+CHAR_WIDTH = 7
+MIN_WIDTH = 0.5
+
+
+def folded_stacks(stacks: Counter) -> str:
+    """Brendan Gregg's folded format: one "frame;frame;frame count" per line."""
+    return "".join(
+        f"{';'.join(stack)} {count}\n" for stack, count in sorted(stacks.items())
+    )
+
+
+@lru_cache(maxsize=None)
+def _is_app_label(label: str) -> bool:
+    if not label.endswith(")") or "(" not in label:
+        return False
+    return (BACKEND_DIR / label.rsplit("(", 1)[1].rsplit(":", 1)[0]).is_file()
+
+
+def _color(label: str) -> str:
+    if label.startswith("thread: "):
+        return "rgb(200,200,200)"
+    digest = hashlib.md5(label.encode()).digest()
+    if _is_app_label(label):
+        # Backend code in orange, libraries and the stdlib in yellow
+        return f"rgb(240,{120 + digest[0] % 60},{40 + digest[1] % 40})"
+    return f"rgb(230,{170 + digest[0] % 70},{50 + digest[1] % 50})"
+
+
+def render_flamegraph(stacks: Counter, title: str) -> str:
+    """Render folded stack counts as a self-contained SVG flamegraph."""
+    total = sum(stacks.values())
+    tree: Dict[str, Any] = {"children": {}, "value": 0}
+    depth = 0
+    for stack, count in stacks.items():
+        node = tree
+        node["value"] += count
+        depth = max(depth, len(stack))
+        for label in stack:
+            node = node["children"].setdefault(label, {"children": {}, "value": 0})
+            node["value"] += count
+
+    height = (depth + 3) * FRAME_HEIGHT
+    rects: List[str] = []
+
+    def draw(node: Dict[str, Any], x: float, level: int) -> None:
+        for label, child in sorted(node["children"].items()):
+            width = child["value"] / total * GRAPH_WIDTH
+            if width >= MIN_WIDTH:
+                y = height - (level + 2) * FRAME_HEIGHT
+                share = 100 * child["value"] / total
+                text = ""
+                if width > 3 * CHAR_WIDTH:
+                    chars = int(width / CHAR_WIDTH) - 1
+                    shown = label if len(label) <= chars else label[: chars - 2] + ".."
+                    text = (
+                        f'<text x="{x + 3:.1f}" y="{y + FRAME_HEIGHT - 4}">'
+                        f"{escape(shown)}</text>"
+                    )
+                rects.append(
+                    f'<g><title>{escape(label)} ({child["value"]} samples, '
+                    f'{share:.1f}%)</title><rect x="{x:.1f}" y="{y}" '
+                    f'width="{width:.1f}" height="{FRAME_HEIGHT - 1}" '
+                    f'fill="{_color(label)}" rx="2"/>{text}</g>'
+                )
+                draw(child, x, level + 1)
+            x += width
+
+    if total:
+        draw(tree, 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{GRAPH_WIDTH}" '
+        f'height="{height}" font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fafafa"/>'
+        f'<text x="4" y="14" font-size="13">{escape(title)} ({total} samples)</text>'
+        + "".join(rects)
+        + "</svg>"
+    )
+
+
+# --- storage ---
+
+
+class ProfileStore:
+    """
+    Profiles on disk, pruned to the newest `retention_count` younger than
+    `retention_seconds`.
+    """
+
+    def __init__(self, directory: Path, retention_count: int, retention_seconds: float):
+        self.directory = directory
+        self.retention_count = retention_count
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        return f"{time.strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(4)}"
+
+    def save(self, profile_id: str, stacks: Counter, info: Dict[str, Any]) -> Dict:
+        info = {
+            **info,
+            "profile_id": profile_id,
+            "samples": sum(stacks.values()),
+            "created_at": time.time(),
+        }
+        title = f"{info.get('method', '')} {info.get('path', '')}".strip()
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / f"{profile_id}.svg").write_text(
+                render_flamegraph(stacks, title)
+            )
+            (self.directory / f"{profile_id}.folded").write_text(folded_stacks(stacks))
+            (self.directory / f"{profile_id}.json").write_text(json.dumps(info))
+            self._prune()
+        logger.info(
+            f"Stored profile {profile_id} ({info['samples']} samples) of {title}"
+        )
+        return info
+
+    def list(self) -> List[Dict]:
+        """Stored profiles, newest first."""
+        profiles = []
+        for path in self.directory.glob("*.json"):
+            try:
+                profiles.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda info: info["created_at"], reverse=True)
+
+    def path(self, profile_id: str, suffix: str) -> Optional[Path]:
+        if not re.fullmatch(r"[\w-]+", profile_id):
+            return None
+        path = self.directory / f"{profile_id}.{suffix}"
+        return path if path.exists() else None
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        for index, info in enumerate(self.list()):
+            if index >= self.retention_count or info["created_at"] < cutoff:
+                for suffix in ("svg", "folded", "json"):
+                    (self.directory / f"{info['profile_id']}.{suffix}").unlink(
+                        missing_ok=True
+                    )
+
+
+_store: Optional[ProfileStore] = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            settings = get_profiling_settings()
+            _store = ProfileStore(
+                get_storage_settings().data_dir / "profiles",
+                settings.retention_count,
+                settings.retention_seconds,
+            )
+        return _store
@@ -0,0 +1,210 @@
+"""
+Quantized local vector index with full-precision rescoring.
+
+Vectors are kept as int8 codes (one scale per vector) or packed sign bits.
+Candidates are ranked on the compact codes, then the best `k * rescore_factor`
+are rescored exactly against the full-precision vectors, which stay on disk
+and are memory-mapped.
+
+Distances match Chroma's default "l2" space (squared euclidean), so results
+are interchangeable with `collection.query` results.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+import json
+import logging
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from config import get_chroma_pool_settings, get_storage_settings
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("int8", "binary")
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization.
+
+    Returns:
+        (codes of shape (n, d) int8, scales of shape (n,) float32)
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """
+    Sign-bit quantization, packed 8 dimensions per byte.
+    """
+    return np.packbits(vectors > 0, axis=1)
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class QuantizedIndex:
+    """
+    Brute-force search over quantized codes with exact rescoring.
+
+    Args:
+        ids: Chunk ids, in the same order as `vectors`
+        vectors: Full-precision vectors (n, d); may be a memory map
+        mode: "int8" or "binary"
+    """
+
+    def __init__(self, ids: Sequence[str], vectors: np.ndarray, mode: str = "int8"):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.ids = list(ids)
+        self.vectors = vectors
+        self.mode = mode
+        self._norms = np.einsum("ij,ij->i", vectors, vectors).astype(np.float32)
+        if mode == "int8":
+            self._codes, self._scales = quantize_int8(np.asarray(vectors))
+        else:
+            self._codes = quantize_binary(np.asarray(vectors))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def code_bytes(self) -> int:
+        """Memory held by the quantized codes (what candidate search scans)."""
+        size = self._codes.nbytes
+        if self.mode == "int8":
+            size += self._scales.nbytes
+        return size
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Higher is closer."""
+        if self.mode == "int8":
+            return (self._codes @ query) * self._scales
+        query_bits = quantize_binary(query[None, :])[0]
+        hamming = _POPCOUNT[np.bitwise_xor(self._codes, query_bits)].sum(
+            axis=1, dtype=np.int32
+        )
+        return -hamming
+
+    def search(
+        self, query: Sequence[float], k: int, rescore_factor: int = 4
+    ) -> List[Tuple[str, float]]:
+        """
+        Return the `k` nearest ids with their exact squared L2 distances.
+
+        Args:
+            query: Full-precision query vector
+            k: Number of results
+            rescore_factor: Candidates rescored per result (1 = no rescoring
+                beyond the k candidates themselves)
+        """
+        if not self.ids or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        scores = self._approximate_scores(query)
+
+        n_candidates = min(len(self.ids), max(k, k * rescore_factor))
+        if n_candidates < len(self.ids):
+            candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        else:
+            candidates = np.arange(len(self.ids))
+
+        # Exact rescoring: ||v||^2 + ||q||^2 - 2 v.q
+        candidates = np.sort(candidates)  # sequential reads from the memory map
+        dots = np.asarray(self.vectors[candidates]) @ query
+        distances = self._norms[candidates] + float(query @ query) - 2 * dots
+        order = np.argsort(distances)[:k]
+        return [(self.ids[candidates[i]], float(distances[i])) for i in order]
+
+    # --- persistence ---
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "vectors.npy", np.asarray(self.vectors, dtype=np.float32))
+        (directory / "ids.json").write_text(json.dumps(self.ids))
+
+    @classmethod
+    def load(cls, directory: Path, mode: str = "int8") -> "QuantizedIndex":
+        ids = json.loads((directory / "ids.json").read_text())
+        vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+        return cls(ids, vectors, mode)
+
+
+_indexes: Dict[Tuple[str, str], Tuple[QuantizedIndex, str, float]] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_dir(repo_name: str) -> Path:
+    return get_storage_settings().data_dir / "quantized" / repo_name
+
+
+def _build_index(repo_name: str, mode: str) -> QuantizedIndex:
+    from services.retrieval import iter_repo_chunks
+
+    ids, vectors = [], []
+    for chunk in iter_repo_chunks(repo_name, include=["embeddings"]):
+        ids.append(chunk["id"])
+        vectors.append(chunk["embedding"])
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+    return QuantizedIndex(ids, matrix, mode)
+
+
+def get_quantized_index(repo_name: str, mode: str) -> QuantizedIndex:
+    """
+    Return the repo's quantized index, building it from Chroma on first use.
+
+    Full-precision vectors are saved under `<data_dir>/quantized/<repo>/`
+    keyed by collection, index run and chunk count, so restarts and other
+    workers reuse them. Like path indexes, in-memory entries are re-validated after the
+    collection-handle TTL.
+    """
+    from services.chromadb_service import get_repo_registry
+
+    cached = _indexes.get((repo_name, mode))
+    if cached is not None and cached[2] > time.monotonic():
+        return cached[0]
+
+    registry = get_repo_registry()
+    index_run = registry.get_index_metadata(repo_name).get("index_run", "none")
+    collection = registry.get_collection(repo_name)
+    version = f"{collection.name}-{index_run}-{collection.count()}"
+    ttl = get_chroma_pool_settings().collection_ttl_seconds
+
+    if cached is not None and cached[1] == version:
+        index = cached[0]
+    else:
+        directory = _index_dir(repo_name) / version
+        if (directory / "ids.json").exists():
+            index = QuantizedIndex.load(directory, mode)
+        else:
+            index = _build_index(repo_name, mode)
+            # Replace older versions; they are never read again
+            shutil.rmtree(_index_dir(repo_name), ignore_errors=True)
+            index.save(directory)
+            index = QuantizedIndex.load(directory, mode)
+        logger.info(
+            f"Loaded {mode} index for {repo_name} with {len(index)} vectors "
+            f"({index.code_bytes / 1024:.1f} KiB of codes)"
+        )
+
+    with _indexes_lock:
+        _indexes[(repo_name, mode)] = (index, version, time.monotonic() + ttl)
+    return index
+
+
+def invalidate_quantized_index(repo_name: str) -> None:
+    with _indexes_lock:
+        for key in [key for key in _indexes if key[0] == repo_name]:
+            del _indexes[key]
+
+
+def delete_quantized_index(repo_name: str) -> None:
+    invalidate_quantized_index(repo_name)
+    shutil.rmtree(_index_dir(repo_name), ignore_errors=True)
@@ -0,0 +1,129 @@
+"""
+Debounced, coalescing scheduler for push-triggered re-indexes.
+
+Pushes to a repo are collected until the repo has been quiet for the
+debounce interval (or the first push has waited `max_delay_seconds`), then
+run as a single re-index of the latest commit. Pushes that arrive while the
+repo is being re-indexed are held back and run once it finishes, and at most
+`max_concurrent` re-indexes run at a time across repos.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import logging
+import time
+
+from services.webhooks import PushEvent
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingReindex:
+    repo_name: str
+    repo_url: str
+    commit_sha: str
+    first_push_at: float
+    pushes: int = 1
+
+
+class ReindexScheduler:
+    """
+    Per-repo debounce timers in front of a bounded pool of re-index runs.
+
+    Args:
+        run: Coroutine function performing one re-index
+        debounce_seconds: Quiet period after the last push
+        max_delay_seconds: Longest a push waits while pushes keep arriving
+        max_concurrent: Re-indexes running at once
+    """
+
+    def __init__(
+        self,
+        run: Callable[[PendingReindex], Awaitable[Any]],
+        debounce_seconds: float,
+        max_delay_seconds: float,
+        max_concurrent: int,
+    ):
+        self._run = run
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_concurrent = max_concurrent
+        self._pending: Dict[str, PendingReindex] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._running: Set[str] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pushes = 0
+        self.runs = 0
+        self.failures = 0
+
+    def submit(self, event: PushEvent) -> PendingReindex:
+        """
+        Record a push; returns the re-index it was coalesced into.
+        """
+        self.pushes += 1
+        pending = self._pending.get(event.repo_name)
+        if pending is None:
+            pending = self._pending[event.repo_name] = PendingReindex(
+                repo_name=event.repo_name,
+                repo_url=event.repo_url,
+                commit_sha=event.commit_sha,
+                first_push_at=time.monotonic(),
+            )
+        else:
+            pending.pushes += 1
+            pending.commit_sha = event.commit_sha
+        # A running re-index re-arms the timer when it finishes
+        if event.repo_name not in self._running:
+            self._arm(event.repo_name)
+        return pending
+
+    def _arm(self, repo_name: str) -> None:
+        timer = self._timers.pop(repo_name, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending[repo_name]
+        deadline = pending.first_push_at + self.max_delay_seconds
+        delay = max(0.0, min(self.debounce_seconds, deadline - time.monotonic()))
+        self._timers[repo_name] = asyncio.ensure_future(
+            self._fire_after(repo_name, delay)
+        )
+
+    async def _fire_after(self, repo_name: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        del self._timers[repo_name]
+        pending = self._pending.pop(repo_name)
+        self._running.add(repo_name)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        try:
+            async with self._slots:
+                logger.info(
+                    f"Re-indexing {repo_name} at {pending.commit_sha[:12]} for "
+                    f"{pending.pushes} push(es)"
+                )
+                self.runs += 1
+                await self._run(pending)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Re-index of {repo_name} failed: {type(e).__name__}: {e}")
+        finally:
+            self._running.discard(repo_name)
+            if repo_name in self._pending:
+                self._arm(repo_name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": {
+                repo_name: {
+                    "commit_sha": pending.commit_sha,
+                    "pushes": pending.pushes,
+                }
+                for repo_name, pending in self._pending.items()
+            },
+            "running": sorted(self._running),
+            "pushes": self.pushes,
+            "runs": self.runs,
+            "failures": self.failures,
+        }
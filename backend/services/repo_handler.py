@@ -1,35 +1,53 @@
 import os, tempfile, glob
-from git import Repo
 import shutil
+from typing import Optional
 
+ALLOWED_EXTENSIONS = (".md", ".markdown", ".mdx", ".py", ".js", ".jsx", ".ts", ".tsx", ".json", ".yaml", ".yml", ".toml", ".txt", ".rst")
 
-def ingest_repo(repo_url: str):
+
+def clone_repo(repo_url: str, commit_sha: Optional[str] = None):
     """
-    Bare-bones version: clones a GitHub repo and lists files.
+    Clones a GitHub repo into a temp dir and returns (repo_dir, commit_sha).
+    The checkout is the default branch's head, or `commit_sha` if given.
     """
-    allowed_extensions = (".md", ".markdown", ".mdx", ".py", ".js", ".jsx", ".ts", ".tsx", ".json", ".yaml", ".yml", ".toml", ".txt", ".rst")
+    # GitPython is imported lazily; it is only needed when ingesting
+    from git import Repo
+
+    # The clone is not removed here: load_files reads from it afterwards, and
+    # the caller removes it once the files are loaded
     tmp_dir = tempfile.mkdtemp()
     print(f"Cloning {repo_url} into {tmp_dir}")
 
     try:
-        # Clone the repo
-        Repo.clone_from(repo_url, tmp_dir)
-
-        # Collect file paths
-        repo_files = []
-        for root, _, files in os.walk(tmp_dir):
-            if ".git" in root or "node_modules" in root or "venv" in root:
-                continue
-            for f in files:
-                if f.endswith(allowed_extensions):
-                    repo_files.append(os.path.join(root, f))
-
-        return repo_files
+        repo = Repo.clone_from(repo_url, tmp_dir)
+        if commit_sha:
+            repo.git.checkout(commit_sha)
+        return tmp_dir, repo.head.commit.hexsha
 
     except Exception as e:
         print(f"❌ Error during repo ingestion: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
         raise e
 
-    #commented out to preserve files for loading
-    #finally :
-        #shutil.rmtree(tmp_dir)
\ No newline at end of file
+
+def scan_repo_files(repo_dir: str):
+    """
+    Lists the files of a cloned repo that are worth indexing.
+    """
+    repo_files = []
+    for root, _, files in os.walk(repo_dir):
+        if ".git" in root or "node_modules" in root or "venv" in root:
+            continue
+        for f in files:
+            if f.endswith(ALLOWED_EXTENSIONS):
+                repo_files.append(os.path.join(root, f))
+
+    return repo_files
+
+
+def ingest_repo(repo_url: str):
+    """
+    Bare-bones version: clones a GitHub repo and lists files.
+    """
+    repo_dir, _ = clone_repo(repo_url)
+    return scan_repo_files(repo_dir)
@@ -0,0 +1,495 @@
+"""
+Registry of indexed repositories.
+
+Caches per-repo collection handles with a TTL, keeps per-repo index metadata
+(chunk count, embedding model, index time, commit) on the Chroma collection
+itself, and implements the list/stats/delete/compact lifecycle operations.
+
+The `repo_{id}` collection is the repo's anchor: it holds the metadata and,
+until an embedding migration moves them, the chunks. After a migration its
+`active_collection` alias names the versioned collection serving queries.
+"""
+
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+import logging
+import re
+import threading
+import time
+import uuid
+
+from services.doc_store import delete_repo_docs
+
+if TYPE_CHECKING:
+    from chromadb.api import ClientAPI
+    from chromadb.api.models.Collection import Collection
+
+logger = logging.getLogger(__name__)
+
+REPO_COLLECTION_PREFIX = "repo_"
+
+# Metadata keys Chroma reserves for index configuration; they cannot be modified
+_RESERVED_METADATA_PREFIX = "hnsw:"
+
+
+def new_index_run() -> str:
+    """
+    Return a sortable identifier for one indexing run.
+
+    Chunks are stamped with the run that wrote them, so compaction can drop
+    chunks left over from earlier runs while leaving newer ones untouched.
+    """
+    return datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ") + "-" + uuid.uuid4().hex[:8]
+
+
+# Auxiliary collections of a repo are named `repo_{id}__{kind}`
+AUXILIARY_SEPARATOR = "__"
+SUMMARY_COLLECTION_KIND = "files"
+VERSION_PREFIX = "v"
+
+# Metadata of the `repo_{id}` collection naming the versioned collection
+# (`repo_{id}__v{n}`) that serves the repo's chunks after a migration
+ACTIVE_COLLECTION_KEY = "active_collection"
+COLLECTION_VERSION_KEY = "collection_version"
+# Wall-clock time (epoch seconds) after which inactive versions are retired
+RETIRE_AFTER_KEY = "retire_inactive_after"
+
+EMBEDDING_METADATA_KEYS = (
+    "embedding_provider",
+    "embedding_model",
+    "embedding_dimensions",
+)
+
+
+def collection_name(repo_id: str) -> str:
+    return f"{REPO_COLLECTION_PREFIX}{repo_id}"
+
+
+def versioned_collection_name(repo_id: str, version: int) -> str:
+    return f"{collection_name(repo_id)}{AUXILIARY_SEPARATOR}{VERSION_PREFIX}{version}"
+
+
+def summary_collection_name(chunks_collection: str) -> str:
+    """Name of the summary collection belonging to a chunk collection."""
+    return f"{chunks_collection}{AUXILIARY_SEPARATOR}{SUMMARY_COLLECTION_KIND}"
+
+
+def is_repo_collection(name: str, repo_id: str) -> bool:
+    """
+    Whether a collection belongs to a repo: its `repo_{id}` collection, a
+    version, or the summary collection of either.
+    """
+    pattern = (
+        re.escape(collection_name(repo_id))
+        + rf"({AUXILIARY_SEPARATOR}{VERSION_PREFIX}\d+)?"
+        + f"({AUXILIARY_SEPARATOR}{SUMMARY_COLLECTION_KIND})?"
+    )
+    return re.fullmatch(pattern, name) is not None
+
+
+class RepoRegistry:
+    """
+    Collection-handle cache and lifecycle operations over `repo_{id}` collections.
+    """
+
+    def __init__(self, client_factory: Callable[[], "ClientAPI"], ttl_seconds: float):
+        self._client_factory = client_factory
+        self._ttl_seconds = ttl_seconds
+        self._handles: Dict[str, Tuple[Optional["Collection"], float]] = {}
+        self._lock = threading.Lock()
+
+    # --- handle cache ---
+
+    def get_collection(self, repo_id: str) -> "Collection":
+        """
+        Return the collection serving the repo's chunks, creating it if needed.
+
+        That is the `repo_{id}` collection, unless an embedding migration
+        (see services.model_migration) pointed its alias at a versioned one.
+        Handles are reused for `ttl_seconds`, so the hot path issues a single
+        Chroma call (the query itself) instead of get_or_create + query.
+        """
+        anchor = self._anchor(repo_id)
+        active = (anchor.metadata or {}).get(ACTIVE_COLLECTION_KEY)
+        if not active:
+            return anchor
+        collection = self._get_handle(active, create=False)
+        if collection is None:
+            logger.warning(
+                f"Active collection {active} of {repo_id} is missing; "
+                f"serving {anchor.name}"
+            )
+            return anchor
+        return collection
+
+    def get_summary_collection(
+        self, repo_id: str, create: bool = False
+    ) -> Optional["Collection"]:
+        """
+        Return the file/directory summary collection (see services.hierarchy)
+        of the repo's active chunk collection, or None if it was never built
+        and `create` is False.
+        """
+        return self._get_handle(
+            summary_collection_name(self.get_collection(repo_id).name), create=create
+        )
+
+    def _anchor(self, repo_id: str) -> "Collection":
+        """The `repo_{id}` collection, which holds the repo's index metadata."""
+        return self._get_handle(collection_name(repo_id), create=True)
+
+    def _get_handle(self, name: str, create: bool) -> Optional["Collection"]:
+        now = time.monotonic()
+        cached = self._handles.get(name)
+        if cached is not None and cached[1] > now and (cached[0] or not create):
+            return cached[0]
+
+        client = self._client_factory()
+        if create:
+            collection = client.get_or_create_collection(name=name)
+        else:
+            try:
+                collection = client.get_collection(name)
+            except Exception:
+                # Remember the absence too, so misses cost no extra calls
+                collection = None
+        with self._lock:
+            self._handles[name] = (collection, now + self._ttl_seconds)
+        return collection
+
+    def refresh(self, repo_id: str) -> "Collection":
+        """
+        Re-resolve the repo's collection, bypassing the cache.
+
+        Used where the handle's metadata must be current (stats, compaction).
+        """
+        self.invalidate(repo_id)
+        return self.get_collection(repo_id)
+
+    def invalidate(self, repo_id: str) -> None:
+        with self._lock:
+            for name in [
+                name for name in self._handles if is_repo_collection(name, repo_id)
+            ]:
+                del self._handles[name]
+
+    def is_cached(self, repo_id: str) -> bool:
+        cached = self._handles.get(collection_name(repo_id))
+        return cached is not None and cached[1] > time.monotonic()
+
+    # --- index metadata ---
+
+    def record_index(
+        self,
+        repo_id: str,
+        *,
+        chunk_count: int,
+        embedding_model: str,
+        index_run: str,
+        embedding_provider: Optional[str] = None,
+        embedding_dimensions: Optional[int] = None,
+        index_status: str = "ready",
+        searchable_fraction: float = 1.0,
+        commit_sha: Optional[str] = None,
+        repo_url: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Store index metadata for a repo on its collection.
+
+        While an ingest is still committing batches, index_status is
+        "partial" and searchable_fraction tells how much of the new index run
+        is queryable.
+
+        Returns:
+            The repo's metadata after the update
+        """
+        collection = self._anchor(repo_id)
+        updates = {
+            "chunk_count": chunk_count,
+            "embedding_provider": embedding_provider,
+            "embedding_model": embedding_model,
+            "embedding_dimensions": embedding_dimensions,
+            "index_run": index_run,
+            "index_status": index_status,
+            "searchable_fraction": round(searchable_fraction, 4),
+            "indexed_at": datetime.utcnow().isoformat() + "Z",
+            "commit_sha": commit_sha,
+            "repo_url": repo_url,
+        }
+        metadata = {
+            key: value
+            for key, value in {**(collection.metadata or {}), **updates}.items()
+            if value is not None and not key.startswith(_RESERVED_METADATA_PREFIX)
+        }
+        collection.modify(metadata=metadata)
+        self.invalidate(repo_id)
+        logger.info(f"Recorded index metadata for {repo_id}: {metadata}")
+        return metadata
+
+    def abandon_index_run(self, repo_id: str, previous: Dict[str, Any]) -> None:
+        """
+        Record that the ingest committing a partial index run failed.
+
+        The metadata from before that ingest (`previous`) is put back, so the
+        repo reads as ready at its last complete run and compaction resumes;
+        chunks the failed run already wrote are newer and are kept. A repo
+        without an earlier complete run is marked "failed" until an ingest
+        succeeds.
+        """
+        collection = self._anchor(repo_id)
+        current = dict(collection.metadata or {})
+        if current.get("index_status") != "partial":
+            return
+        if previous.get("index_run") and previous.get("index_status") != "partial":
+            metadata = {
+                **previous,
+                "index_status": previous.get("index_status", "ready"),
+                "searchable_fraction": previous.get("searchable_fraction", 1.0),
+            }
+        else:
+            metadata = {**current, "index_status": "failed"}
+        collection.modify(
+            metadata={
+                key: value
+                for key, value in metadata.items()
+                if not key.startswith(_RESERVED_METADATA_PREFIX)
+            }
+        )
+        self.invalidate(repo_id)
+        logger.info(f"Abandoned the partial index run of {repo_id}")
+
+    def get_index_metadata(self, repo_id: str) -> Dict[str, Any]:
+        """
+        The repo's current metadata, read from Chroma. Cached handles are
+        only dropped if the active collection changed meanwhile (a migration
+        switched it, possibly in another process).
+        """
+        name = collection_name(repo_id)
+        cached = self._handles.get(name)
+        anchor = self._client_factory().get_or_create_collection(name=name)
+        metadata = dict(anchor.metadata or {})
+        if (
+            cached is not None
+            and cached[0] is not None
+            and (cached[0].metadata or {}).get(ACTIVE_COLLECTION_KEY)
+            != metadata.get(ACTIVE_COLLECTION_KEY)
+        ):
+            self.invalidate(repo_id)
+        with self._lock:
+            self._handles[name] = (anchor, time.monotonic() + self._ttl_seconds)
+        return metadata
+
+    def set_retire_after(self, repo_id: str, retire_after: Optional[float]) -> None:
+        """Schedule (a wall-clock time) or clear the retirement of inactive versions."""
+        anchor = self._anchor(repo_id)
+        metadata = {
+            key: value
+            for key, value in (anchor.metadata or {}).items()
+            if key != RETIRE_AFTER_KEY and not key.startswith(_RESERVED_METADATA_PREFIX)
+        }
+        if retire_after is not None:
+            metadata[RETIRE_AFTER_KEY] = retire_after
+        anchor.modify(metadata=metadata)
+        self.invalidate(repo_id)
+
+    def set_active_collection(
+        self,
+        repo_id: str,
+        name: str,
+        version: int,
+        embedding: Dict[str, Any],
+        retire_after: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Point the repo's alias at another chunk collection that was embedded
+        with `embedding` (a provider description).
+
+        Alias and embedding metadata change in a single metadata write, so
+        queries switch from the old vectors to the new ones atomically. The
+        same write records `retire_after`, when the previous version may be
+        dropped, so the retirement survives a restart.
+
+        Returns:
+            The repo's metadata after the switch
+        """
+        self.invalidate(repo_id)
+        anchor = self._anchor(repo_id)
+        metadata = {
+            key: value
+            for key, value in (anchor.metadata or {}).items()
+            if key not in EMBEDDING_METADATA_KEYS + (ACTIVE_COLLECTION_KEY,)
+            and not key.startswith(_RESERVED_METADATA_PREFIX)
+        }
+        metadata.update(
+            {key: value for key, value in embedding.items() if value is not None}
+        )
+        metadata[COLLECTION_VERSION_KEY] = version
+        metadata["migrated_at"] = datetime.utcnow().isoformat() + "Z"
+        if name != anchor.name:
+            metadata[ACTIVE_COLLECTION_KEY] = name
+        if retire_after is not None:
+            metadata[RETIRE_AFTER_KEY] = retire_after
+        anchor.modify(metadata=metadata)
+        self.invalidate(repo_id)
+        logger.info(f"Switched {repo_id} to collection {name}")
+        return metadata
+
+    def list_repo_collections(self, repo_id: str) -> List[str]:
+        """
+        Names of every collection of a repo, including inactive versions.
+        """
+        names = [
+            entry if isinstance(entry, str) else entry.name
+            for entry in self._client_factory().list_collections()
+        ]
+        return sorted(name for name in names if is_repo_collection(name, repo_id))
+
+    # --- lifecycle ---
+
+    def list_repos(self) -> List[Dict[str, Any]]:
+        """
+        List every indexed repository with its index metadata.
+        """
+        client = self._client_factory()
+        repos = []
+        for entry in client.list_collections():
+            # Older Chroma versions return names, newer ones Collection objects
+            name = entry if isinstance(entry, str) else entry.name
+            if (
+                not name.startswith(REPO_COLLECTION_PREFIX)
+                or AUXILIARY_SEPARATOR in name[len(REPO_COLLECTION_PREFIX) :]
+            ):
+                continue
+            metadata = (
+                client.get_collection(name).metadata
+                if isinstance(entry, str)
+                else entry.metadata
+            )
+            repos.append(
+                {
+                    "repo_name": name[len(REPO_COLLECTION_PREFIX) :],
+                    "collection_name": name,
+                    **(metadata or {}),
+                }
+            )
+        return sorted(repos, key=lambda repo: repo["repo_name"])
+
+    def get_stats(self, repo_id: str) -> Dict[str, Any]:
+        """
+        Return live statistics and recorded index metadata for one repository.
+        """
+        metadata = self.get_index_metadata(repo_id)
+        collection = self.get_collection(repo_id)
+        return {
+            "repo_name": repo_id,
+            "collection_name": collection.name,
+            "stored_chunks": collection.count(),
+            "handle_cached": self.is_cached(repo_id),
+            **metadata,
+        }
+
+    def exists(self, repo_id: str) -> bool:
+        try:
+            self._client_factory().get_collection(collection_name(repo_id))
+            return True
+        except Exception:
+            return False
+
+    def delete_repo(self, repo_id: str) -> bool:
+        """
+        Delete a repository's collections, stored docs and quantized index.
+
+        Returns:
+            False if the repository was not indexed
+        """
+        self.invalidate(repo_id)
+        if not self.exists(repo_id):
+            return False
+        client = self._client_factory()
+        for name in self.list_repo_collections(repo_id):
+            client.delete_collection(name)
+        self.invalidate(repo_id)
+        delete_repo_docs(repo_id)
+        # numpy is only needed when quantized search is enabled
+        from services.quantized_index import delete_quantized_index
+
+        delete_quantized_index(repo_id)
+        logger.info(f"Deleted repository {repo_id}")
+        return True
+
+    def compact_repo(self, repo_id: str, batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Delete chunks written by index runs older than the repo's current one,
+        e.g. chunks of files that were removed or shrank since the last ingest.
+
+        Chunks from runs newer than the recorded one are kept, and nothing is
+        deleted while the current run is still partial (its ingest is still
+        committing batches and older chunks serve the rest of the repo) or
+        failed without an earlier complete run to fall back to.
+        """
+        metadata = self.get_index_metadata(repo_id)
+        collection = self.get_collection(repo_id)
+        current_run = metadata.get("index_run")
+        if not current_run:
+            return {
+                "repo_name": repo_id,
+                "deleted_chunks": 0,
+                "skipped": "no index run recorded",
+            }
+        if metadata.get("index_status") in ("partial", "failed"):
+            return {
+                "repo_name": repo_id,
+                "deleted_chunks": 0,
+                "skipped": (
+                    "index run in progress"
+                    if metadata["index_status"] == "partial"
+                    else "last index run failed"
+                ),
+            }
+
+        stale_ids = []
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["metadatas"], limit=batch_size, offset=offset
+            )
+            if not page["ids"]:
+                break
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+                if (metadata or {}).get("index_run", "") < current_run:
+                    stale_ids.append(chunk_id)
+            offset += len(page["ids"])
+
+        for i in range(0, len(stale_ids), batch_size):
+            collection.delete(ids=stale_ids[i : i + batch_size])
+
+        logger.info(f"Compacted {repo_id}: deleted {len(stale_ids)} stale chunks")
+        return {
+            "repo_name": repo_id,
+            "deleted_chunks": len(stale_ids),
+            "remaining_chunks": collection.count(),
+        }
+
+    def collect_garbage(
+        self, older_than_days: float, dry_run: bool = True
+    ) -> List[str]:
+        """
+        Find (and unless dry_run, delete) repositories not re-indexed within
+        `older_than_days`. Repos without a recorded index time are left alone.
+
+        Returns:
+            Names of the stale repositories
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        stale = []
+        for repo in self.list_repos():
+            indexed_at = repo.get("indexed_at")
+            if not indexed_at:
+                continue
+            if datetime.fromisoformat(indexed_at.rstrip("Z")) < cutoff:
+                stale.append(repo["repo_name"])
+
+        if not dry_run:
+            for repo_name in stale:
+                self.delete_repo(repo_name)
+        return stale
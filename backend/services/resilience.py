@@ -0,0 +1,462 @@
+"""
+Resilience layer for outbound OpenAI and Chroma calls.
+
+- Deadlines: an endpoint sets a deadline (a context variable, so it follows
+  the request into thread pools); every outbound call gets the remaining
+  time as its timeout and fails fast with DeadlineExceeded once it is spent.
+- Circuit breakers: after a run of consecutive upstream failures (not
+  deadline misses or 4xx rejections such as rate limits) a dependency is
+  "open" and calls fail immediately with CircuitOpenError instead of
+  queueing behind a degraded service; one probe is let through after the
+  reset interval. Bulk ingest calls use their own breaker ("openai-ingest"),
+  so rate limiting there does not fail interactive requests.
+- Hedged requests: idempotent calls (query embeddings, Chroma queries) are
+  duplicated once they run longer than the recent p95 of that call, and
+  the first result wins.
+
+Per-call metrics (latency percentiles of what callers saw next to those of
+the first attempt alone, hedges, breaker rejections, deadline misses) show
+how much each mechanism moves p99.
+"""
+
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple, TypeVar
+import contextvars
+import logging
+import math
+import threading
+import time
+
+from config import get_resilience_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Latency samples kept per call type for percentiles and hedge delays
+LATENCY_WINDOW = 1000
+# Hedging much faster calls only adds load
+MIN_HEDGE_DELAY_SECONDS = 0.01
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the request's deadline passed before a call could finish."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+# --- deadlines ---
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound every outbound call made within the block (including from thread
+    pools started with the block's context) to `seconds` from now. Nested
+    deadlines can only shorten the enclosing one.
+    """
+    if seconds is None:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining(default: Optional[float] = None) -> Optional[float]:
+    """
+    Timeout for the next outbound call: the time left until the deadline,
+    capped at `default` (None if neither is set).
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed
+    """
+    expires = _deadline.get()
+    if expires is None:
+        return default
+    remaining = expires - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return remaining if default is None else min(remaining, default)
+
+
+def submit_in_context(executor: Executor, fn: Callable[..., T], *args: Any) -> Future:
+    """
+    `executor.submit` that runs `fn` under the caller's deadline; plain
+    executors do not carry context variables into their threads.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _deadline_passed() -> bool:
+    expires = _deadline.get()
+    return expires is not None and time.monotonic() >= expires
+
+
+# --- circuit breakers ---
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls pass; `failure_threshold` consecutive failures open it.
+    open: calls are rejected until `reset_seconds` have passed.
+    half-open: one probe passes; success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        Returns:
+            Whether the call is the half-open probe; its caller must end it
+            with record_success, record_failure or release_probe
+
+        Raises:
+            CircuitOpenError: If the breaker rejects the call
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+
+    def release_probe(self) -> None:
+        """End a probe whose outcome says nothing about the dependency."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (
+                self._opened_at is None and self._failures >= self.failure_threshold
+            ):
+                if self._opened_at is None:
+                    self.opens += 1
+                    logger.warning(
+                        f"Circuit breaker for {self.name} opened after "
+                        f"{self._failures} consecutive failures"
+                    )
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(dependency)
+        if breaker is None:
+            settings = get_resilience_settings()
+            breaker = _breakers[dependency] = CircuitBreaker(
+                dependency,
+                settings.breaker_failure_threshold,
+                settings.breaker_reset_seconds,
+            )
+        return breaker
+
+
+# --- metrics ---
+
+
+def _percentile(samples: Deque[float], percentile: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+class CallMetrics:
+    """
+    Outcomes and latencies of one call type. `latency` is what callers saw
+    (with hedging); `primary_latency` is the first attempt alone, i.e. what
+    they would have seen without it.
+    """
+
+    def __init__(self):
+        self.latency: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.primary_latency: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.deadline_exceeded = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self, percentile: float, min_samples: int) -> Optional[float]:
+        if len(self.primary_latency) < min_samples:
+            return None
+        return max(
+            MIN_HEDGE_DELAY_SECONDS, _percentile(self.primary_latency, percentile)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        def milliseconds(samples: Deque[float], percentile: float):
+            value = _percentile(samples, percentile)
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "deadline_exceeded": self.deadline_exceeded,
+            "rejected_by_breaker": self.rejected,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            **{f"p{p}_ms": milliseconds(self.latency, p) for p in (50, 95, 99)},
+            **{
+                f"primary_p{p}_ms": milliseconds(self.primary_latency, p)
+                for p in (50, 95, 99)
+            },
+        }
+
+
+_metrics: Dict[str, CallMetrics] = {}
+_metrics_lock = threading.Lock()
+
+
+def _get_metrics(key: str) -> CallMetrics:
+    with _metrics_lock:
+        metrics = _metrics.get(key)
+        if metrics is None:
+            metrics = _metrics[key] = CallMetrics()
+        return metrics
+
+
+def get_resilience_metrics() -> Dict[str, Any]:
+    """
+    Per-call metrics and breaker states, for the metrics endpoint.
+    """
+    with _metrics_lock, _breakers_lock:
+        return {
+            "calls": {
+                key: metrics.stats() for key, metrics in sorted(_metrics.items())
+            },
+            "breakers": {
+                name: breaker.stats() for name, breaker in sorted(_breakers.items())
+            },
+        }
+
+
+# --- guarded calls ---
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_slots: Optional[threading.Semaphore] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> Tuple[ThreadPoolExecutor, threading.Semaphore]:
+    """The hedge pool and a semaphore counting its free workers."""
+    global _hedge_executor, _hedge_slots
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            workers = get_resilience_settings().hedge_max_workers
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="hedge"
+            )
+            _hedge_slots = threading.Semaphore(workers)
+        return _hedge_executor, _hedge_slots
+
+
+def guarded_call(
+    dependency: str, operation: str, fn: Callable[[], T], *, hedge: bool = False
+) -> T:
+    """
+    Call `fn` under the dependency's circuit breaker and the current deadline.
+
+    Args:
+        dependency: Breaker name ("openai", "chroma", ...)
+        operation: Call type, for metrics and hedge delays
+        fn: The call; OpenAI calls should pass `timeout=time_remaining(...)`
+        hedge: Start a duplicate of an idempotent call once it is slower
+            than its recent p95, and return whichever finishes first
+
+    Raises:
+        CircuitOpenError: If the dependency's breaker is open
+        DeadlineExceeded: If the deadline passes before the call finishes
+    """
+    breaker = get_breaker(dependency)
+    metrics = _get_metrics(f"{dependency}.{operation}")
+    metrics.calls += 1
+    try:
+        timeout = time_remaining()
+    except DeadlineExceeded:
+        metrics.deadline_exceeded += 1
+        raise
+    try:
+        probe = breaker.before_call()
+    except CircuitOpenError:
+        metrics.rejected += 1
+        raise
+
+    settings = get_resilience_settings()
+    hedge_delay = (
+        metrics.hedge_delay(settings.hedge_percentile, settings.hedge_min_samples)
+        if hedge and settings.hedging_enabled
+        else None
+    )
+    started = time.monotonic()
+    try:
+        if hedge_delay is not None:
+            result = _run_hedged(fn, metrics, started, hedge_delay, timeout)
+        else:
+            # Calls that cannot be hedged run on the caller's thread and
+            # enforce the deadline through their own timeout
+            result = fn()
+            metrics.primary_latency.append(time.monotonic() - started)
+    except Exception as e:
+        if isinstance(e, DeadlineExceeded) or _deadline_passed():
+            # The caller ran out of time; that says nothing about the dependency
+            metrics.deadline_exceeded += 1
+            if isinstance(e, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded("Request deadline exceeded") from e
+        metrics.errors += 1
+        if _is_upstream_failure(e):
+            breaker.record_failure()
+            probe = False
+        raise
+    else:
+        metrics.latency.append(time.monotonic() - started)
+        breaker.record_success()
+        probe = False
+        return result
+    finally:
+        if probe:
+            breaker.release_probe()
+
+
+def _is_upstream_failure(error: Exception) -> bool:
+    """
+    Whether an error means the dependency is unhealthy. Rejections of the
+    request itself (4xx, including 429 rate limits the callers retry) are not.
+    """
+    status = getattr(error, "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500)
+
+
+def _run_hedged(
+    fn: Callable[[], T],
+    metrics: CallMetrics,
+    started: float,
+    hedge_delay: float,
+    timeout: Optional[float],
+) -> T:
+    """
+    Run `fn` on the hedge pool, waiting at most `timeout` (the worker
+    finishes in the background if it runs over); after `hedge_delay`
+    without a result, race a second attempt against it. Attempts only take
+    idle pool workers: with none free the call runs on the caller's thread,
+    and a hedge is skipped, so the pool does not hold back query traffic.
+    """
+    executor, slots = _get_hedge_executor()
+
+    def submit() -> Optional[Future]:
+        if not slots.acquire(blocking=False):
+            return None
+        future = submit_in_context(executor, fn)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    primary = submit()
+    if primary is None:
+        result = fn()
+        metrics.primary_latency.append(time.monotonic() - started)
+        return result
+    primary.add_done_callback(
+        lambda _: metrics.primary_latency.append(time.monotonic() - started)
+    )
+    attempts = {primary}
+    expires = None if timeout is None else started + timeout
+
+    def wait_for_first(limit: Optional[float]) -> set:
+        done, _ = wait(attempts, timeout=limit, return_when=FIRST_COMPLETED)
+        return done
+
+    done = wait_for_first(hedge_delay if expires is None else min(hedge_delay, timeout))
+    hedged = None
+    if not done and (expires is None or time.monotonic() < expires):
+        hedged = submit()
+    if hedged is not None:
+        metrics.hedges += 1
+        attempts.add(hedged)
+        while attempts:
+            remaining = None if expires is None else expires - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done = wait_for_first(remaining)
+            if not done:
+                break
+            # A failed attempt only loses if the other one succeeds
+            finished = done.pop()
+            if finished.exception() is None or len(attempts) == 1:
+                if finished is not primary:
+                    metrics.hedge_wins += 1
+                return finished.result()
+            attempts.discard(finished)
+    else:
+        if not done:
+            # No hedge (pool busy or deadline reached); wait on the primary
+            remaining = None if expires is None else expires - time.monotonic()
+            done = wait_for_first(None if remaining is None else max(0.0, remaining))
+        if done:
+            return done.pop().result()
+
+    raise DeadlineExceeded("Request deadline exceeded")
@@ -2,19 +2,231 @@
 Retrieval service for querying indexed repositories.
 """
 
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Dict, Optional
 import logging
-from services.chromadb_service import get_repo_collection
-from services.embeddings import generate_embeddings
+from config import get_dedup_settings, get_embedding_settings, get_hierarchy_settings
+from services.chromadb_service import (
+    get_repo_collection,
+    get_repo_embedding_provider,
+    run_in_chroma_pool,
+)
+from services.embedding_providers import EmbeddingProvider
+from services.hierarchy import candidate_filter
+from services.resilience import guarded_call, submit_in_context
+from services.scope import Scope
 
 logger = logging.getLogger(__name__)
 
 
+# Extra hits fetched so results stay full after near-duplicates are collapsed
+DUPLICATE_OVERFETCH = 3
+# Extra hits fetched for scopes the metadata filter only approximates (globs)
+SCOPE_OVERFETCH = 4
+# Reciprocal rank fusion constant for merging hits scored by different
+# embedding providers, whose similarities are not comparable
+RANK_FUSION_K = 60
+# Upper bound on hits fetched while widening a search; a glob scope with no
+# metadata filter (e.g. "**/test_*") would otherwise page in the whole repo
+MAX_FETCH = 1000
+
+
+def embed_query(provider: EmbeddingProvider, query: str) -> List[float]:
+    """
+    Embed a search query under the provider's circuit breaker ("openai" for
+    OpenAI). Query embeddings are idempotent, so a slow call is hedged with a
+    duplicate (see services.resilience).
+    """
+    return guarded_call(
+        provider.name, "embeddings", lambda: provider.embed_query(query), hedge=True
+    )
+
+
+def _search_collection(
+    repo_name: str,
+    query_embedding: List[float],
+    n_results: int,
+    filter_metadata: Optional[Dict] = None,
+    scope: Optional[Scope] = None,
+) -> List[Dict]:
+    """
+    Run a vector search against one repository's collection with a precomputed
+    query embedding and format the hits, one per near-duplicate group.
+    """
+    dedup = get_dedup_settings().enabled
+    post_filter = scope is not None and not scope.exact
+    if scope is not None:
+        filter_metadata = _and_filters(filter_metadata, scope.where())
+    if not dedup and not post_filter:
+        return _nearest_chunks(repo_name, query_embedding, n_results, filter_metadata)
+    fetch = n_results * (DUPLICATE_OVERFETCH if dedup else 1)
+    fetch *= SCOPE_OVERFETCH if post_filter else 1
+    while True:
+        results = _nearest_chunks(repo_name, query_embedding, fetch, filter_metadata)
+        in_scope = (
+            [result for result in results if scope.matches(result["metadata"])]
+            if post_filter
+            else results
+        )
+        collapsed = (
+            collapse_duplicates(in_scope, n_results) if dedup else in_scope[:n_results]
+        )
+        # Large groups or out-of-scope hits can still crowd the page; widen
+        # until full, exhausted or at the cap
+        if (
+            len(collapsed) >= n_results
+            or len(results) < fetch
+            or fetch >= max(MAX_FETCH, n_results)
+        ):
+            return collapsed
+        fetch = min(fetch * 4, max(MAX_FETCH, n_results))
+
+
+def _and_filters(*filters: Optional[Dict]) -> Optional[Dict]:
+    filters = [f for f in filters if f]
+    if not filters:
+        return None
+    return filters[0] if len(filters) == 1 else {"$and": filters}
+
+
+def _nearest_chunks(
+    repo_name: str,
+    query_embedding: List[float],
+    n_results: int,
+    filter_metadata: Optional[Dict] = None,
+) -> List[Dict]:
+    """
+    Vector search against one repository's collection.
+
+    With EMBEDDING_QUANTIZATION set, unfiltered searches run against the
+    repo's quantized local index and only the hits are fetched from Chroma.
+    """
+    collection = get_repo_collection(repo_name)
+
+    settings = get_embedding_settings()
+    if settings.quantization != "none" and not filter_metadata:
+        return _search_quantized(
+            collection,
+            repo_name,
+            query_embedding,
+            n_results,
+            settings.quantization,
+            settings.rescore_factor,
+        )
+
+    logger.info(f"Querying collection repo_{repo_name} with n_results={n_results}")
+    results = guarded_call(
+        "chroma",
+        "query",
+        lambda: collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=filter_metadata,
+            include=["documents", "metadatas", "distances"],
+        ),
+        hedge=True,
+    )
+
+    # Format results
+    formatted_results = []
+    if results and results["ids"]:
+        for i in range(len(results["ids"][0])):
+            formatted_results.append(
+                {
+                    "id": results["ids"][0][i],
+                    "document": results["documents"][0][i],
+                    "metadata": results["metadatas"][0][i],
+                    "distance": results["distances"][0][i],
+                    "similarity": 1
+                    - results["distances"][0][i],  # Convert distance to similarity
+                }
+            )
+    return formatted_results
+
+
+def _search_quantized(
+    collection,
+    repo_name: str,
+    query_embedding: List[float],
+    n_results: int,
+    mode: str,
+    rescore_factor: int,
+) -> List[Dict]:
+    from services.quantized_index import get_quantized_index
+
+    logger.info(f"Querying {mode} index of {repo_name} with n_results={n_results}")
+    hits = get_quantized_index(repo_name, mode).search(
+        query_embedding, n_results, rescore_factor
+    )
+    if not hits:
+        return []
+
+    fetched = collection.get(
+        ids=[chunk_id for chunk_id, _ in hits], include=["documents", "metadatas"]
+    )
+    by_id = {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(
+            fetched["ids"], fetched["documents"], fetched["metadatas"]
+        )
+    }
+    # Ids missing from Chroma were removed since the index was built
+    return [
+        {
+            "id": chunk_id,
+            "document": by_id[chunk_id][0],
+            "metadata": by_id[chunk_id][1],
+            "distance": distance,
+            "similarity": 1 - distance,
+        }
+        for chunk_id, distance in hits
+        if chunk_id in by_id
+    ]
+
+
+def collapse_duplicates(results: List[Dict], n_results: int) -> List[Dict]:
+    """
+    Keep the best-ranked hit of each near-duplicate group (see services.dedup),
+    listing the file paths of the other members under "duplicates".
+    """
+    collapsed: List[Dict] = []
+    by_group: Dict[str, Dict] = {}
+    for result in results:
+        group = result["metadata"].get("dup_group")
+        if group is None:
+            collapsed.append(result)
+            continue
+        if group in by_group:
+            by_group[group]["duplicates"].append(result["metadata"].get("file_path"))
+            continue
+        result = {**result, "duplicates": []}
+        by_group[group] = result
+        collapsed.append(result)
+    return collapsed[:n_results]
+
+
+def to_snippet_results(results: List[Dict], snippet_chars: int = 200) -> List[Dict]:
+    """
+    Replace each result's full document with a short leading snippet.
+    """
+    return [
+        {
+            **{key: value for key, value in result.items() if key != "document"},
+            "snippet": result["document"][:snippet_chars],
+        }
+        for result in results
+    ]
+
+
 def query_repository(
     repo_name: str,
     query: str,
     n_results: int = 10,
     filter_metadata: Optional[Dict] = None,
+    include_documents: bool = True,
+    snippet_chars: int = 200,
+    hierarchical: Optional[bool] = None,
+    scope: Optional[Scope] = None,
 ) -> List[Dict]:
     """
     Query a repository's indexed chunks using semantic search.
@@ -24,6 +236,15 @@ def query_repository(
         query: Search query text
         n_results: Number of results to return (default: 10)
         filter_metadata: Optional metadata filters (e.g., {"language": "python"})
+        include_documents: Return full chunk documents; when False each result
+            carries only id, metadata, scores and a `snippet`
+        snippet_chars: Snippet length when include_documents is False
+        hierarchical: Search file/directory summaries first and only look at
+            chunks of the best candidates (default: HIERARCHICAL_INDEX). Falls
+            back to a flat search when the repo has no summary index
+        scope: Only search chunks in this subtree / language set / glob (see
+            services.scope). Scoped searches skip the summary stage, since the
+            scope already narrows the candidates
 
     Returns:
         List of matching chunks with metadata and similarity scores
@@ -32,38 +253,24 @@ def query_repository(
         results = query_repository("myrepo", "how does authentication work?", n_results=5)
     """
     try:
-        # Get the collection for this repo
-        collection = get_repo_collection(repo_name)
-
-        # Generate embedding for the query
+        # Embed the query with the same provider that built the index
         logger.info(f"Generating embedding for query: {query[:50]}...")
-        query_embedding = generate_embeddings([query])[0]
+        query_embedding = embed_query(get_repo_embedding_provider(repo_name), query)
 
-        # Query ChromaDB
-        logger.info(f"Querying collection repo_{repo_name} with n_results={n_results}")
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=filter_metadata,
-            include=["documents", "metadatas", "distances"],
-        )
+        if hierarchical is None:
+            hierarchical = get_hierarchy_settings().enabled
+        if hierarchical and scope is None:
+            filter_metadata = candidate_filter(
+                repo_name, query_embedding, filter_metadata
+            )
 
-        # Format results
-        formatted_results = []
-        if results and results["ids"]:
-            for i in range(len(results["ids"][0])):
-                formatted_results.append(
-                    {
-                        "id": results["ids"][0][i],
-                        "document": results["documents"][0][i],
-                        "metadata": results["metadatas"][0][i],
-                        "distance": results["distances"][0][i],
-                        "similarity": 1
-                        - results["distances"][0][i],  # Convert distance to similarity
-                    }
-                )
+        formatted_results = _search_collection(
+            repo_name, query_embedding, n_results, filter_metadata, scope
+        )
 
         logger.info(f"Found {len(formatted_results)} results for query")
+        if not include_documents:
+            return to_snippet_results(formatted_results, snippet_chars)
         return formatted_results
 
     except Exception as e:
@@ -71,6 +278,115 @@ def query_repository(
         raise
 
 
+def query_repositories(
+    repo_names: List[str],
+    query: str,
+    n_results: int = 10,
+    per_repo_limit: Optional[int] = None,
+    filter_metadata: Optional[Dict] = None,
+    max_workers: int = 8,
+) -> Dict:
+    """
+    Query several repositories at once and merge the hits into one ranking.
+
+    The query is embedded once per distinct embedding provider among the
+    repos (usually once); the per-repo searches run concurrently. Hits
+    are merged by similarity, with at most `per_repo_limit` hits per repo so a
+    single large repo cannot crowd out the others. When the repos use several
+    providers, whose similarities have different scales, hits are merged by
+    reciprocal rank fusion of their rank within their provider instead.
+
+    Args:
+        repo_names: Repositories to search
+        query: Search query text
+        n_results: Number of merged results to return (default: 10)
+        per_repo_limit: Maximum hits kept per repository (default: n_results)
+        filter_metadata: Optional metadata filters applied in every repo
+        max_workers: Maximum number of concurrent collection queries
+
+    Returns:
+        Dictionary with the merged "results" (each tagged with "repo_name")
+        and "failed_repos" mapping repo name -> error message
+    """
+    repo_names = list(dict.fromkeys(repo_names))
+    if not repo_names:
+        return {"results": [], "failed_repos": {}}
+
+    per_repo_limit = min(per_repo_limit or n_results, n_results)
+
+    hits: List[Dict] = []
+    failed_repos: Dict[str, str] = {}
+
+    logger.info(f"Generating embedding for cross-repo query: {query[:50]}...")
+    query_embeddings: Dict[str, List[float]] = {}
+    embeddings_by_provider: Dict[tuple, List[float]] = {}
+    provider_of: Dict[str, tuple] = {}
+    for repo_name in repo_names:
+        try:
+            provider = get_repo_embedding_provider(repo_name)
+            key = (provider.name, provider.model)
+            if key not in embeddings_by_provider:
+                embeddings_by_provider[key] = embed_query(provider, query)
+            query_embeddings[repo_name] = embeddings_by_provider[key]
+            provider_of[repo_name] = key
+        except Exception as e:
+            logger.error(
+                f"Error embedding query for {repo_name}: {type(e).__name__}: {e}"
+            )
+            failed_repos[repo_name] = str(e)
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(repo_names)))
+    ) as pool:
+        futures = {
+            submit_in_context(
+                pool,
+                _search_collection,
+                repo_name,
+                query_embedding,
+                per_repo_limit,
+                filter_metadata,
+            ): repo_name
+            for repo_name, query_embedding in query_embeddings.items()
+        }
+        for future in as_completed(futures):
+            repo_name = futures[future]
+            try:
+                for result in future.result():
+                    result["repo_name"] = repo_name
+                    hits.append(result)
+            except Exception as e:
+                logger.error(
+                    f"Error querying repository {repo_name}: {type(e).__name__}: {e}"
+                )
+                failed_repos[repo_name] = str(e)
+
+    # Each repo already returned at most per_repo_limit hits, so the quota holds
+    hits.sort(key=lambda hit: hit["similarity"], reverse=True)
+    if len({provider_of[hit["repo_name"]] for hit in hits}) > 1:
+        hits = _fuse_ranks(hits, provider_of)
+    merged = hits[:n_results]
+
+    logger.info(
+        f"Cross-repo query over {len(repo_names)} repos returned {len(merged)} results"
+    )
+    return {"results": merged, "failed_repos": failed_repos}
+
+
+def _fuse_ranks(hits: List[Dict], provider_of: Dict[str, tuple]) -> List[Dict]:
+    """
+    Order hits (sorted by similarity) by reciprocal rank fusion, ranking each
+    against the hits scored by the same provider.
+    """
+    ranks: Dict[tuple, int] = {}
+    scored = []
+    for hit in hits:
+        provider = provider_of[hit["repo_name"]]
+        ranks[provider] = ranks.get(provider, 0) + 1
+        scored.append((1.0 / (RANK_FUSION_K + ranks[provider]), hit))
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return [hit for _, hit in scored]
+
+
 def get_all_files(repo_name: str) -> List[Dict]:
     """
     Get a list of all unique files in the indexed repository.
@@ -108,52 +424,147 @@ def get_all_files(repo_name: str) -> List[Dict]:
         raise
 
 
-def get_file_content(repo_name: str, file_path: str) -> str:
+def iter_repo_chunks(
+    repo_name: str,
+    include: Optional[List[str]] = None,
+    batch_size: int = 1000,
+) -> Iterator[Dict]:
     """
-    Reconstruct full file content from chunks.
+    Stream every chunk of a repository in pages, so large repos are never
+    loaded into memory at once.
+
+    Args:
+        repo_name: Name of the repository
+        include: Fields to fetch (default: documents and metadatas)
+        batch_size: Number of chunks fetched per Chroma call
+
+    Yields:
+        Chunk dictionaries with "id" plus the included fields (singular keys)
+    """
+    include = include or ["documents", "metadatas"]
+    collection = get_repo_collection(repo_name)
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=batch_size, offset=offset)
+        ids = page["ids"] if page else []
+        if not ids:
+            return
+        for i, chunk_id in enumerate(ids):
+            chunk = {"id": chunk_id}
+            for field in include:
+                chunk[field[:-1]] = page[field][i]
+            yield chunk
+        offset += len(ids)
+
+
+def get_file_chunks(repo_name: str, file_path: str) -> List[Dict]:
+    """
+    Fetch every chunk of a file, ordered by chunk_index.
+
+    Uses a metadata-filtered get rather than a vector query, so no embedding
+    call is made and no chunk is left out.
 
     Args:
         repo_name: Name of the repository
         file_path: Path to the file
 
     Returns:
-        Reconstructed file content
+        List of chunks ({"id", "document", "metadata"}) in file order
     """
     try:
         collection = get_repo_collection(repo_name)
 
-        # Query for all chunks of this file
         results = collection.get(
             where={"file_path": file_path}, include=["documents", "metadatas"]
         )
 
         if not results or not results["documents"]:
             logger.warning(f"No chunks found for file {file_path}")
-            return ""
+            return []
+
+        chunks = [
+            {
+                "id": results["ids"][i],
+                "document": doc,
+                "metadata": results["metadatas"][i],
+            }
+            for i, doc in enumerate(results["documents"])
+        ]
+        chunks.sort(key=lambda c: c["metadata"].get("chunk_index", 0))
+        return chunks
 
-        # Sort chunks by chunk_index
-        chunks_with_index = []
-        for i, doc in enumerate(results["documents"]):
-            metadata = results["metadatas"][i]
-            chunk_index = metadata.get("chunk_index", 0)
-            chunks_with_index.append((chunk_index, doc))
+    except Exception as e:
+        logger.error(f"Error getting chunks for {file_path}: {type(e).__name__}: {e}")
+        raise
 
-        chunks_with_index.sort(key=lambda x: x[0])
 
-        # If only one chunk, return it directly
-        if len(chunks_with_index) == 1:
-            return chunks_with_index[0][1]
+def get_file_content(repo_name: str, file_path: str) -> str:
+    """
+    Reconstruct full file content from chunks.
+
+    Args:
+        repo_name: Name of the repository
+        file_path: Path to the file
+
+    Returns:
+        Reconstructed file content
+    """
+    chunks = get_file_chunks(repo_name, file_path)
+    if not chunks:
+        return ""
 
-        # For multiple chunks, we need to handle overlap
-        # Simple approach: just concatenate (overlap will cause some duplication)
-        # TODO: Could implement smart overlap removal
-        full_content = "".join([chunk[1] for chunk in chunks_with_index])
+    # If only one chunk, return it directly
+    if len(chunks) == 1:
+        return chunks[0]["document"]
 
-        logger.info(f"Reconstructed {len(chunks_with_index)} chunks for {file_path}")
-        return full_content
+    # For multiple chunks, we need to handle overlap
+    # Simple approach: just concatenate (overlap will cause some duplication)
+    # TODO: Could implement smart overlap removal
+    full_content = "".join(chunk["document"] for chunk in chunks)
 
-    except Exception as e:
-        logger.error(
-            f"Error getting file content for {file_path}: {type(e).__name__}: {e}"
-        )
-        raise
+    logger.info(f"Reconstructed {len(chunks)} chunks for {file_path}")
+    return full_content
+
+
+async def aquery_repository(
+    repo_name: str,
+    query: str,
+    n_results: int = 10,
+    filter_metadata: Optional[Dict] = None,
+    include_documents: bool = True,
+    timeout: Optional[float] = None,
+    hierarchical: Optional[bool] = None,
+    scope: Optional[Scope] = None,
+) -> List[Dict]:
+    """
+    Async query_repository: runs on the bounded Chroma executor with a timeout.
+    """
+    return await run_in_chroma_pool(
+        query_repository,
+        repo_name,
+        query,
+        n_results=n_results,
+        filter_metadata=filter_metadata,
+        include_documents=include_documents,
+        hierarchical=hierarchical,
+        scope=scope,
+        timeout=timeout,
+    )
+
+
+async def aget_all_files(repo_name: str, timeout: Optional[float] = None) -> List[Dict]:
+    """
+    Async get_all_files: runs on the bounded Chroma executor with a timeout.
+    """
+    return await run_in_chroma_pool(get_all_files, repo_name, timeout=timeout)
+
+
+async def aget_file_content(
+    repo_name: str, file_path: str, timeout: Optional[float] = None
+) -> str:
+    """
+    Async get_file_content: runs on the bounded Chroma executor with a timeout.
+    """
+    return await run_in_chroma_pool(
+        get_file_content, repo_name, file_path, timeout=timeout
+    )
@@ -0,0 +1,205 @@
+"""
+Search scopes: restrict retrieval to a subtree, a set of languages or files
+matching a glob.
+
+Chunks carry their file's directory ancestry as one metadata key per depth
+(`ancestor_0="services"`, `ancestor_1="services/api"`, ...), so a subtree is a
+single exact-match filter that Chroma evaluates before ranking, however deep
+the tree. A scope string is whitespace-separated terms; commas separate
+alternatives within a term:
+
+    services/api            the subtree (or the file) services/api
+    services/,utils/        either subtree
+    lang:python,typescript  chunks of those languages
+    services/**/test_*.py   files matching the glob (** spans directories)
+
+Terms of different kinds must all match; alternatives of one kind are OR-ed.
+Globs are narrowed by their literal directory prefix and extension in the
+filter and matched exactly on the hits.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import re
+
+ANCESTOR_KEY_PREFIX = "ancestor_"
+# Deeper subtrees are filtered by their deepest indexed ancestor and matched
+# exactly on the hits
+MAX_ANCESTOR_DEPTH = 12
+
+_GLOB_CHARS = "*?["
+
+
+class ScopeError(ValueError):
+    """Raised for scope strings that cannot be parsed."""
+
+
+def ancestor_key(depth: int) -> str:
+    return f"{ANCESTOR_KEY_PREFIX}{depth}"
+
+
+def ancestor_metadata(file_path: str) -> Dict[str, str]:
+    """
+    Metadata naming every directory above a repo-relative file:
+    "services/api/x.py" -> {"ancestor_0": "services", "ancestor_1": "services/api"}.
+    """
+    parts = file_path.strip("/").split("/")[:-1][:MAX_ANCESTOR_DEPTH]
+    return {ancestor_key(i): "/".join(parts[: i + 1]) for i in range(len(parts))}
+
+
+def _normalize(path: str) -> str:
+    path = path.strip()
+    while path.startswith("./"):
+        path = path[2:]
+    path = path.strip("/")
+    if ".." in path.split("/"):
+        raise ScopeError(f"Scope paths cannot contain '..': {path!r}")
+    return path
+
+
+@lru_cache(maxsize=256)
+def _glob_regex(pattern: str) -> "re.Pattern":
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                raise ScopeError(f"Unclosed '[' in glob {pattern!r}")
+            regex += pattern[i : end + 1]
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r"\Z")
+
+
+def _any(conditions: List[Dict]) -> Optional[Dict]:
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
+
+def _all(conditions: List[Dict]) -> Optional[Dict]:
+    conditions = [condition for condition in conditions if condition]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _subtree_condition(path: str) -> Dict:
+    parts = path.split("/")
+    depth = min(len(parts), MAX_ANCESTOR_DEPTH)
+    ancestor = "/".join(parts[:depth])
+    return {ancestor_key(depth - 1): ancestor}
+
+
+@dataclass(frozen=True)
+class Scope:
+    paths: Tuple[str, ...] = ()
+    languages: Tuple[str, ...] = ()
+    globs: Tuple[str, ...] = ()
+
+    @property
+    def exact(self) -> bool:
+        """Whether the metadata filter alone selects exactly the scope."""
+        return not self.globs and all(
+            len(path.split("/")) <= MAX_ANCESTOR_DEPTH for path in self.paths
+        )
+
+    def where(self) -> Optional[Dict]:
+        """Chroma `where` filter selecting (a superset of) the scope's chunks."""
+        paths = _any(
+            [
+                {"$or": [{"file_path": path}, _subtree_condition(path)]}
+                for path in self.paths
+            ]
+        )
+        languages = None
+        if self.languages:
+            languages = (
+                {"language": self.languages[0]}
+                if len(self.languages) == 1
+                else {"language": {"$in": list(self.languages)}}
+            )
+        globs = []
+        for pattern in self.globs:
+            parts = pattern.split("/")
+            literal = []
+            for part in parts[:-1]:
+                if any(char in part for char in _GLOB_CHARS):
+                    break
+                literal.append(part)
+            narrowing = []
+            if literal:
+                narrowing.append(_subtree_condition("/".join(literal)))
+            name = parts[-1]
+            extension = re.fullmatch(r"\*(\.[\w.-]+)", name)
+            if extension:
+                narrowing.append({"extension": extension.group(1).lower()})
+            condition = _all(narrowing)
+            if condition is None:
+                # Any file may match; only the hits can be checked
+                globs = []
+                break
+            globs.append(condition)
+        return _all([paths, languages, _any(globs)])
+
+    def matches(self, metadata: Dict) -> bool:
+        """Whether a chunk with this metadata is in scope."""
+        file_path = metadata.get("file_path", "")
+        if self.paths and not any(
+            file_path == path or file_path.startswith(path + "/") for path in self.paths
+        ):
+            return False
+        if self.languages and metadata.get("language") not in self.languages:
+            return False
+        if self.globs and not any(
+            _glob_regex(pattern).match(file_path) for pattern in self.globs
+        ):
+            return False
+        return True
+
+
+def parse_scope(text: Optional[str]) -> Optional[Scope]:
+    """
+    Parse a scope string (see module docstring); None or blank means unscoped.
+
+    Raises:
+        ScopeError: If a term is malformed
+    """
+    if text is None or not text.strip():
+        return None
+    paths: List[str] = []
+    languages: List[str] = []
+    globs: List[str] = []
+    for term in text.split():
+        prefix, colon, values = term.partition(":")
+        if colon and prefix.lower() in ("lang", "language"):
+            languages.extend(value.lower() for value in values.split(",") if value)
+            continue
+        for value in term.split(","):
+            path = _normalize(value)
+            if not path:
+                continue
+            if any(char in path for char in _GLOB_CHARS):
+                _glob_regex(path)
+                globs.append(path)
+            else:
+                paths.append(path)
+    if not (paths or languages or globs):
+        return None
+    return Scope(tuple(paths), tuple(languages), tuple(globs))
@@ -0,0 +1,116 @@
+"""
+Request coalescing for expensive endpoints.
+
+Concurrent identical requests (same key) share one in-flight computation and
+all receive its result. Coalescing is per process; separate workers each run
+their own computation.
+"""
+
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+    TypeVar,
+)
+import asyncio
+import logging
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key.
+
+    The computation runs as its own task, so a caller that disconnects does
+    not cancel it for the others still waiting on it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def task(self, key: Hashable) -> Optional[asyncio.Task]:
+        """The in-flight task for `key`, if any."""
+        return self._calls.get(key)
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        """
+        Return the in-flight task for `key`, starting `fn()` if there is none.
+
+        The task is registered before this returns, so callers that do not
+        await it (fire-and-forget jobs) are still joined by later calls.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.started += 1
+        else:
+            self.shared += 1
+            logger.info(f"[{self.name}] joining in-flight call for {key!r}")
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await the in-flight computation for `key`, starting `fn()` if there is none.
+        """
+        return await asyncio.shield(self.start(key, fn))
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "shared": self.shared,
+        }
+
+
+class KeyedLocks:
+    """
+    One asyncio.Lock per key (e.g. per repository), created on demand and
+    dropped once nobody holds or waits for it.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._users: Dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        """Hold the lock of `key` for the duration of the block."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    def locked(self, key: Hashable) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock.locked()
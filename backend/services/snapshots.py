@@ -0,0 +1,451 @@
+"""
+Portable index snapshots.
+
+A snapshot holds everything needed to serve a repo without re-embedding it:
+chunk ids, documents, metadata and embeddings, plus the repo's index
+metadata (embedding provider and model, commit, index run). It is a
+directory with
+
+    manifest.json               format version, index metadata, part shapes
+    chunks.jsonl.gz             one {"id", "document", "metadata"} per line
+    chunks.embeddings.f32       float32 rows (little-endian), in the same order
+    files.jsonl.gz, files.embeddings.f32
+                                the file/directory summary index, if built
+
+Export and import stream in batches, so a repo never has to fit in memory.
+Copy the directory to move an index between environments or Chroma
+databases, e.g. with `python -m services.snapshots export myrepo /tmp/myrepo`
+and `python -m services.snapshots import /tmp/myrepo` on the other side.
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from config import get_migration_settings, get_storage_settings
+from services.chromadb_service import (
+    get_chroma_client,
+    get_repo_embedding_provider,
+    get_repo_registry,
+    upsert_documents,
+)
+from services.doc_store import delete_repo_docs
+from services.model_migration import next_collection_version
+from services.repo_registry import (
+    EMBEDDING_METADATA_KEYS,
+    SUMMARY_COLLECTION_KIND,
+    new_index_run,
+    summary_collection_name,
+    versioned_collection_name,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "slashdocs-index-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+CHUNKS_PART = "chunks"
+SUMMARIES_PART = SUMMARY_COLLECTION_KIND
+
+# Chunks per Chroma read or write
+BATCH_SIZE = 1000
+
+# Collection metadata carried over to the imported repo
+INDEX_METADATA_KEYS = ("index_run", "indexed_at", "commit_sha", "repo_url")
+
+
+class SnapshotError(ValueError):
+    """Raised for missing, incomplete or incompatible snapshots."""
+
+
+def snapshot_root() -> Path:
+    return get_storage_settings().data_dir / "snapshots"
+
+
+def snapshot_path(name: str) -> Path:
+    """
+    Resolve a snapshot name (as returned by export_snapshot) under the
+    snapshot root; names are single path components.
+    """
+    if not name or name.startswith(".") or Path(name).name != name:
+        raise SnapshotError(f"Invalid snapshot name: {name!r}")
+    return snapshot_root() / name
+
+
+def _iter_pages(collection, batch_size: int) -> Iterator[Dict]:
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=batch_size,
+            offset=offset,
+        )
+        if not page or not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def _export_part(collection, directory: Path, part: str, batch_size: int) -> Dict:
+    count = 0
+    dimensions = None
+    with gzip.open(
+        directory / f"{part}.jsonl.gz", "wt", encoding="utf-8"
+    ) as records, open(directory / f"{part}.embeddings.f32", "wb") as vectors:
+        for page in _iter_pages(collection, batch_size):
+            matrix = np.asarray(page["embeddings"], dtype=EMBEDDING_DTYPE)
+            if dimensions is None:
+                dimensions = matrix.shape[1]
+            elif matrix.shape[1] != dimensions:
+                raise SnapshotError(
+                    f"Mixed embedding dimensions in {collection.name}: "
+                    f"{dimensions} and {matrix.shape[1]}"
+                )
+            vectors.write(matrix.tobytes())
+            for chunk_id, document, metadata in zip(
+                page["ids"], page["documents"], page["metadatas"]
+            ):
+                record = {"id": chunk_id, "document": document, "metadata": metadata}
+                records.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += len(page["ids"])
+    return {"count": count, "dimensions": dimensions or 0}
+
+
+def export_snapshot(
+    repo_name: str,
+    directory: Optional[Path] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Write a repo's index to a snapshot directory.
+
+    Args:
+        repo_name: Repository to export
+        directory: Target directory, which must not exist
+            (default: `<data_dir>/snapshots/<repo>-<timestamp>`)
+        batch_size: Chunks read from Chroma per call
+
+    Returns:
+        The snapshot manifest, with its "name" and "path"
+
+    Raises:
+        SnapshotError: If the repo is not indexed or an ingest is still running
+    """
+    registry = get_repo_registry()
+    if not registry.exists(repo_name):
+        raise SnapshotError(f"Repository {repo_name} is not indexed")
+    metadata = registry.get_index_metadata(repo_name)
+    if metadata.get("index_status") == "partial":
+        raise SnapshotError(
+            f"Repository {repo_name} is still being indexed; export it once ready"
+        )
+
+    if directory is None:
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        directory = snapshot_root() / f"{repo_name}-{timestamp}"
+    directory = Path(directory)
+    directory.mkdir(parents=True)
+
+    try:
+        parts = {
+            CHUNKS_PART: _export_part(
+                registry.get_collection(repo_name), directory, CHUNKS_PART, batch_size
+            )
+        }
+        summaries = registry.get_summary_collection(repo_name)
+        if summaries is not None:
+            parts[SUMMARIES_PART] = _export_part(
+                summaries, directory, SUMMARIES_PART, batch_size
+            )
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "repo_name": repo_name,
+            "exported_at": datetime.utcnow().isoformat() + "Z",
+            # Resolves the provider of indexes built before it was recorded
+            "index": {
+                **{key: metadata.get(key) for key in INDEX_METADATA_KEYS},
+                **get_repo_embedding_provider(repo_name).describe(),
+            },
+            "parts": parts,
+        }
+        # The manifest is written last: a directory without one is incomplete
+        temporary = directory / f"{MANIFEST}.tmp"
+        temporary.write_text(json.dumps(manifest, indent=2))
+        os.replace(temporary, directory / MANIFEST)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    logger.info(
+        f"Exported {parts[CHUNKS_PART]['count']} chunks of {repo_name} to {directory}"
+    )
+    return {"name": directory.name, "path": str(directory), **manifest}
+
+
+def read_manifest(directory: Path) -> Dict:
+    path = Path(directory) / MANIFEST
+    if not path.is_file():
+        raise SnapshotError(f"No complete snapshot at {directory}")
+    manifest = json.loads(path.read_text())
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"{directory} is not an index snapshot")
+    if manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise SnapshotError(
+            f"Snapshot version {manifest['version']} is newer than supported "
+            f"({SNAPSHOT_VERSION})"
+        )
+    return manifest
+
+
+def list_snapshots() -> List[Dict]:
+    """
+    Complete snapshots under the snapshot root, newest first.
+    """
+    root = snapshot_root()
+    if not root.is_dir():
+        return []
+    snapshots = []
+    for directory in root.iterdir():
+        try:
+            manifest = read_manifest(directory)
+        except (SnapshotError, ValueError):
+            continue
+        snapshots.append({"name": directory.name, "path": str(directory), **manifest})
+    return sorted(snapshots, key=lambda s: s["exported_at"], reverse=True)
+
+
+def iter_snapshot_batches(
+    directory: Path, part: str, info: Dict, batch_size: int = BATCH_SIZE
+) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[Dict]]]:
+    """
+    Stream (ids, embeddings, documents, metadatas) batches of one part;
+    embeddings are read from a memory map.
+    """
+    count, dimensions = info["count"], info["dimensions"]
+    vectors_path = directory / f"{part}.embeddings.f32"
+    if vectors_path.stat().st_size != count * dimensions * EMBEDDING_DTYPE.itemsize:
+        raise SnapshotError(f"{vectors_path} does not hold {count} vectors")
+    if count == 0:
+        return
+    vectors = np.memmap(
+        vectors_path, dtype=EMBEDDING_DTYPE, mode="r", shape=(count, dimensions)
+    )
+
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict] = []
+    row = 0
+    with gzip.open(directory / f"{part}.jsonl.gz", "rt", encoding="utf-8") as records:
+        for line in records:
+            record = json.loads(line)
+            ids.append(record["id"])
+            documents.append(record["document"])
+            metadatas.append(record["metadata"])
+            if len(ids) == batch_size:
+                yield ids, vectors[row : row + len(ids)], documents, metadatas
+                row += len(ids)
+                ids, documents, metadatas = [], [], []
+    if ids:
+        yield ids, vectors[row : row + len(ids)], documents, metadatas
+        row += len(ids)
+    if row != count:
+        raise SnapshotError(f"{part} records hold {row} chunks, expected {count}")
+
+
+def _import_part(
+    collection,
+    directory: Path,
+    part: str,
+    info: Dict,
+    batch_size: int,
+    index_run: Optional[str] = None,
+):
+    for ids, vectors, documents, metadatas in iter_snapshot_batches(
+        directory, part, info, batch_size
+    ):
+        if index_run is not None:
+            metadatas = [
+                {**(metadata or {}), "index_run": index_run} for metadata in metadatas
+            ]
+        upsert_documents(
+            collection,
+            ids=ids,
+            embeddings=np.asarray(vectors).tolist(),
+            documents=documents,
+            metadatas=metadatas,
+        )
+
+
+def import_snapshot(
+    directory: Path,
+    repo_name: Optional[str] = None,
+    *,
+    replace: bool = False,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Bulk-load a snapshot into Chroma, keeping its embeddings and index
+    metadata, so the repo is served without calling the embedding provider.
+
+    With replace, the snapshot is loaded into a new versioned collection while
+    the existing index keeps serving; the repo switches to it only once the
+    import succeeded, and the previous collections are retired after
+    MIGRATION_RETAIN_SECONDS like after an embedding migration.
+
+    Args:
+        directory: Snapshot directory
+        repo_name: Target repository (default: the exported repo's name)
+        replace: Overwrite an existing index of the target repo
+        batch_size: Chunks written to Chroma per call
+
+    Returns:
+        The repo's index metadata after the import
+
+    Raises:
+        SnapshotError: If the snapshot is incomplete or the repo is already
+            indexed and replace is False
+    """
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    repo_name = repo_name or manifest["repo_name"]
+    index = manifest["index"]
+    parts = manifest["parts"]
+
+    registry = get_repo_registry()
+    exists = registry.exists(repo_name)
+    if exists and not replace:
+        raise SnapshotError(
+            f"Repository {repo_name} is already indexed; import with replace "
+            "to overwrite it"
+        )
+
+    record = {
+        "chunk_count": parts[CHUNKS_PART]["count"],
+        "embedding_provider": index.get("embedding_provider"),
+        "embedding_model": index["embedding_model"],
+        "embedding_dimensions": index.get("embedding_dimensions"),
+        "index_run": index.get("index_run") or new_index_run(),
+        "commit_sha": index.get("commit_sha"),
+        "repo_url": index.get("repo_url"),
+    }
+    # Chunks keep the run that wrote them, so compaction keeps working; those
+    # of a snapshot without a recorded run are stamped with the new one, or
+    # compaction would take them all for leftovers of an older run
+    stamp = None if index.get("index_run") else record["index_run"]
+
+    if exists:
+        metadata = _import_replacing(
+            repo_name, directory, parts, record, stamp, batch_size
+        )
+    else:
+        registry.record_index(
+            repo_name, **record, index_status="partial", searchable_fraction=0.0
+        )
+        _import_part(
+            registry.get_collection(repo_name),
+            directory,
+            CHUNKS_PART,
+            parts[CHUNKS_PART],
+            batch_size,
+            stamp,
+        )
+        if SUMMARIES_PART in parts:
+            _import_part(
+                registry.get_summary_collection(repo_name, create=True),
+                directory,
+                SUMMARIES_PART,
+                parts[SUMMARIES_PART],
+                batch_size,
+            )
+        metadata = registry.record_index(repo_name, **record)
+
+    logger.info(
+        f"Imported {record['chunk_count']} chunks into {repo_name} from {directory}"
+    )
+    return {"repo_name": repo_name, **metadata}
+
+
+def _import_replacing(
+    repo_name: str,
+    directory: Path,
+    parts: Dict,
+    record: Dict,
+    stamp: Optional[str],
+    batch_size: int,
+) -> Dict:
+    """
+    Import into the repo's next collection version, then switch its alias.
+    """
+    registry = get_repo_registry()
+    client = get_chroma_client()
+    version = next_collection_version(repo_name)
+    staging = client.create_collection(versioned_collection_name(repo_name, version))
+    staged = [staging.name]
+    try:
+        _import_part(
+            staging, directory, CHUNKS_PART, parts[CHUNKS_PART], batch_size, stamp
+        )
+        if SUMMARIES_PART in parts:
+            summaries = client.create_collection(summary_collection_name(staging.name))
+            staged.append(summaries.name)
+            _import_part(
+                summaries,
+                directory,
+                SUMMARIES_PART,
+                parts[SUMMARIES_PART],
+                batch_size,
+            )
+    except Exception:
+        for name in staged:
+            client.delete_collection(name)
+        raise
+
+    registry.set_active_collection(
+        repo_name,
+        staging.name,
+        version,
+        {key: record[key] for key in EMBEDDING_METADATA_KEYS},
+        retire_after=time.time() + get_migration_settings().retain_seconds,
+    )
+    metadata = registry.record_index(repo_name, **record)
+    # Stored docs and the quantized index describe the replaced index
+    delete_repo_docs(repo_name)
+    from services.quantized_index import delete_quantized_index
+
+    delete_quantized_index(repo_name)
+    return metadata
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a repo's index")
+    export_parser.add_argument("repo_name")
+    export_parser.add_argument("directory", type=Path, nargs="?")
+    import_parser = commands.add_parser("import", help="Load a snapshot")
+    import_parser.add_argument("directory", type=Path)
+    import_parser.add_argument("--repo-name")
+    import_parser.add_argument("--replace", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        result = export_snapshot(args.repo_name, args.directory)
+    else:
+        result = import_snapshot(args.directory, args.repo_name, replace=args.replace)
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Content-addressed cache of per-section summaries used by map-reduce file docs.
+
+Summaries are keyed by a hash of the section text and the model, so
+regenerating docs after a small edit only re-summarizes the sections whose
+text changed. Sections are cut at content boundaries rather than at fixed
+offsets (see file_sections), so an edit does not shift every later section.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import hashlib
+
+from services.chunking import CHUNK_OVERLAP
+from services.local_store import LocalStore, get_local_store
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_summaries (
+    summary_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+# Sections span whole top-level units (definitions, paragraphs, headings) and
+# end at a unit whose hash picks it as a cut point once SECTION_MIN_CHARS are
+# reached, so the cuts only depend on nearby text
+SECTION_MIN_CHARS = 2000
+SECTION_MAX_CHARS = 6000
+SECTION_CUT_MODULUS = 4
+
+
+def _store() -> LocalStore:
+    return get_local_store("summaries", _SCHEMA)
+
+
+def summary_key(document: str, model: str) -> str:
+    """
+    Return the cache key for a chunk's text summarized by `model`.
+    """
+    return hashlib.sha256(f"{model}\0{document}".encode("utf-8")).hexdigest()
+
+
+def get_cached_summaries(keys: Iterable[str]) -> Dict[str, str]:
+    """
+    Look up several summaries at once.
+
+    Returns:
+        Mapping of key -> summary for the keys that are cached
+    """
+    keys = list(dict.fromkeys(keys))
+    found: Dict[str, str] = {}
+    # Stay well below SQLite's bound-parameter limit
+    for i in range(0, len(keys), 500):
+        batch = keys[i : i + 500]
+        placeholders = ",".join("?" for _ in batch)
+        rows = _store().fetchall(
+            f"SELECT summary_key, summary FROM chunk_summaries WHERE summary_key IN ({placeholders})",
+            batch,
+        )
+        found.update({row["summary_key"]: row["summary"] for row in rows})
+    return found
+
+
+def get_cached_summary(key: str) -> Optional[str]:
+    return get_cached_summaries([key]).get(key)
+
+
+def store_summary(key: str, model: str, summary: str) -> None:
+    _store().execute(
+        "INSERT OR REPLACE INTO chunk_summaries (summary_key, model, summary, created_at) "
+        "VALUES (?, ?, ?, ?)",
+        (key, model, summary, datetime.utcnow().isoformat() + "Z"),
+    )
+
+
+def stitch_chunks(chunks: List[Dict]) -> str:
+    """
+    Rebuild a file's text from its chunks in chunk order, dropping the text
+    each chunk repeats from the end of the previous one (CHUNK_OVERLAP
+    characters, unless the chunks were cut with another overlap).
+    """
+    text = ""
+    for chunk in chunks:
+        document = chunk["document"]
+        if text and text.endswith(document[:CHUNK_OVERLAP]):
+            overlap = CHUNK_OVERLAP
+        else:
+            overlap = min(len(text), len(document))
+            while overlap and not text.endswith(document[:overlap]):
+                overlap -= 1
+        text += document[overlap:]
+    return text
+
+
+def _is_unit_start(line: str, previous: str) -> bool:
+    """A top-level line after a blank one, or a markdown heading."""
+    if not line.strip() or line[0] in " \t":
+        return False
+    return not previous.strip() or line.startswith("#")
+
+
+def _split_units(text: str) -> List[str]:
+    units: List[str] = []
+    current: List[str] = []
+    previous = ""
+    for line in text.splitlines(keepends=True):
+        if current and _is_unit_start(line, previous):
+            units.append("".join(current))
+            current = []
+        current.append(line)
+        previous = line
+    if current:
+        units.append("".join(current))
+    return units
+
+
+def _split_oversized(unit: str) -> List[str]:
+    """Cut a unit longer than SECTION_MAX_CHARS at line ends."""
+    pieces: List[str] = []
+    current = ""
+    for line in unit.splitlines(keepends=True):
+        if current and len(current) + len(line) > SECTION_MAX_CHARS:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _is_cut_point(unit: str) -> bool:
+    digest = hashlib.sha256(unit.encode("utf-8")).digest()
+    return digest[0] % SECTION_CUT_MODULUS == 0
+
+
+def file_sections(chunks: List[Dict]) -> List[str]:
+    """
+    Split a file, given as its chunks in order, into sections for the map step.
+
+    Sections are made of whole units and cut where the unit text says so, so
+    an edit only changes the sections up to the next cut point; the others,
+    and their cached summaries, stay the same.
+    """
+    sections: List[str] = []
+    current = ""
+    for unit in _split_units(stitch_chunks(chunks)):
+        for piece in (
+            _split_oversized(unit) if len(unit) > SECTION_MAX_CHARS else [unit]
+        ):
+            if current and len(current) + len(piece) > SECTION_MAX_CHARS:
+                sections.append(current)
+                current = ""
+            current += piece
+            if len(current) >= SECTION_MIN_CHARS and _is_cut_point(piece):
+                sections.append(current)
+                current = ""
+    if current:
+        sections.append(current)
+    return sections
@@ -0,0 +1,582 @@
+"""
+Durable task queue for distributed ingest.
+
+Tasks belong to a group (an ingest job) and are named uniquely within it
+("embed:3"), so re-enqueueing a task that already exists is a no-op and
+stages can be retried safely. Workers lease tasks: a lease that is not
+completed or extended within its visibility timeout lapses and the task is
+handed to another worker, until it has used up its attempts and is marked
+dead. Completing or failing a task requires the caller's lease token, so a
+worker that lost its lease cannot overwrite the new holder's outcome.
+
+Groups also hold blobs, the intermediate results passed between stages.
+
+Backends:
+    SQLiteTaskQueue  a SQLite file; safe across processes on one host (or an
+                     in-memory database for a single process)
+    RedisTaskQueue   a single Redis instance; shared across hosts
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import threading
+import time
+import uuid
+
+from config import get_ingest_queue_settings
+from services.local_store import LocalStore, get_local_store
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+class TaskQueueError(RuntimeError):
+    """Raised when the configured queue backend cannot be used."""
+
+
+@dataclass(frozen=True)
+class Task:
+    task_id: str
+    group: str
+    name: str
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    lease_token: str
+
+
+def task_id(group: str, name: str) -> str:
+    return f"{group}/{name}"
+
+
+class TaskQueue(ABC):
+    """
+    Interface shared by the queue backends. Times are wall-clock seconds
+    (time.time()), so workers on different hosts agree on them.
+    """
+
+    @abstractmethod
+    def enqueue(
+        self,
+        group: str,
+        name: str,
+        kind: str,
+        payload: Dict[str, Any],
+        *,
+        max_attempts: int,
+        delay: float = 0.0,
+    ) -> bool:
+        """Add a task; returns False if the group already has a task of that name."""
+
+    @abstractmethod
+    def lease(self, kinds: Sequence[str], visibility_seconds: float) -> Optional[Task]:
+        """Lease the oldest available task of the first kind in `kinds` that has one."""
+
+    @abstractmethod
+    def extend(self, task: Task, visibility_seconds: float) -> bool:
+        """Renew a lease; False if it was lost to another worker."""
+
+    @abstractmethod
+    def complete(self, task: Task) -> bool:
+        """Mark a leased task done; False if the lease was lost."""
+
+    @abstractmethod
+    def fail(self, task: Task, error: str, retry_delay: Optional[float]) -> str:
+        """
+        Record a failed attempt. The task is retried after `retry_delay`
+        seconds while it has attempts left (None never retries).
+
+        Returns:
+            The task's new status, or "" if the lease was lost
+        """
+
+    @abstractmethod
+    def group_tasks(self, group: str) -> List[Dict[str, Any]]:
+        """name, kind, status, attempts and error of every task in a group."""
+
+    @abstractmethod
+    def put_blob(self, group: str, name: str, data: bytes) -> None:
+        """Store a blob of the group, replacing any stored under `name`."""
+
+    @abstractmethod
+    def get_blob(self, group: str, name: str) -> Optional[bytes]:
+        """A blob of the group, or None if it was not stored."""
+
+    @abstractmethod
+    def delete_group(self, group: str) -> None:
+        """Drop a group's tasks and blobs."""
+
+    @abstractmethod
+    def stats(self, kinds: Sequence[str]) -> Dict[str, Dict[str, int]]:
+        """Queued and leased task counts per kind."""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_tasks (
+    task_id TEXT PRIMARY KEY,
+    group_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload_json TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_token TEXT,
+    lease_expires_at REAL,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ingest_tasks_available
+    ON ingest_tasks (kind, status, available_at);
+CREATE INDEX IF NOT EXISTS ingest_tasks_group ON ingest_tasks (group_id);
+CREATE TABLE IF NOT EXISTS ingest_blobs (
+    group_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (group_id, name)
+);
+"""
+
+# Candidates looked at per kind in one lease attempt; others may take some first
+_LEASE_CANDIDATES = 8
+# Matches a task only if nobody changed its state since it was read
+_UNCHANGED = "WHERE task_id = ? AND status = ? AND IFNULL(lease_token, '') = ?"
+
+
+class SQLiteTaskQueue(TaskQueue):
+    """
+    Queue in a SQLite database. Every state change is a conditional UPDATE
+    on the state that was read, so concurrent processes cannot both lease
+    the same task.
+    """
+
+    def __init__(self, store: LocalStore):
+        self.store = store
+
+    def enqueue(
+        self,
+        group: str,
+        name: str,
+        kind: str,
+        payload: Dict[str, Any],
+        *,
+        max_attempts: int,
+        delay: float = 0.0,
+    ) -> bool:
+        now = time.time()
+        return (
+            self.store.execute(
+                "INSERT OR IGNORE INTO ingest_tasks (task_id, group_id, name, kind, "
+                "payload_json, status, max_attempts, available_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    task_id(group, name),
+                    group,
+                    name,
+                    kind,
+                    json.dumps(payload),
+                    QUEUED,
+                    max_attempts,
+                    now + delay,
+                    now,
+                ),
+            )
+            == 1
+        )
+
+    def lease(self, kinds: Sequence[str], visibility_seconds: float) -> Optional[Task]:
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self.store.transaction() as conn:
+            for kind in kinds:
+                candidates = conn.execute(
+                    "SELECT * FROM ingest_tasks WHERE kind = ? AND ("
+                    "(status = ? AND available_at <= ?) OR "
+                    "(status = ? AND lease_expires_at <= ?)) "
+                    "ORDER BY available_at LIMIT ?",
+                    (kind, QUEUED, now, LEASED, now, _LEASE_CANDIDATES),
+                ).fetchall()
+                for row in candidates:
+                    seen = (row["task_id"], row["status"], row["lease_token"] or "")
+                    if (
+                        row["status"] == LEASED
+                        and row["attempts"] >= row["max_attempts"]
+                    ):
+                        conn.execute(
+                            "UPDATE ingest_tasks SET status = ?, lease_token = NULL, "
+                            f"error = ?, updated_at = ? {_UNCHANGED}",
+                            (DEAD, "lease expired", now, *seen),
+                        )
+                        continue
+                    leased = conn.execute(
+                        "UPDATE ingest_tasks SET status = ?, lease_token = ?, "
+                        "lease_expires_at = ?, attempts = attempts + 1, "
+                        f"updated_at = ? {_UNCHANGED}",
+                        (LEASED, token, now + visibility_seconds, now, *seen),
+                    ).rowcount
+                    if leased == 1:
+                        return Task(
+                            task_id=row["task_id"],
+                            group=row["group_id"],
+                            name=row["name"],
+                            kind=row["kind"],
+                            payload=json.loads(row["payload_json"]),
+                            attempts=row["attempts"] + 1,
+                            max_attempts=row["max_attempts"],
+                            lease_token=token,
+                        )
+        return None
+
+    def extend(self, task: Task, visibility_seconds: float) -> bool:
+        now = time.time()
+        return (
+            self.store.execute(
+                "UPDATE ingest_tasks SET lease_expires_at = ?, updated_at = ? "
+                "WHERE task_id = ? AND status = ? AND lease_token = ?",
+                (now + visibility_seconds, now, task.task_id, LEASED, task.lease_token),
+            )
+            == 1
+        )
+
+    def complete(self, task: Task) -> bool:
+        """Mark a leased task done; False if the lease was lost."""
+        return (
+            self.store.execute(
+                "UPDATE ingest_tasks SET status = ?, lease_token = NULL, updated_at = ? "
+                "WHERE task_id = ? AND status = ? AND lease_token = ?",
+                (DONE, time.time(), task.task_id, LEASED, task.lease_token),
+            )
+            == 1
+        )
+
+    def fail(self, task: Task, error: str, retry_delay: Optional[float]) -> str:
+        now = time.time()
+        retry = retry_delay is not None and task.attempts < task.max_attempts
+        status = QUEUED if retry else DEAD
+        updated = self.store.execute(
+            "UPDATE ingest_tasks SET status = ?, lease_token = NULL, error = ?, "
+            "available_at = ?, updated_at = ? "
+            "WHERE task_id = ? AND status = ? AND lease_token = ?",
+            (
+                status,
+                error,
+                now + (retry_delay or 0.0),
+                now,
+                task.task_id,
+                LEASED,
+                task.lease_token,
+            ),
+        )
+        return status if updated == 1 else ""
+
+    def group_tasks(self, group: str) -> List[Dict[str, Any]]:
+        return self.store.fetchall(
+            "SELECT name, kind, status, attempts, error FROM ingest_tasks "
+            "WHERE group_id = ?",
+            (group,),
+        )
+
+    def put_blob(self, group: str, name: str, data: bytes) -> None:
+        self.store.execute(
+            "INSERT OR REPLACE INTO ingest_blobs (group_id, name, data) VALUES (?, ?, ?)",
+            (group, name, data),
+        )
+
+    def get_blob(self, group: str, name: str) -> Optional[bytes]:
+        row = self.store.fetchone(
+            "SELECT data FROM ingest_blobs WHERE group_id = ? AND name = ?",
+            (group, name),
+        )
+        return row["data"] if row is not None else None
+
+    def delete_group(self, group: str) -> None:
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM ingest_tasks WHERE group_id = ?", (group,))
+            conn.execute("DELETE FROM ingest_blobs WHERE group_id = ?", (group,))
+
+    def stats(self, kinds: Sequence[str]) -> Dict[str, Dict[str, int]]:
+        counts = {kind: {QUEUED: 0, LEASED: 0} for kind in kinds}
+        rows = self.store.fetchall(
+            "SELECT kind, status, COUNT(*) AS tasks FROM ingest_tasks "
+            "WHERE status IN (?, ?) GROUP BY kind, status",
+            (QUEUED, LEASED),
+        )
+        for row in rows:
+            if row["kind"] in counts:
+                counts[row["kind"]][row["status"]] = row["tasks"]
+        return counts
+
+
+# --- Redis ---
+
+_REDIS_ENQUEUE = """
+local prefix, id = ARGV[1], ARGV[2]
+local key = prefix .. 'task:' .. id
+if redis.call('EXISTS', key) == 1 then return 0 end
+redis.call('HSET', key, 'group', ARGV[3], 'name', ARGV[4], 'kind', ARGV[5],
+    'payload', ARGV[6], 'status', 'queued', 'attempts', 0,
+    'max_attempts', ARGV[7], 'lease_token', '', 'error', '')
+redis.call('ZADD', prefix .. 'ready:' .. ARGV[5], ARGV[8], id)
+redis.call('SADD', prefix .. 'group:' .. ARGV[3], id)
+return 1
+"""
+
+_REDIS_LEASE = """
+local prefix, now, visibility, token = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4]
+for i = 5, #ARGV do
+    local ready = prefix .. 'ready:' .. ARGV[i]
+    local leased = prefix .. 'leased:' .. ARGV[i]
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', leased, '-inf', now)) do
+        local key = prefix .. 'task:' .. id
+        redis.call('ZREM', leased, id)
+        if tonumber(redis.call('HGET', key, 'attempts'))
+                >= tonumber(redis.call('HGET', key, 'max_attempts')) then
+            redis.call('HSET', key, 'status', 'dead', 'lease_token', '',
+                'error', 'lease expired')
+        else
+            redis.call('HSET', key, 'status', 'queued', 'lease_token', '')
+            redis.call('ZADD', ready, now, id)
+        end
+    end
+    local ids = redis.call('ZRANGEBYSCORE', ready, '-inf', now, 'LIMIT', 0, 1)
+    if #ids > 0 then
+        local key = prefix .. 'task:' .. ids[1]
+        redis.call('ZREM', ready, ids[1])
+        redis.call('ZADD', leased, now + visibility, ids[1])
+        redis.call('HINCRBY', key, 'attempts', 1)
+        redis.call('HSET', key, 'status', 'leased', 'lease_token', token)
+        return ids[1]
+    end
+end
+return false
+"""
+
+_REDIS_EXTEND = """
+local prefix, id, token = ARGV[1], ARGV[2], ARGV[3]
+local key = prefix .. 'task:' .. id
+if redis.call('HGET', key, 'lease_token') ~= token or token == '' then return 0 end
+redis.call('ZADD', prefix .. 'leased:' .. redis.call('HGET', key, 'kind'), ARGV[4], id)
+return 1
+"""
+
+_REDIS_FINISH = """
+local prefix, id, token, status = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local key = prefix .. 'task:' .. id
+if redis.call('HGET', key, 'lease_token') ~= token or token == '' then return 0 end
+local kind = redis.call('HGET', key, 'kind')
+redis.call('ZREM', prefix .. 'leased:' .. kind, id)
+redis.call('HSET', key, 'status', status, 'lease_token', '', 'error', ARGV[5])
+if status == 'queued' then
+    redis.call('ZADD', prefix .. 'ready:' .. kind, ARGV[6], id)
+end
+return 1
+"""
+
+
+class RedisTaskQueue(TaskQueue):
+    """
+    Queue in Redis: a hash per task, per-kind sorted sets of ready tasks (by
+    availability time) and leased tasks (by lease expiry), a set of task ids
+    per group and a hash of blobs per group. State changes are Lua scripts,
+    so each is atomic. Keys are built inside the scripts, which needs a
+    single Redis instance rather than a cluster.
+    """
+
+    def __init__(self, client, prefix: str = "slashdocs:ingest:"):
+        self.client = client
+        self.prefix = prefix
+        self._enqueue = client.register_script(_REDIS_ENQUEUE)
+        self._lease = client.register_script(_REDIS_LEASE)
+        self._extend = client.register_script(_REDIS_EXTEND)
+        self._finish = client.register_script(_REDIS_FINISH)
+
+    def enqueue(
+        self,
+        group: str,
+        name: str,
+        kind: str,
+        payload: Dict[str, Any],
+        *,
+        max_attempts: int,
+        delay: float = 0.0,
+    ) -> bool:
+        return bool(
+            self._enqueue(
+                args=[
+                    self.prefix,
+                    task_id(group, name),
+                    group,
+                    name,
+                    kind,
+                    json.dumps(payload),
+                    max_attempts,
+                    time.time() + delay,
+                ]
+            )
+        )
+
+    def lease(self, kinds: Sequence[str], visibility_seconds: float) -> Optional[Task]:
+        token = uuid.uuid4().hex
+        leased = self._lease(
+            args=[self.prefix, time.time(), visibility_seconds, token, *kinds]
+        )
+        if not leased:
+            return None
+        leased = leased.decode() if isinstance(leased, bytes) else leased
+        fields = {
+            key.decode(): value.decode()
+            for key, value in self.client.hgetall(f"{self.prefix}task:{leased}").items()
+        }
+        return Task(
+            task_id=leased,
+            group=fields["group"],
+            name=fields["name"],
+            kind=fields["kind"],
+            payload=json.loads(fields["payload"]),
+            attempts=int(fields["attempts"]),
+            max_attempts=int(fields["max_attempts"]),
+            lease_token=token,
+        )
+
+    def extend(self, task: Task, visibility_seconds: float) -> bool:
+        return bool(
+            self._extend(
+                args=[
+                    self.prefix,
+                    task.task_id,
+                    task.lease_token,
+                    time.time() + visibility_seconds,
+                ]
+            )
+        )
+
+    def complete(self, task: Task) -> bool:
+        """Mark a leased task done; False if the lease was lost."""
+        return bool(
+            self._finish(
+                args=[self.prefix, task.task_id, task.lease_token, DONE, "", 0]
+            )
+        )
+
+    def fail(self, task: Task, error: str, retry_delay: Optional[float]) -> str:
+        retry = retry_delay is not None and task.attempts < task.max_attempts
+        status = QUEUED if retry else DEAD
+        finished = self._finish(
+            args=[
+                self.prefix,
+                task.task_id,
+                task.lease_token,
+                status,
+                error,
+                time.time() + (retry_delay or 0.0),
+            ]
+        )
+        return status if finished else ""
+
+    def group_tasks(self, group: str) -> List[Dict[str, Any]]:
+        ids = self.client.smembers(f"{self.prefix}group:{group}")
+        pipeline = self.client.pipeline(transaction=False)
+        for member in ids:
+            pipeline.hmget(
+                f"{self.prefix}task:{member.decode()}",
+                "name",
+                "kind",
+                "status",
+                "attempts",
+                "error",
+            )
+        tasks = []
+        for name, kind, status, attempts, error in pipeline.execute():
+            if name is None:
+                continue
+            tasks.append(
+                {
+                    "name": name.decode(),
+                    "kind": kind.decode(),
+                    "status": status.decode(),
+                    "attempts": int(attempts),
+                    "error": error.decode() or None,
+                }
+            )
+        return tasks
+
+    def put_blob(self, group: str, name: str, data: bytes) -> None:
+        self.client.hset(f"{self.prefix}blobs:{group}", name, data)
+
+    def get_blob(self, group: str, name: str) -> Optional[bytes]:
+        return self.client.hget(f"{self.prefix}blobs:{group}", name)
+
+    def delete_group(self, group: str) -> None:
+        ids = [
+            member.decode()
+            for member in self.client.smembers(f"{self.prefix}group:{group}")
+        ]
+        lookup = self.client.pipeline(transaction=False)
+        for member in ids:
+            lookup.hget(f"{self.prefix}task:{member}", "kind")
+        kinds = lookup.execute() if ids else []
+        pipeline = self.client.pipeline()
+        for member, kind in zip(ids, kinds):
+            if kind is not None:
+                pipeline.zrem(f"{self.prefix}ready:{kind.decode()}", member)
+                pipeline.zrem(f"{self.prefix}leased:{kind.decode()}", member)
+            pipeline.delete(f"{self.prefix}task:{member}")
+        pipeline.delete(f"{self.prefix}group:{group}", f"{self.prefix}blobs:{group}")
+        pipeline.execute()
+
+    def stats(self, kinds: Sequence[str]) -> Dict[str, Dict[str, int]]:
+        pipeline = self.client.pipeline(transaction=False)
+        for kind in kinds:
+            pipeline.zcard(f"{self.prefix}ready:{kind}")
+            pipeline.zcard(f"{self.prefix}leased:{kind}")
+        counts = pipeline.execute()
+        return {
+            kind: {QUEUED: counts[2 * i], LEASED: counts[2 * i + 1]}
+            for i, kind in enumerate(kinds)
+        }
+
+
+_queue: Optional[TaskQueue] = None
+_queue_lock = threading.Lock()
+
+
+def memory_task_queue() -> SQLiteTaskQueue:
+    """A new queue in an in-memory database, private to the process."""
+    return SQLiteTaskQueue(LocalStore(Path(":memory:"), _SCHEMA))
+
+
+def get_task_queue() -> TaskQueue:
+    """
+    Return the process-wide queue of the configured backend (INGEST_QUEUE).
+
+    Raises:
+        TaskQueueError: If the backend is unknown or its client is missing
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            settings = get_ingest_queue_settings()
+            if settings.backend == "sqlite":
+                _queue = SQLiteTaskQueue(get_local_store("ingest_queue", _SCHEMA))
+            elif settings.backend == "memory":
+                _queue = memory_task_queue()
+            elif settings.backend == "redis":
+                try:
+                    import redis
+                except ImportError as e:
+                    raise TaskQueueError(
+                        "INGEST_QUEUE=redis needs the redis package (pip install redis)"
+                    ) from e
+                _queue = RedisTaskQueue(redis.Redis.from_url(settings.redis_url))
+            else:
+                raise TaskQueueError(
+                    f"INGEST_QUEUE must be sqlite, redis or memory, not {settings.backend!r}"
+                )
+        return _queue
@@ -0,0 +1,80 @@
+"""
+Optional startup warm-up for hot repositories.
+
+Imports the heavy client libraries, constructs the Chroma and OpenAI clients,
+and preloads the collection handles and path indexes (file manifests) of the
+configured repos, so the first requests after a cold start skip that work.
+"""
+
+from typing import Dict, List, Sequence
+import logging
+import time
+
+from services.chromadb_service import (
+    get_chroma_client,
+    get_repo_collection,
+    get_repo_registry,
+)
+from services.embeddings import get_openai_client
+from services.file_tree import get_path_index
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(repo_names: Sequence[str]) -> Dict:
+    """
+    Preload clients and per-repo state.
+
+    Args:
+        repo_names: Repositories to preload; ["*"] preloads every indexed repo
+
+    Returns:
+        Report with the repos warmed, those skipped as not indexed, failures
+        and elapsed time
+    """
+    started = time.monotonic()
+    failed: Dict[str, str] = {}
+
+    for name, factory in (("chroma", get_chroma_client), ("openai", get_openai_client)):
+        try:
+            factory()
+        except Exception as e:
+            logger.warning(
+                f"Warm-up could not create {name} client: {type(e).__name__}: {e}"
+            )
+            failed[name] = str(e)
+
+    repos: List[str] = list(repo_names)
+    if repos == ["*"]:
+        try:
+            repos = [repo["repo_name"] for repo in get_repo_registry().list_repos()]
+        except Exception as e:
+            logger.warning(f"Warm-up could not list repos: {type(e).__name__}: {e}")
+            failed["*"] = str(e)
+            repos = []
+
+    warmed = []
+    skipped = []
+    registry = get_repo_registry()
+    for repo_name in repos:
+        try:
+            # get_repo_collection would create an empty collection for it
+            if not registry.exists(repo_name):
+                logger.warning(f"Warm-up skipped {repo_name}: repo is not indexed")
+                skipped.append(repo_name)
+                continue
+            get_repo_collection(repo_name)
+            get_path_index(repo_name)
+            warmed.append(repo_name)
+        except Exception as e:
+            logger.warning(f"Warm-up failed for {repo_name}: {type(e).__name__}: {e}")
+            failed[repo_name] = str(e)
+
+    report = {
+        "warmed": warmed,
+        "skipped": skipped,
+        "failed": failed,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+    }
+    logger.info(f"Warm-up finished: {report}")
+    return report
@@ -0,0 +1,114 @@
+"""
+GitHub push webhooks: signature verification and payload parsing.
+
+Only pushes to a repository's default branch matter; everything else (other
+branches, tags, branch deletions) leaves the index alone. To try the
+endpoint locally, sign and send a fixture payload:
+
+    python -m services.webhooks fixtures/github_push.json \
+        --url http://localhost:8000/api/webhooks/github
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import urllib.request
+
+SIGNATURE_HEADER = "X-Hub-Signature-256"
+EVENT_HEADER = "X-GitHub-Event"
+DELIVERY_HEADER = "X-GitHub-Delivery"
+
+_NULL_SHA = "0" * 40
+
+
+class WebhookError(ValueError):
+    """Raised for unsigned, badly signed or malformed deliveries."""
+
+
+@dataclass(frozen=True)
+class PushEvent:
+    repo_name: str
+    repo_url: str
+    commit_sha: str
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """Value of the X-Hub-Signature-256 header GitHub sends for `body`."""
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: str) -> None:
+    """
+    Raises:
+        WebhookError: If the signature is missing or does not match
+    """
+    if not signature:
+        raise WebhookError(f"Missing {SIGNATURE_HEADER} header")
+    if not hmac.compare_digest(sign_payload(body, secret), signature):
+        raise WebhookError("Signature does not match the payload")
+
+
+def parse_push(payload: Dict[str, Any]) -> Optional[PushEvent]:
+    """
+    Extract the re-index request from a push payload.
+
+    Returns:
+        None for pushes that do not change the default branch's content
+
+    Raises:
+        WebhookError: If the payload is not a push payload
+    """
+    try:
+        repository = payload["repository"]
+        ref = payload["ref"]
+        after = payload["after"]
+        repo_url = repository["clone_url"]
+    except (KeyError, TypeError) as e:
+        raise WebhookError(f"Not a push payload: missing {e}")
+
+    default_branch = repository.get("default_branch") or "main"
+    if (
+        ref != f"refs/heads/{default_branch}"
+        or payload.get("deleted")
+        or after == _NULL_SHA
+    ):
+        return None
+    return PushEvent(
+        # Same naming as /api/ingest, so pushes land on the existing index
+        repo_name=repo_url.split("/")[-1].replace(".git", ""),
+        repo_url=repo_url,
+        commit_sha=after,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Send a signed push fixture")
+    parser.add_argument("payload", help="Push payload JSON file")
+    parser.add_argument("--url", default="http://localhost:8000/api/webhooks/github")
+    parser.add_argument("--secret", default=os.getenv("GITHUB_WEBHOOK_SECRET"))
+    args = parser.parse_args()
+    if not args.secret:
+        parser.error("--secret or GITHUB_WEBHOOK_SECRET is required")
+
+    with open(args.payload, "rb") as f:
+        body = f.read()
+    request = urllib.request.Request(
+        args.url,
+        data=body,
+        headers={
+            "Content-Type": "application/json",
+            EVENT_HEADER: "push",
+            SIGNATURE_HEADER: sign_payload(body, args.secret),
+        },
+    )
+    with urllib.request.urlopen(request) as response:
+        print(response.status, json.dumps(json.load(response), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+from pathlib import Path
+import sys
+
+# Tests import the backend's top-level modules (config, services) like main.py does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,137 @@
+"""
+Lease, renewal, failure and retry behaviour of the ingest task queue, run
+against the in-memory backend (INGEST_QUEUE=memory).
+"""
+
+import time
+
+import pytest
+
+from services.task_queue import DEAD, DONE, LEASED, QUEUED, memory_task_queue
+
+LEASE = 30.0
+
+
+@pytest.fixture
+def queue():
+    return memory_task_queue()
+
+
+def _status(queue, group, name):
+    return next(
+        entry["status"] for entry in queue.group_tasks(group) if entry["name"] == name
+    )
+
+
+def test_enqueue_ignores_duplicate_names(queue):
+    assert queue.enqueue("job", "embed:0", "embed", {"batch": 0}, max_attempts=3)
+    assert not queue.enqueue("job", "embed:0", "embed", {"batch": 1}, max_attempts=3)
+
+    task = queue.lease(["embed"], LEASE)
+    assert task.payload == {"batch": 0}
+    assert queue.lease(["embed"], LEASE) is None
+
+
+def test_lease_prefers_earlier_kinds(queue):
+    queue.enqueue("job", "clone", "clone", {}, max_attempts=3)
+    queue.enqueue("job", "upsert:0", "upsert", {}, max_attempts=3)
+
+    assert queue.lease(["upsert", "clone"], LEASE).kind == "upsert"
+    assert queue.lease(["upsert", "clone"], LEASE).kind == "clone"
+
+
+def test_complete_needs_the_current_lease(queue):
+    queue.enqueue("job", "chunk", "chunk", {}, max_attempts=3)
+    task = queue.lease(["chunk"], LEASE)
+
+    assert _status(queue, "job", "chunk") == LEASED
+    assert queue.complete(task)
+    assert _status(queue, "job", "chunk") == DONE
+    assert not queue.complete(task)
+    assert queue.lease(["chunk"], LEASE) is None
+
+
+def test_expired_lease_is_handed_to_another_worker(queue):
+    queue.enqueue("job", "embed:0", "embed", {}, max_attempts=3)
+    first = queue.lease(["embed"], 0.05)
+    time.sleep(0.1)
+
+    second = queue.lease(["embed"], LEASE)
+    assert second is not None
+    assert second.attempts == 2
+    assert second.lease_token != first.lease_token
+    # The first worker lost the task: it can neither renew nor finish it
+    assert not queue.extend(first, LEASE)
+    assert not queue.complete(first)
+    assert queue.fail(first, "late", retry_delay=0.0) == ""
+    assert queue.complete(second)
+
+
+def test_extend_keeps_the_lease(queue):
+    queue.enqueue("job", "embed:0", "embed", {}, max_attempts=3)
+    task = queue.lease(["embed"], 0.1)
+    time.sleep(0.05)
+    assert queue.extend(task, LEASE)
+    time.sleep(0.1)
+
+    assert queue.lease(["embed"], LEASE) is None
+    assert queue.complete(task)
+
+
+def test_failed_task_is_retried_after_its_delay(queue):
+    queue.enqueue("job", "embed:0", "embed", {}, max_attempts=3)
+    task = queue.lease(["embed"], LEASE)
+
+    assert queue.fail(task, "RateLimitError: slow down", retry_delay=0.1) == QUEUED
+    assert queue.lease(["embed"], LEASE) is None
+    time.sleep(0.15)
+
+    retry = queue.lease(["embed"], LEASE)
+    assert retry.attempts == 2
+    entry = queue.group_tasks("job")[0]
+    assert entry["error"] == "RateLimitError: slow down"
+
+
+def test_permanent_failure_is_not_retried(queue):
+    queue.enqueue("job", "chunk", "chunk", {}, max_attempts=3)
+    task = queue.lease(["chunk"], LEASE)
+
+    assert (
+        queue.fail(task, "EmbeddingProviderError: mismatch", retry_delay=None) == DEAD
+    )
+    assert queue.lease(["chunk"], LEASE) is None
+
+
+def test_task_dies_after_its_last_attempt(queue):
+    queue.enqueue("job", "clone", "clone", {}, max_attempts=2)
+    for _ in range(2):
+        task = queue.lease(["clone"], LEASE)
+        status = queue.fail(task, "GitCommandError", retry_delay=0.0)
+
+    assert status == DEAD
+    assert queue.lease(["clone"], LEASE) is None
+
+
+def test_lease_expiring_on_the_last_attempt_kills_the_task(queue):
+    queue.enqueue("job", "clone", "clone", {}, max_attempts=1)
+    queue.lease(["clone"], 0.05)
+    time.sleep(0.1)
+
+    assert queue.lease(["clone"], LEASE) is None
+    assert _status(queue, "job", "clone") == DEAD
+
+
+def test_blobs_stats_and_group_deletion(queue):
+    queue.enqueue("job", "embed:0", "embed", {}, max_attempts=3)
+    queue.enqueue("job", "embed:1", "embed", {}, max_attempts=3)
+    queue.lease(["embed"], LEASE)
+    queue.put_blob("job", "manifest", b"v1")
+    queue.put_blob("job", "manifest", b"v2")
+
+    assert queue.get_blob("job", "manifest") == b"v2"
+    assert queue.get_blob("job", "missing") is None
+    assert queue.stats(["embed"])["embed"] == {"queued": 1, "leased": 1}
+
+    queue.delete_group("job")
+    assert queue.group_tasks("job") == []
+    assert queue.get_blob("job", "manifest") is None
@@ -0,0 +1,113 @@
+"""
+Request profiling middleware.
+
+Profiles a request on demand (admin token plus `X-Profile: 1` or
+`?profile=1`; the response carries `X-Profile-Id`) and, when a slow-request
+threshold is set, every request that takes longer than it. Profiles are
+stored by services.profiling and served from /api/admin/profiles.
+"""
+
+from typing import Optional
+from urllib.parse import parse_qs
+import hmac
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.profiling import get_profile_store, get_stack_sampler
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Fetching profiles is not worth profiling
+EXCLUDED_PREFIX = "/api/admin/"
+
+_TRUE = ("1", "true", "yes")
+
+
+def is_admin(token: Optional[str], admin_token: Optional[str]) -> bool:
+    return bool(admin_token and token) and hmac.compare_digest(token, admin_token)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware recording sampled profiles of selected requests.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        admin_token: Optional[str] = None,
+        slow_request_seconds: float = 0.0,
+    ):
+        self.app = app
+        self.admin_token = admin_token
+        self.slow_request_seconds = slow_request_seconds
+        self._sampling_continuously = False
+
+    def _requested(self, scope: Scope) -> bool:
+        headers = Headers(scope=scope)
+        flag = headers.get(PROFILE_HEADER, "").lower() in _TRUE or any(
+            value.lower() in _TRUE
+            for value in parse_qs(scope.get("query_string", b"").decode()).get(
+                "profile", []
+            )
+        )
+        return flag and is_admin(headers.get(ADMIN_TOKEN_HEADER), self.admin_token)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        requested = self._requested(scope)
+        if not requested and self.slow_request_seconds <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        sampler = get_stack_sampler()
+        if not self._sampling_continuously and self.slow_request_seconds > 0:
+            # Slow requests are only known afterwards, so always keep samples
+            sampler.acquire()
+            self._sampling_continuously = True
+        if requested:
+            sampler.acquire()
+
+        store = get_profile_store()
+        profile_id = store.new_id()
+        status: Optional[int] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if requested:
+                    MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile_id
+            await send(message)
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.monotonic()
+            if requested:
+                sampler.release()
+            duration = finished - started
+            slow = 0 < self.slow_request_seconds <= duration
+            if requested or slow:
+                await run_in_threadpool(
+                    store.save,
+                    profile_id,
+                    sampler.samples_between(started, finished),
+                    {
+                        "reason": "requested" if requested else "slow",
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "query": scope.get("query_string", b"").decode(),
+                        "status": status,
+                        "duration_seconds": round(duration, 4),
+                        "sample_interval_seconds": sampler.interval_seconds,
+                    },
+                )